@@ -1,4 +1,6 @@
 from config_manager import ConfigManager
+from stepper_backend import AxisPins, EndstopMonitor, create_backend, DEFAULT_STEP_RATE
+from motion_engine import LinearMove
 import logging
 import time
 import threading
@@ -10,6 +12,10 @@ class ArduinoManager:
     _instance = None
     _board = None
     _current_power = 0
+    _backend = None
+    _endstops = None
+    _position = None
+    HOME_TIMEOUT = 60  # Segundos buscando el final de carrera antes de rendirse
     
     def __new__(cls):
         if cls._instance is None:
@@ -22,6 +28,9 @@ class ArduinoManager:
             logger.debug("Inicializando ArduinoManager")
             self._board = None
             self._current_power = 0
+            self._backend = None  # Generación de pasos (placa o PC)
+            self._endstops = None  # Finales de carrera avisados por la placa
+            self._position = {'x': None, 'y': None}  # Pasos desde home (None: sin home)
             self._initialized = True
     
     @property
@@ -32,6 +41,9 @@ class ArduinoManager:
     def board(self, value):
         logger.debug(f"Estableciendo nueva conexión Arduino: {value is not None}")
         self._board = value
+        self._backend = None
+        self._endstops = None
+        self._position = {'x': None, 'y': None}  # Placa nueva: hay que volver a hacer home
         if value:
             try:
                 # Configurar pin PWM para el láser
@@ -55,6 +67,19 @@ class ArduinoManager:
         logger.debug(f"Estado de conexión: {connected}")
         return connected
     
+    def position(self):
+        """Posición en pasos (x, y) desde el home, o None si algún eje no la conoce"""
+        if None in self._position.values():
+            return None
+        return (self._position['x'], self._position['y'])
+    
+    def _moved(self, dx, dy, completed):
+        """Sumar un movimiento a la posición; si se interrumpió, la posición se pierde"""
+        for axis, steps in (('x', dx), ('y', dy)):
+            if not steps or self._position[axis] is None:
+                continue
+            self._position[axis] = self._position[axis] + steps if completed else None
+    
     def set_laser_power(self, power):
         """Método específico para controlar el láser"""
         if not self.is_connected():
@@ -101,15 +126,21 @@ class ArduinoManager:
             self._board.set_pin_mode_digital_output(y_step)
             self._board.set_pin_mode_digital_output(y_dir)
             
-            # Configurar pines de endstop con pullup interno
-            self._board.set_pin_mode_digital_input_pullup(x_home)
-            self._board.set_pin_mode_digital_input_pullup(y_home)
+            # Configurar pines de endstop con pullup interno: la placa avisa
+            # de cada cambio y los bucles de pasos solo miran un flag
+            self._endstops = EndstopMonitor({axis: AxisPins.from_config(config, axis)
+                                             for axis in ('x', 'y')})
+            self._board.set_pin_mode_digital_input_pullup(x_home, callback=self._endstops.callback)
+            self._board.set_pin_mode_digital_input_pullup(y_home, callback=self._endstops.callback)
             
             # Verificar estado inicial de endstops
             x_home_state = self._board.digital_read(x_home)[0]
             y_home_state = self._board.digital_read(y_home)[0]
             logger.debug(f"Estado inicial endstops - X:{x_home_state}, Y:{y_home_state}")
             
+            # Elegir quién genera los pasos: la placa si el firmware lo permite
+            self._backend = create_backend(self._board, config, self._endstops)
+            
             logger.debug("Pines CNC configurados correctamente")
             return True
             
@@ -117,57 +148,76 @@ class ArduinoManager:
             logger.error(f"Error configurando pines CNC: {e}")
             return False
     
-    def move_steps(self, axis, steps, direction):
-        """Mover motor el número especificado de pasos"""
+    def move_steps(self, axis, steps, direction, rate=None):
+        """Mover motor el número especificado de pasos (a `rate` pasos/s)"""
         if not self.is_connected():
             logger.error("No hay conexión con Arduino")
             return False
             
         try:
             config = ConfigManager().get_machine_config()
+            if self._backend is None:
+                self._backend = create_backend(self._board, config, self._endstops)
+            if rate is None:
+                rate = float(config.get('step_rate') or DEFAULT_STEP_RATE)
             
-            # Seleccionar pines según el eje
-            if axis.lower() == 'x':
-                step_pin = int(config['x_step'])
-                dir_pin = int(config['x_dir'])
-                home_pin = int(config['x_home'])
-                logger.debug(f"Moviendo eje X - step_pin:{step_pin}, dir_pin:{dir_pin}, home_pin:{home_pin}")
-            else:  # eje Y
-                step_pin = int(config['y_step'])
-                dir_pin = int(config['y_dir'])
-                home_pin = int(config['y_home'])
-                logger.debug(f"Moviendo eje Y - step_pin:{step_pin}, dir_pin:{dir_pin}, home_pin:{home_pin}")
-            
-            # Establecer dirección
-            logger.debug(f"Estableciendo dirección: {'positiva' if direction > 0 else 'negativa'}")
-            self._board.digital_write(dir_pin, 1 if direction > 0 else 0)
-            time.sleep(0.001)  # Pequeño delay para estabilizar la señal de dirección
-            
-            logger.debug(f"Iniciando secuencia de {abs(steps)} pasos")
-            # Realizar pasos
-            for step in range(abs(steps)):
-                # Verificar endstop
-                endstop_state = self._board.digital_read(home_pin)[0]
-                if endstop_state == 0:  # Activo en bajo
-                    logger.warning(f"Endstop {axis} activado")
-                    return False
-                    
-                # Paso
-                self._board.digital_write(step_pin, 1)
-                time.sleep(0.001)  # 1ms de delay
-                self._board.digital_write(step_pin, 0)
-                time.sleep(0.001)  # 1ms de delay
-                
-                if step % 10 == 0:  # Log cada 10 pasos
-                    logger.debug(f"Completados {step} pasos")
-            
-            logger.debug(f"Movimiento completado: {abs(steps)} pasos")
-            return True
+            logger.debug(f"Moviendo eje {axis.upper()}: {abs(steps)} pasos "
+                         f"{'positivos' if direction > 0 else 'negativos'} a {rate:.0f} pasos/s "
+                         f"({self._backend.name})")
+            completed = self._backend.move(axis.lower(), abs(steps), direction, rate)
+            offset = abs(steps) if direction > 0 else -abs(steps)
+            self._moved(offset if axis.lower() == 'x' else 0,
+                        offset if axis.lower() == 'y' else 0, completed)
+            return completed
             
         except Exception as e:
             logger.error(f"Error moviendo motor {axis}: {e}")
             return False
     
+    def move_linear(self, dx, dy, feed=None):
+        """Mover X e Y a la vez en línea recta (dx, dy pasos) a `feed` mm/min"""
+        if not self.is_connected():
+            logger.error("No hay conexión con Arduino")
+            return False
+            
+        try:
+            config = ConfigManager().get_machine_config()
+            if self._backend is None:
+                self._backend = create_backend(self._board, config, self._endstops)
+            
+            # Sin velocidad, el eje mayor va a la frecuencia de pasos por defecto
+            if feed:
+                steps_per_mm = (float(config['steps_x']), float(config['steps_y']))
+                move = LinearMove.at_feed(dx, dy, feed, steps_per_mm)
+            else:
+                move = LinearMove.at_rate(dx, dy, float(config.get('step_rate') or DEFAULT_STEP_RATE))
+            
+            completed = self._backend.move_linear(move)
+            self._moved(move.dx, move.dy, completed)
+            return completed
+            
+        except Exception as e:
+            logger.error(f"Error en movimiento lineal ({dx}, {dy}): {e}")
+            return False
+    
+    def run_move(self, move):
+        """Ejecutar un LinearMove ya planificado (con su perfil de velocidad)"""
+        if not self.is_connected():
+            logger.error("No hay conexión con Arduino")
+            return False
+            
+        try:
+            if self._backend is None:
+                self._backend = create_backend(self._board, ConfigManager().get_machine_config(),
+                                               self._endstops)
+            completed = self._backend.move_linear(move)
+            self._moved(move.dx, move.dy, completed)
+            return completed
+            
+        except Exception as e:
+            logger.error(f"Error en movimiento planificado ({move.dx}, {move.dy}): {e}")
+            return False
+    
     def move_mm(self, axis, distance):
         """Mover el eje la distancia especificada en mm"""
         try:
@@ -194,6 +244,9 @@ class ArduinoManager:
         if not self.is_connected():
             logger.error("No hay conexión con Arduino")
             return False
+        if self._endstops is None:
+            logger.error("Finales de carrera no configurados")
+            return False
             
         try:
             config = ConfigManager().get_machine_config()
@@ -202,30 +255,36 @@ class ArduinoManager:
             if axis.lower() == 'x':
                 step_pin = int(config['x_step'])
                 dir_pin = int(config['x_dir'])
-                home_pin = int(config['x_home'])
             else:  # eje Y
                 step_pin = int(config['y_step'])
                 dir_pin = int(config['y_dir'])
-                home_pin = int(config['y_home'])
+            triggered = self._endstops.triggered[axis.lower()]
+            
+            # El home da los pasos desde el PC: la placa pierde la fase de sus pines
+            if self._backend is not None:
+                self._backend.reset()
+            self._position[axis.lower()] = None  # Desconocida hasta llegar al final de carrera
             
             # Establecer dirección negativa (hacia home)
             self._board.digital_write(dir_pin, 0)  # 0 = dirección hacia home
             time.sleep(0.001)
             
-            # Mover hasta activar endstop
-            while True:
-                # Leer estado del endstop
-                endstop_state = self._board.digital_read(home_pin)[0]
-                if endstop_state == 0:  # Endstop activado (activo en bajo)
-                    logger.info(f"¡ENDSTOP {axis.upper()} ACTIVADO!")
-                    break
+            # Mover hasta activar endstop: las esperas entre flancos terminan
+            # en cuanto la placa avisa
+            deadline = time.monotonic() + self.HOME_TIMEOUT
+            while not triggered.is_set():
+                if time.monotonic() > deadline:
+                    logger.error(f"Home {axis.upper()}: el endstop no se activó en {self.HOME_TIMEOUT} s")
+                    return False
                 
                 # Dar un paso
                 self._board.digital_write(step_pin, 1)
-                time.sleep(0.001)
+                triggered.wait(0.001)
                 self._board.digital_write(step_pin, 0)
-                time.sleep(0.001)
+                triggered.wait(0.001)
             
+            logger.info(f"¡ENDSTOP {axis.upper()} ACTIVADO!")
+            self._position[axis.lower()] = 0  # El origen de la máquina es el home
             return True
             
         except Exception as e:
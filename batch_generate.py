@@ -0,0 +1,253 @@
+"""Generación de G-code ARLA por lotes sin interfaz gráfica
+
+Convierte imágenes BMP/PNG (archivos, directorios o patrones glob) en archivos
+.arla usando PCBProcessor, MaterialManager, ConfigManager y GCodeGenerator, con
+varios procesos en paralelo. No importa tkinter, así que funciona en servidores
+sin pantalla. Al terminar escribe un resumen JSON con tiempos y estadísticas.
+
+Uso:
+    python batch_generate.py placas/ extra/*.png -o salida/ [--material "PCB FR4"]
+        [--type fill] [--speed 800] [--power 255] [--line-spacing 0.1]
+        [--position 10 20] [--rotation 90] [--panel 3 4 30 20]
+        [--set-material clave=valor] [--set-machine clave=valor]
+        [--jobs trabajos.json] [--workers 4] [--config config.json]
+        [--summary resumen.json]
+
+El archivo de --jobs es una lista de trabajos (o {"defaults": {...}, "jobs": [...]})
+con las claves 'input' (archivo, directorio o glob) y opcionalmente 'output',
+'material', 'material_overrides', 'position' ({"x", "y"}), 'rotation',
+'panel' ({"rows", "cols", "pitch"} o {"offsets"}) y 'machine'. Lo que no
+indique un trabajo se toma de la línea de comandos.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from config_manager import ConfigManager
+from material_manager import MaterialManager
+from pcb_processor import PCBProcessor
+from gcode_generator import GCodeGenerator
+
+logger = logging.getLogger('BatchGenerate')
+
+IMAGE_EXTENSIONS = ('.bmp', '.png')
+
+def parse_value(text):
+    """Valor de una opción clave=valor: JSON si se puede, si no texto"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+def parse_assignments(items):
+    """Convertir una lista de 'clave=valor' en diccionario"""
+    values = {}
+    for item in items or []:
+        key, sep, value = item.partition('=')
+        if not sep or not key:
+            raise argparse.ArgumentTypeError(f"Se esperaba clave=valor: {item}")
+        values[key.strip()] = parse_value(value)
+    return values
+
+def expand_inputs(pattern):
+    """Imágenes de un archivo, directorio o patrón glob, en orden"""
+    if os.path.isdir(pattern):
+        candidates = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))]
+    else:
+        candidates = sorted(glob.glob(pattern))
+    files = [path for path in candidates
+             if os.path.isfile(path) and os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS]
+    if not files:
+        logger.warning(f"Sin imágenes BMP/PNG para: {pattern}")
+    return files
+
+def build_jobs(args):
+    """Lista de trabajos a partir de las entradas y del archivo de trabajos"""
+    defaults = {
+        'material': args.material,
+        'material_overrides': {},
+        'position': {'x': args.position[0], 'y': args.position[1]} if args.position else None,
+        'rotation': args.rotation,
+        'panel': ({'rows': int(args.panel[0]), 'cols': int(args.panel[1]),
+                   'pitch': args.panel[2:]} if args.panel else None),
+        'machine': parse_assignments(args.set_machine),
+        'cache': not args.no_cache
+    }
+    for key, value in (('engrave_type', args.type), ('speed', args.speed),
+                       ('power', args.power), ('line_spacing', args.line_spacing),
+                       ('fill_direction', args.fill_direction)):
+        if value is not None:
+            defaults['material_overrides'][key] = value
+    defaults['material_overrides'].update(parse_assignments(args.set_material))
+
+    specs = [{'input': pattern} for pattern in args.inputs]
+    if args.jobs:
+        with open(args.jobs, 'r', encoding='utf-8') as f:
+            content = json.load(f)
+        if isinstance(content, dict):
+            defaults.update(content.get('defaults', {}))
+            content = content.get('jobs', [])
+        specs.extend(content)
+
+    jobs = []
+    used = set()
+    for spec in specs:
+        paths = expand_inputs(spec['input'])
+        for path in paths:
+            job = dict(defaults)
+            job.update({key: value for key, value in spec.items() if key != 'input'})
+            job['material_overrides'] = dict(defaults['material_overrides'],
+                                             **spec.get('material_overrides', {}))
+            job['machine'] = dict(defaults['machine'], **spec.get('machine', {}))
+            job['input'] = path
+
+            # Nombre de salida único dentro del directorio de salida
+            if not spec.get('output') or len(paths) > 1:
+                base = os.path.splitext(os.path.basename(path))[0]
+                output = os.path.join(args.output, base + '.arla')
+                number = 1
+                while output in used:
+                    number += 1
+                    output = os.path.join(args.output, f"{base}_{number}.arla")
+                job['output'] = output
+            used.add(job['output'])
+            jobs.append(job)
+    return jobs
+
+def _init_worker(config_file, log_level):
+    """Preparar cada proceso: configuración de máquina y nivel de log"""
+    logging.basicConfig(level=log_level)
+    if config_file:
+        ConfigManager._config_file = config_file
+
+def run_job(job):
+    """Generar un archivo .arla (se ejecuta en un proceso del pool)"""
+    started = time.perf_counter()
+    result = {'input': job['input'], 'output': job['output'], 'success': False}
+    processor = PCBProcessor()
+    try:
+        if not processor.load_image(job['input']):
+            raise ValueError("No se pudo cargar la imagen")
+
+        # Material: el indicado (o el primero, como en WorkDialog) con sus cambios
+        materials = MaterialManager()
+        name = job.get('material') or (materials.get_material_names() or [None])[0]
+        material = materials.get_material_by_name(name)
+        if material is None:
+            raise ValueError(f"Material no encontrado: {name}")
+        material = dict(material, **job.get('material_overrides', {}))
+
+        config = ConfigManager()
+        machine_config = dict(config.get_machine_config(), **job.get('machine', {}))
+
+        # Sin posición se centra el PCB en la máquina, como el área de trabajo
+        position = job.get('position')
+        if not position:
+            dims = processor.get_dimensions() or {'width': 0, 'height': 0}
+            machine = config.get_machine_dimensions()
+            position = {'x': (machine['width'] - dims['width']) / 2,
+                        'y': (machine['length'] - dims['height']) / 2}
+
+        data = {
+            'image': processor.get_generation_image() or processor.get_pipeline(),
+            'position': position,
+            'rotation': job.get('rotation', 0),
+            'panel': job.get('panel'),
+            'material': material,
+            'machine_config': machine_config
+        }
+
+        output_dir = os.path.dirname(os.path.abspath(job['output']))
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Un proceso por trabajo: el relleno no abre procesos propios
+        generator = GCodeGenerator(workers=1, use_cache=job.get('cache', True))
+        result['success'] = generator.generate(data, job['output'])
+        if result['success']:
+            result['stats'] = generator.last_stats
+            result['report'] = generator.report.as_dict()
+            result['output_bytes'] = os.path.getsize(job['output'])
+        else:
+            result['error'] = "Error generando G-code"
+    except Exception as e:
+        logger.error(f"Error procesando {job['input']}: {e}")
+        result['error'] = str(e)
+    finally:
+        if processor.tiled_image is not None:
+            processor.tiled_image.close()
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('inputs', nargs='*', help="archivos, directorios o patrones glob")
+    parser.add_argument('-o', '--output', default='.', help="directorio de salida")
+    parser.add_argument('--material', help="nombre del material (por defecto el primero)")
+    parser.add_argument('--type', choices=['outline', 'fill', 'mixed', 'grayscale'])
+    parser.add_argument('--speed', type=int)
+    parser.add_argument('--power', type=int)
+    parser.add_argument('--line-spacing', type=float)
+    parser.add_argument('--fill-direction', choices=['unidirectional', 'bidirectional'])
+    parser.add_argument('--position', type=float, nargs=2, metavar=('X', 'Y'),
+                        help="posición en mm (por defecto centrado)")
+    parser.add_argument('--rotation', type=int, default=0, choices=[0, 90, 180, 270])
+    parser.add_argument('--panel', type=float, nargs=4,
+                        metavar=('FILAS', 'COLUMNAS', 'PASO_X', 'PASO_Y'),
+                        help="repetir el PCB en una rejilla (paso en mm)")
+    parser.add_argument('--set-material', action='append', metavar='CLAVE=VALOR')
+    parser.add_argument('--set-machine', action='append', metavar='CLAVE=VALOR')
+    parser.add_argument('--jobs', help="JSON con trabajos y sus cambios")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--config', help="config.json de la máquina")
+    parser.add_argument('--summary', help="resumen JSON (por defecto en el directorio de salida)")
+    parser.add_argument('--no-cache', action='store_true', help="no usar la caché de toolpaths")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    log_level = logging.DEBUG if args.verbose else logging.INFO
+    logging.basicConfig(level=log_level)
+    if args.config:
+        ConfigManager._config_file = args.config
+
+    jobs = build_jobs(args)
+    if not jobs:
+        logger.error("No hay imágenes que procesar")
+        return 1
+
+    logger.info(f"Generando {len(jobs)} archivos con {args.workers} procesos")
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=_init_worker,
+                             initargs=(args.config, log_level)) as executor:
+        for result in executor.map(run_job, jobs):
+            status = "OK" if result['success'] else f"ERROR ({result.get('error')})"
+            logger.info(f"{result['input']} -> {result['output']}: {status} "
+                        f"en {result['seconds']:.2f} s")
+            results.append(result)
+
+    failed = sum(1 for r in results if not r['success'])
+    summary = {
+        'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'seconds': time.perf_counter() - started,
+        'workers': args.workers,
+        'total': len(results),
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'jobs': results
+    }
+    summary_path = args.summary or os.path.join(args.output, 'batch_summary.json')
+    os.makedirs(os.path.dirname(os.path.abspath(summary_path)), exist_ok=True)
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    logger.info(f"{summary['succeeded']}/{summary['total']} archivos generados en "
+                f"{summary['seconds']:.2f} s; resumen en {summary_path}")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Benchmark de la vigilancia de finales de carrera al dar pasos desde el PC
+
+Mueve un eje de una placa simulada (SimulatedBoard de benchmarks/board_simulator.py) con
+BitBangBackend comprobando el final de carrera antes de cada paso de dos
+formas: leyendo el pin con digital_read (lo que se hacía antes) y mirando el
+flag que actualiza EndstopMonitor con los avisos de la placa. Mide la
+frecuencia de pasos real en la placa y el tiempo del PC por paso, y comprueba
+que el movimiento hacia home se para en el final de carrera. A 115200 baudios
+el enlace limita los pasos antes que el PC; con --baud más alto (placas con
+USB nativo) manda el PC.
+
+Uso:
+    python benchmarks/bench_endstops.py [--steps 4000] [--rates 2000 20000 100000]
+        [--baud 115200] [--read-cost 0]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from board_simulator import SimulatedBoard
+from stepper_backend import AxisPins, BitBangBackend, EndstopMonitor
+
+# Pines de la config.json de ejemplo
+AXES = {'x': (8, 9, 11), 'y': (5, 4, 6)}
+START = 1_000_000  # Lejos del final de carrera
+
+
+class PolledBoard(SimulatedBoard):
+    """Placa simulada en la que digital_read cuesta `read_cost` segundos al PC"""
+    def __init__(self, *args, read_cost=0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read_cost = read_cost
+        self.reads = 0
+
+    def digital_read(self, pin):
+        self.reads += 1
+        if self.read_cost:
+            end = time.perf_counter() + self.read_cost
+            while time.perf_counter() < end:
+                pass
+        return super().digital_read(pin)
+
+
+def make_backend(board, events):
+    """BitBangBackend que lee los pines o que mira los flags de EndstopMonitor"""
+    pins = {axis: AxisPins(*axis_pins) for axis, axis_pins in AXES.items()}
+    endstops = None
+    if events:
+        endstops = EndstopMonitor(pins)
+        for axis_pins in pins.values():
+            board.set_pin_mode_digital_input_pullup(axis_pins.home, callback=endstops.callback)
+    return BitBangBackend(board, pins, endstops)
+
+
+def run(events, steps, rate, baud_rate, read_cost):
+    """Pasos hacia delante a `rate` pasos/s; devuelve las medidas"""
+    board = PolledBoard(AXES, baud_rate=baud_rate, start_position={'x': START},
+                        read_cost=read_cost)
+    backend = make_backend(board, events)
+
+    t0 = time.perf_counter()
+    backend.move('x', steps, 1, rate)
+    host_s = time.perf_counter() - t0
+
+    pulses = board.step_times(AXES['x'][0])
+    board_rate = (len(pulses) - 1) / (pulses[-1] - pulses[0]) if len(pulses) > 1 else 0.0
+    return {'board_rate': board_rate, 'host_us': host_s / steps * 1e6, 'reads': board.reads}
+
+
+def stops_at_home(events):
+    """El movimiento hacia home se para al llegar a 0 sin pasarse"""
+    board = PolledBoard(AXES, start_position={'x': 50})
+    backend = make_backend(board, events)
+    return not backend.move('x', 100, -1, 20000) and board.position['x'] == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--steps', type=int, default=4000)
+    parser.add_argument('--rates', type=float, nargs='+', default=[2000, 20000, 100000])
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--read-cost', type=float, default=0.0,
+                        help="Segundos de PC por digital_read (0: solo el de la simulación)")
+    args = parser.parse_args()
+    logging.getLogger('StepperBackend').setLevel(logging.ERROR)  # Sin el aviso de la parada en home
+
+    print(f"{'endstops':>8} {'pasos/s pedidos':>16} {'pasos/s placa':>14} {'µs PC/paso':>11} "
+          f"{'lecturas':>9} {'ganancia':>9}")
+    for rate in args.rates:
+        polled = run(False, args.steps, rate, args.baud, args.read_cost)
+        events = run(True, args.steps, rate, args.baud, args.read_cost)
+        for name, result in (('lectura', polled), ('eventos', events)):
+            gain = result['board_rate'] / polled['board_rate'] if polled['board_rate'] else 0.0
+            print(f"{name:>8} {rate:>16.0f} {result['board_rate']:>14.0f} "
+                  f"{result['host_us']:>11.1f} {result['reads']:>9} {gain:>8.2f}x")
+
+    print(f"\nParada en home: lectura {'ok' if stops_at_home(False) else 'ERROR'}, "
+          f"eventos {'ok' if stops_at_home(True) else 'ERROR'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark de extracción de segmentos: recorrido píxel a píxel vs. NumPy
+
+Uso:
+    python benchmarks/bench_find_segments.py [--rows 64] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gcode_generator import find_black_runs
+
+WIDTHS = [500, 1000, 2500, 5000, 10000]
+
+
+def legacy_find_segments(row):
+    """Versión anterior de GCodeGenerator._find_segments (una fila, bucle Python)"""
+    segments = []
+    start = None
+
+    for i, val in enumerate(row):
+        if val == 0 and start is None:
+            start = i
+        elif val == 255 and start is not None:
+            segments.append((start, i))
+            start = None
+
+    if start is not None:
+        segments.append((start, len(row)))
+
+    return segments
+
+
+def make_binary(width, rows, seed=0):
+    """Imagen binaria sintética con pistas de ancho variable"""
+    rng = np.random.default_rng(seed)
+    runs = rng.integers(1, 40, size=width)
+    values = np.repeat(np.arange(len(runs)) % 2 * 255, runs)[:width]
+    image = np.empty((rows, width), dtype=np.uint8)
+    for y in range(rows):
+        image[y] = np.roll(values, y * 7)
+    return image
+
+
+def best_time(func, repeat):
+    """Mejor tiempo de varias ejecuciones"""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=64)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'ancho':>8} {'segmentos':>10} {'bucle (s)':>10} {'numpy (s)':>10} {'mejora':>8}")
+    for width in WIDTHS:
+        binary = make_binary(width, args.rows)
+
+        legacy = [seg for row in binary for seg in legacy_find_segments(row)]
+        rows, starts, ends = find_black_runs(binary)
+        if legacy != list(zip(starts.tolist(), ends.tolist())):
+            raise SystemExit(f"Resultados distintos para ancho {width}")
+
+        t_legacy = best_time(lambda: [legacy_find_segments(row) for row in binary], args.repeat)
+        t_numpy = best_time(lambda: find_black_runs(binary), args.repeat)
+        print(f"{width:>8} {len(legacy):>10} {t_legacy:>10.4f} {t_numpy:>10.4f} "
+              f"{t_legacy / t_numpy:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+"""Benchmark de GCodeGenerator sobre un corpus sintético de PCBs
+
+Genera imágenes deterministas (rejilla de pistas, pads, texto y huellas SMD
+densas) a varias resoluciones, ejecuta la generación outline/fill/mixed de cada
+una en un proceso aparte (varias veces, se queda con la más rápida) y guarda
+tiempos por etapa, movimientos por segundo, bytes de salida, pico de memoria
+(RSS y tracemalloc) y distancias de movimiento rápido y de grabado en un JSON.
+Con --baseline compara con un resultado anterior y termina con código 1 si hay
+regresiones. En Windows el pico de RSS se mide con psutil si está instalado;
+si no, queda sin medir y no se compara.
+
+Uso:
+    python benchmarks/bench_generator.py [--dpi 300 600] [--pattern smd]
+        [--mode fill] [--repeats 5] [--output bench_results.json]
+        [--baseline baseline.json] [--tolerance 0.15] [--min-delta 0.1]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    import resource  # Solo en Unix
+except ImportError:
+    resource = None
+try:
+    import psutil  # Opcional: pico de memoria en Windows
+except ImportError:
+    psutil = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gcode_generator import GCodeGenerator, MOVE_CUT, Toolpath
+from image_pipeline import ImagePipeline
+
+DPIS = [300, 600, 1200, 2400]
+PATTERNS = ['traces', 'pads', 'text', 'smd']
+MODES = ['outline', 'fill', 'mixed']
+
+# Tamaño del PCB sintético (mm), el mismo que graba el generador
+BOARD_WIDTH = 80
+BOARD_HEIGHT = 50
+
+# Métricas comparadas con la línea base: nombre -> mayor es peor
+TIME_METRICS = ['prepare_s', 'toolpaths_s', 'generate_s']
+MEMORY_METRICS = ['peak_rss_mb', 'tracemalloc_peak_mb']
+OUTPUT_METRICS = ['moves', 'output_bytes']
+
+MACHINE_CONFIG = {'steps_x': '80', 'steps_y': '80'}
+
+
+class Board:
+    """Lienzo en mm sobre una imagen PIL a la resolución pedida"""
+
+    def __init__(self, dpi):
+        self.scale = dpi / 25.4
+        self.image = Image.new('L', (self.px(BOARD_WIDTH), self.px(BOARD_HEIGHT)), 255)
+        self.draw = ImageDraw.Draw(self.image)
+
+    def px(self, mm):
+        return int(round(mm * self.scale))
+
+    def line(self, points, width):
+        self.draw.line([(self.px(x), self.px(y)) for x, y in points],
+                       fill=0, width=max(1, self.px(width)), joint='curve')
+
+    def rect(self, x, y, w, h):
+        self.draw.rectangle([self.px(x), self.px(y), self.px(x + w), self.px(y + h)], fill=0)
+
+    def pad(self, x, y, diameter, drill):
+        r, d = diameter / 2, drill / 2
+        self.draw.ellipse([self.px(x - r), self.px(y - r), self.px(x + r), self.px(y + r)], fill=0)
+        self.draw.ellipse([self.px(x - d), self.px(y - d), self.px(x + d), self.px(y + d)], fill=255)
+
+    def text(self, x, y, text, height):
+        try:
+            font = ImageFont.load_default(size=max(6, self.px(height)))
+        except TypeError:
+            font = ImageFont.load_default()  # Pillow < 10.1: fuente fija
+        self.draw.text((self.px(x), self.px(y)), text, fill=0, font=font)
+
+
+def draw_traces(board, rng):
+    """Rejilla de pistas de 0.3 mm con codos a 45 grados"""
+    for i in range(24):
+        y = 2 + i * 2
+        kink = rng.uniform(10, 70)
+        board.line([(1, y), (kink, y), (kink + 1.5, y + 1.5 if i % 2 else y - 1.5),
+                    (BOARD_WIDTH - 1, y + 1.5 if i % 2 else y - 1.5)], 0.3)
+    for i in range(12):
+        x = 4 + i * 6.5
+        board.line([(x, 1), (x, BOARD_HEIGHT - 1)], 0.5)
+
+
+def draw_pads(board, rng):
+    """Pads pasantes con taladro en filas tipo DIP, con pistas entre ellos"""
+    for row in range(6):
+        y = 5 + row * 8
+        for col in range(30):
+            x = 3 + col * 2.54
+            board.pad(x, y, 1.6, 0.8)
+            board.pad(x, y + 2.54 * 1.2, 1.6, 0.8)
+        board.line([(2, y + 1.52), (BOARD_WIDTH - 2, y + 1.52)], 0.25)
+    for _ in range(40):
+        x, y = rng.uniform(3, BOARD_WIDTH - 3), rng.uniform(3, BOARD_HEIGHT - 3)
+        board.pad(x, y, 1.0, 0.4)
+
+
+def draw_text(board, rng):
+    """Serigrafía: referencias de componentes de varios tamaños"""
+    for i in range(60):
+        x, y = rng.uniform(1, BOARD_WIDTH - 12), rng.uniform(1, BOARD_HEIGHT - 4)
+        board.text(x, y, f"{'RCUQJ'[i % 5]}{i + 1} {rng.integers(1, 999)}k",
+                   rng.choice([1.0, 1.5, 2.5]))
+
+
+def draw_smd(board, rng):
+    """Huellas SMD densas: QFP de paso 0.5 mm y matrices de 0402"""
+    for qx in range(3):
+        for qy in range(2):
+            cx, cy = 14 + qx * 26, 13 + qy * 24
+            for k in range(20):
+                offset = -4.75 + k * 0.5
+                board.rect(cx + offset - 0.13, cy - 7, 0.26, 1.4)
+                board.rect(cx + offset - 0.13, cy + 5.6, 0.26, 1.4)
+                board.rect(cx - 7, cy + offset - 0.13, 1.4, 0.26)
+                board.rect(cx + 5.6, cy + offset - 0.13, 1.4, 0.26)
+    for _ in range(120):
+        x, y = rng.uniform(1, BOARD_WIDTH - 2), rng.uniform(1, BOARD_HEIGHT - 1)
+        board.rect(x, y, 0.5, 0.5)
+        board.rect(x + 1.0, y, 0.5, 0.5)
+
+
+DRAWERS = {'traces': draw_traces, 'pads': draw_pads, 'text': draw_text, 'smd': draw_smd}
+
+
+def make_board(pattern, dpi, seed=0):
+    """Imagen sintética de un PCB (pistas negras sobre blanco, como los BMP)"""
+    board = Board(dpi)
+    DRAWERS[pattern](board, np.random.default_rng(seed))
+    return board.image
+
+
+def job_data(image, mode):
+    """Datos de trabajo como los arma WorkDialog"""
+    return {
+        'image': ImagePipeline(image, invert=True),
+        'position': {'x': 0, 'y': 0},
+        'material': {
+            'name': 'Benchmark',
+            'speed': 800,
+            'power': 255,
+            'engrave_type': mode,
+            'fill_direction': 'bidirectional'
+        },
+        'machine_config': MACHINE_CONFIG
+    }
+
+
+def distances(toolpaths):
+    """Distancia recorrida con movimientos rápidos y de grabado (mm) desde el origen"""
+    if not toolpaths:
+        return 0.0, 0.0
+    moves = Toolpath.concatenate(toolpaths).moves
+    x = np.concatenate(([0.0], moves['x']))
+    y = np.concatenate(([0.0], moves['y']))
+    length = np.hypot(np.diff(x), np.diff(y))
+    cut = moves['kind'] == MOVE_CUT
+    return float(length[~cut].sum()), float(length[cut].sum())
+
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso en MB (None si no se puede medir)"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux lo da en KB y macOS en bytes
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        # En Windows peak_wset es el pico; en otros sistemas solo hay la actual
+        return getattr(info, 'peak_wset', info.rss) / 2**20
+    return None
+
+
+def run_case(pattern, dpi, mode, workers, trace_memory, repeats):
+    """Ejecutar un caso (en un proceso aparte para medir su propio pico de RSS)
+
+    La generación se repite `repeats` veces y se guarda el mejor tiempo de
+    cada medida: la primera ejecución arrastra importaciones y cachés frías y
+    las demás varían con la carga de la máquina. Las etapas salen del informe
+    de la propia generación, así que siempre caben dentro del total.
+    """
+    image = make_board(pattern, dpi)
+    generator = GCodeGenerator(use_cache=False, workers=workers)
+
+    # Geometría para contar movimientos y distancias (no se cronometra)
+    toolpaths = generator.build_toolpaths(job_data(image, mode))
+    moves = sum(len(t) for t in toolpaths)
+    rapid, engrave = distances(toolpaths)
+    del toolpaths
+
+    # Trabajo completo hasta el archivo, con preprocesado nuevo en cada repetición
+    runs = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'bench.arla')
+        for _ in range(max(1, repeats)):
+            t0 = time.perf_counter()
+            if not generator.generate(job_data(image, mode), path):
+                raise RuntimeError(f"La generación falló: {pattern} {dpi} {mode}")
+            runs.append((time.perf_counter() - t0, generator.report.as_dict()))
+        output_bytes = os.path.getsize(path)
+
+        traced_peak = None
+        if trace_memory:
+            tracemalloc.start()
+            generator.generate(job_data(image, mode), path)
+            traced_peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+
+    generate, report = min(runs, key=lambda run: run[0])
+    return {
+        'name': f"{pattern}-{dpi}dpi-{mode}",
+        'pattern': pattern,
+        'dpi': dpi,
+        'mode': mode,
+        'pixels': image.size[0] * image.size[1],
+        'repeats': len(runs),
+        'prepare_s': min(r['stages']['preprocess'] for _, r in runs),
+        'toolpaths_s': min(r['stages']['geometry'] for _, r in runs),
+        'generate_s': generate,
+        'moves': moves,
+        'moves_per_s': moves / generate if generate > 0 else None,
+        'output_bytes': output_bytes,
+        'peak_rss_mb': peak_rss_mb(),
+        'tracemalloc_peak_mb': traced_peak,
+        'rapid_mm': rapid,
+        'engrave_mm': engrave,
+        'stages': report['stages']
+    }
+
+
+def compare(results, baseline, tolerance, min_delta=0.0):
+    """Diferencias con la línea base; devuelve la lista de regresiones
+
+    Los tiempos que empeoran menos de `min_delta` segundos no cuentan: en los
+    casos pequeños son ruido de medida.
+    """
+    previous = {r['name']: r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        old = previous.get(result['name'])
+        if old is None:
+            continue
+        for metric in TIME_METRICS + MEMORY_METRICS:
+            new_value, old_value = result.get(metric), old.get(metric)
+            if not new_value or not old_value:
+                continue
+            change = new_value / old_value - 1
+            if metric in TIME_METRICS and new_value - old_value < min_delta:
+                continue
+            if change > tolerance:
+                regressions.append(f"{result['name']}: {metric} {old_value:.3f} -> "
+                                   f"{new_value:.3f} (+{change:.0%})")
+        for metric in OUTPUT_METRICS:
+            if result.get(metric) != old.get(metric):
+                regressions.append(f"{result['name']}: {metric} cambió "
+                                   f"{old.get(metric)} -> {result.get(metric)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dpi', type=int, nargs='+', default=DPIS)
+    parser.add_argument('--pattern', nargs='+', choices=PATTERNS, default=PATTERNS)
+    parser.add_argument('--mode', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="procesos del relleno (1 = resultados comparables)")
+    parser.add_argument('--repeats', type=int, default=5,
+                        help="generaciones por caso; se compara la más rápida")
+    parser.add_argument('--no-tracemalloc', action='store_true',
+                        help="no repetir la generación para medir con tracemalloc")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help="JSON de una ejecución anterior")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="empeoramiento relativo admitido en tiempo y memoria")
+    parser.add_argument('--min-delta', type=float, default=0.1,
+                        help="empeoramiento absoluto mínimo (s) para contar un tiempo")
+    args = parser.parse_args()
+
+    print(f"{'caso':<28} {'píxeles':>10} {'prep (s)':>9} {'geom (s)':>9} {'total (s)':>9} "
+          f"{'mov/s':>10} {'KB':>8} {'RSS MB':>7} {'rápido/grabado':>15}")
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for dpi in args.dpi:
+        for pattern in args.pattern:
+            for mode in args.mode:
+                # Un proceso nuevo por caso: el pico de RSS no arrastra casos anteriores
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(run_case, pattern, dpi, mode, args.workers,
+                                             not args.no_tracemalloc, args.repeats).result()
+                results.append(result)
+                ratio = result['rapid_mm'] / result['engrave_mm'] if result['engrave_mm'] else 0
+                rss = f"{result['peak_rss_mb']:.0f}" if result['peak_rss_mb'] is not None else '-'
+                print(f"{result['name']:<28} {result['pixels']:>10} {result['prepare_s']:>9.3f} "
+                      f"{result['toolpaths_s']:>9.3f} {result['generate_s']:>9.3f} "
+                      f"{result['moves_per_s'] or 0:>10.0f} {result['output_bytes'] / 1024:>8.0f} "
+                      f"{rss:>7} {ratio:>15.3f}")
+
+    report = {
+        'meta': {
+            'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'cpus': os.cpu_count(),
+            'workers': args.workers,
+            'repeats': args.repeats
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados guardados en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta)
+        if regressions:
+            print("Regresiones respecto a la línea base:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("Sin regresiones respecto a la línea base")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Benchmark del planificador de movimiento en trabajos con muchos contornos
+
+Genera un trabajo sintético de contornos (pads redondos como polígonos de
+muchos lados y pistas con codos a 45° y 90°) o lee un archivo .arla, y
+compara el tiempo de máquina de cada movimiento planificado:
+  - sin aceleración: cada tramo a F constante, arrancando y parando en seco
+    (lo que se hacía antes; a velocidades altas el motor pierde pasos)
+  - parada en cada vértice: rampas trapezoidales que terminan paradas
+  - look-ahead: rampas con la velocidad de paso por cada vértice planificada
+También mide lo que tarda el PC en planificar cada tramo.
+
+Uso:
+    python benchmarks/bench_planner.py [--feeds 600 1500 3000] [--file job.arla]
+        [--accel 500] [--junction-deviation 0.05]
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from job_executor import GCodeParser
+from motion_planner import DEFAULT_JUNCTION_DEVIATION, DEFAULT_MAX_ACCEL, MotionPlanner
+
+STEPS_PER_MM = (80.0, 80.0)
+MAX_FEED = 6000.0  # mm/min por eje: deja que mande el F de cada tramo
+MAX_RAPID_SPEED = 2000.0  # Límite de G0 del generador
+
+
+def synthetic_contours():
+    """Puntos (mm) de los contornos de un PCB sintético"""
+    contours = []
+    # Pads redondos de 1.5 mm en rejilla, 48 lados cada uno
+    for row in range(8):
+        for col in range(12):
+            cx, cy = 5 + col * 4.0, 5 + row * 4.0
+            contours.append([(cx + 0.75 * math.cos(a * math.pi / 24), cy + 0.75 * math.sin(a * math.pi / 24))
+                             for a in range(49)])
+    # Pistas con codos a 45° y 90°
+    for i in range(20):
+        y = 40 + i * 2.0
+        contours.append([(5, y), (20, y), (22, y + 1.5), (35, y + 1.5), (35, y + 1.9),
+                         (22, y + 1.9), (20, y + 0.4), (5, y + 0.4), (5, y)])
+    return contours
+
+
+def contour_moves(contours, feed):
+    """Movimientos (dx, dy, F, rápido) en pasos: un rápido hasta cada contorno y su recorrido"""
+    rapid_feed = min(feed * 2, MAX_RAPID_SPEED)  # Como GCodeGenerator._speeds
+    moves, position = [], (0, 0)
+    for contour in contours:
+        for i, (x, y) in enumerate(contour):
+            target = (int(round(x * STEPS_PER_MM[0])), int(round(y * STEPS_PER_MM[1])))
+            moves.append((target[0] - position[0], target[1] - position[1],
+                          rapid_feed if i == 0 else feed, i == 0))
+            position = target
+    return moves
+
+
+def file_moves(path, feed):
+    """Movimientos de un archivo .arla con F sustituido por `feed` en los de grabado"""
+    moves, position = [], (0, 0)
+    for command in GCodeParser(*STEPS_PER_MM).commands(path):
+        moves.append((command.x - position[0], command.y - position[1],
+                      (command.feed or MAX_RAPID_SPEED) if command.rapid else feed, command.rapid))
+        position = (command.x, command.y)
+    return moves
+
+
+def machine_time(moves, junction_deviation, accel):
+    """Tiempo de máquina (s) y del PC por tramo (µs) con el planificador"""
+    planner = MotionPlanner(STEPS_PER_MM, max_feed=(MAX_FEED, MAX_FEED), max_accel=(accel, accel),
+                            junction_deviation=junction_deviation)
+    total, blocks = 0.0, 0
+    t0 = time.perf_counter()
+    for dx, dy, feed, rapid in moves:
+        planner.add(dx, dy, feed)
+        while planner.full():
+            total += planner.pop()[1].duration
+            blocks += 1
+    while planner.blocks:
+        total += planner.pop()[1].duration
+        blocks += 1
+    host = time.perf_counter() - t0
+    return total, host / blocks * 1e6 if blocks else 0.0
+
+
+def constant_time(moves):
+    """Tiempo de máquina (s) sin aceleración: cada tramo a su F constante"""
+    total = 0.0
+    for dx, dy, feed, rapid in moves:
+        length = math.hypot(dx / STEPS_PER_MM[0], dy / STEPS_PER_MM[1])
+        total += length / (feed / 60.0)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--feeds', type=float, nargs='+', default=[600, 1500, 3000])
+    parser.add_argument('--file', help="Archivo .arla en lugar del trabajo sintético")
+    parser.add_argument('--accel', type=float, default=DEFAULT_MAX_ACCEL, help="mm/s²")
+    parser.add_argument('--junction-deviation', type=float, default=DEFAULT_JUNCTION_DEVIATION)
+    args = parser.parse_args()
+
+    contours = None if args.file else synthetic_contours()
+    print(f"{'F (mm/min)':>10} {'tramos':>8} {'sin acel. (s)':>14} {'parada (s)':>11} "
+          f"{'look-ahead (s)':>15} {'ganancia':>9} {'µs/tramo':>9}")
+    for feed in args.feeds:
+        moves = file_moves(args.file, feed) if args.file else contour_moves(contours, feed)
+        stop, _ = machine_time(moves, 0.0, args.accel)
+        lookahead, host_us = machine_time(moves, args.junction_deviation, args.accel)
+        print(f"{feed:>10.0f} {len(moves):>8} {constant_time(moves):>14.2f} {stop:>11.2f} "
+              f"{lookahead:>15.2f} {stop / lookahead:>8.2f}x {host_us:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Vértices de contorno antes y después de la simplificación Douglas-Peucker
+
+Para cada PCB sintético de bench_generator compara los vértices de los
+contornos sin simplificar, con la tolerancia solo por pasos y spot (la
+anterior) y con la de GCodeGenerator, que además cuenta el tamaño de píxel.
+Termina con código 1 si en algún caso la simplificación no quita vértices.
+
+Uso:
+    python benchmarks/bench_simplify.py [--dpi 150 300 600] [--pattern traces text]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_generator import MACHINE_CONFIG, PATTERNS, job_data, make_board
+from gcode_generator import GCodeGenerator
+from toolpath_optimizer import ToolpathOptimizer
+
+DPIS = [150, 300, 600, 1200]
+
+
+def contour_vertices(contours):
+    return sum(len(c) for c in contours)
+
+
+def run_case(generator, pattern, dpi):
+    data = job_data(make_board(pattern, dpi), 'outline')
+    image = data['image']
+    scale = np.array([generator.TARGET_WIDTH / image.size[0],
+                      generator.TARGET_HEIGHT / image.size[1]])
+    contours = [c.reshape(-1, 2) * scale for c in image.contours(generator.CANNY_THRESHOLDS)]
+
+    steps = [float(MACHINE_CONFIG[key]) for key in ('steps_x', 'steps_y')]
+    previous = max(max(1 / s for s in steps), generator.spot_size / 4)
+    tolerance = generator._simplify_tolerance(MACHINE_CONFIG, image.size)
+
+    optimizer = ToolpathOptimizer()
+    return {
+        'name': f"{pattern}@{dpi}dpi",
+        'pixel_mm': float(scale.max()),
+        'tolerance': tolerance,
+        'raw': contour_vertices(contours),
+        'previous': contour_vertices(optimizer.simplify_contours(contours, previous)),
+        'simplified': contour_vertices(optimizer.simplify_contours(contours, tolerance))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dpi', type=int, nargs='+', default=DPIS)
+    parser.add_argument('--pattern', nargs='+', choices=PATTERNS, default=PATTERNS)
+    args = parser.parse_args()
+
+    generator = GCodeGenerator(use_cache=False)
+    print(f"{'caso':<18} {'píxel mm':>9} {'tol mm':>7} {'sin simp.':>10} "
+          f"{'anterior':>9} {'actual':>9} {'quitados':>9}")
+    unchanged = []
+    for dpi in args.dpi:
+        for pattern in args.pattern:
+            result = run_case(generator, pattern, dpi)
+            removed = 1 - result['simplified'] / result['raw'] if result['raw'] else 0
+            print(f"{result['name']:<18} {result['pixel_mm']:>9.3f} {result['tolerance']:>7.3f} "
+                  f"{result['raw']:>10} {result['previous']:>9} {result['simplified']:>9} "
+                  f"{removed:>9.1%}")
+            if result['raw'] and result['simplified'] >= result['raw']:
+                unchanged.append(result['name'])
+
+    if unchanged:
+        print(f"Sin reducción de vértices: {', '.join(unchanged)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark de generación de pasos: PC (bit-bang) vs. placa (FirmataExpress)
+
+Mueve un eje de una placa simulada (SimulatedBoard de benchmarks/board_simulator.py, con el
+enlace serie a 115200 baudios) con cada backend y mide el tiempo en el PC, los
+mensajes enviados y la frecuencia real de los pulsos STEP en la placa.
+Después hace movimientos coordinados en diagonal (motion_engine.LinearMove) y
+compara la velocidad del vector medida en los pulsos con la pedida. Comprueba
+que la posición final de los ejes es la pedida.
+
+Uso:
+    python benchmarks/bench_stepping.py [--steps 2000] [--rates 500 2000 8000]
+        [--feed 600]
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from board_simulator import SimulatedBoard
+from motion_engine import LinearMove
+from stepper_backend import AxisPins, BitBangBackend, FirmataStepperBackend, create_backend
+
+# Pines de la config.json de ejemplo
+AXES = {'x': (8, 9, 11), 'y': (5, 4, 6)}
+CONFIG = {'x_step': '8', 'x_dir': '9', 'x_home': '11',
+          'y_step': '5', 'y_dir': '4', 'y_home': '6'}
+START = 1_000_000  # Lejos del final de carrera
+STEPS_PER_MM = (80.0, 80.0)
+DIAGONALS = [(400, 0), (400, 400), (400, -150), (-60, 400)]
+
+
+def run(backend_class, steps, rate):
+    """Ida y vuelta de `steps` pasos; devuelve las medidas"""
+    board = SimulatedBoard(AXES, start_position={'x': START})
+    pins = {axis: AxisPins(*axis_pins) for axis, axis_pins in AXES.items()}
+    backend = backend_class(board, pins)
+
+    t0 = time.perf_counter()
+    backend.move('x', steps, 1, rate)
+    backend.move('x', steps, -1, rate)
+    host_s = time.perf_counter() - t0
+
+    pulses = board.step_times(AXES['x'][0])
+    forward = pulses[:steps]
+    board_rate = (len(forward) - 1) / (forward[-1] - forward[0]) if len(forward) > 1 else 0.0
+    return {
+        'host_s': host_s,
+        'messages': board.messages,
+        'pulses': len(pulses),
+        'board_rate': board_rate,
+        'position_ok': board.position['x'] == START
+    }
+
+
+def run_linear(backend_class, dx, dy, feed):
+    """Movimiento coordinado de (dx, dy) pasos a `feed` mm/min; devuelve las medidas"""
+    board = SimulatedBoard(AXES, start_position={'x': START, 'y': START})
+    pins = {axis: AxisPins(*axis_pins) for axis, axis_pins in AXES.items()}
+    backend = backend_class(board, pins)
+
+    move = LinearMove.at_feed(dx, dy, feed, STEPS_PER_MM)
+    backend.move_linear(move)
+
+    # Un tic por paso del eje mayor: n tics ocupan n - 1 periodos entre el primero y el último
+    pulses = sorted(board.step_times(AXES['x'][0]) + board.step_times(AXES['y'][0]))
+    duration = (pulses[-1] - pulses[0]) * move.ticks / (move.ticks - 1)
+    distance = math.hypot(dx / STEPS_PER_MM[0], dy / STEPS_PER_MM[1])
+    return {
+        'feed': distance / duration * 60,
+        'messages': board.messages,
+        'position_ok': (board.position['x'] - START, board.position['y'] - START) == (dx, dy)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--rates', type=float, nargs='+', default=[500, 2000, 8000])
+    parser.add_argument('--feed', type=float, default=600, help="mm/min de las diagonales")
+    args = parser.parse_args()
+
+    # Sin FirmataExpress se usa el PC
+    fallback = create_backend(SimulatedBoard(AXES, using_firmata_express=False), CONFIG)
+    print(f"Firmware sin soporte de motores: backend {fallback.name}")
+
+    print(f"{'backend':>8} {'pasos/s pedidos':>16} {'pasos/s placa':>14} {'tiempo PC (s)':>14} "
+          f"{'mensajes':>9} {'pulsos':>7} {'posición':>9}")
+    for rate in args.rates:
+        for backend_class in (BitBangBackend, FirmataStepperBackend):
+            result = run(backend_class, args.steps, rate)
+            print(f"{backend_class.name:>8} {rate:>16.0f} {result['board_rate']:>14.0f} "
+                  f"{result['host_s']:>14.3f} {result['messages']:>9} {result['pulses']:>7} "
+                  f"{'ok' if result['position_ok'] else 'ERROR':>9}")
+
+    print(f"\n{'backend':>8} {'dx, dy (pasos)':>16} {'mm/min pedidos':>15} {'mm/min placa':>13} "
+          f"{'mensajes':>9} {'posición':>9}")
+    for dx, dy in DIAGONALS:
+        for backend_class in (BitBangBackend, FirmataStepperBackend):
+            result = run_linear(backend_class, dx, dy, args.feed)
+            print(f"{backend_class.name:>8} {f'{dx}, {dy}':>16} {args.feed:>15.0f} "
+                  f"{result['feed']:>13.1f} {result['messages']:>9} "
+                  f"{'ok' if result['position_ok'] else 'ERROR':>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger('BoardSimulator')
+
+class SimulatedBoard:
+    """Placa Arduino simulada con la parte de la API de pymata4 que usa la máquina
+
+    Sustituye a pymata4.Pymata4 en los benchmarks. Cada mensaje ocupa el
+    enlace serie lo que tardan sus bytes a `baud_rate` y la placa lo procesa al
+    recibirlo; mientras mueve un motor con stepper_write (FirmataExpress) no
+    procesa nada más. Guarda los cambios de cada pin salida con el instante en
+    que ocurren en la placa, cuenta los pasos de cada eje según su pin DIR y
+    pone a 0 el final de carrera de home cuando el eje llega a la posición 0,
+    avisando a su callback como hace pymata4.
+    """
+    # Bytes de cada mensaje de pymata4
+    MESSAGE_BYTES = {'digital_write': 3, 'pwm_write': 3, 'set_pin_mode': 3,
+                     'stepper_config': 9, 'stepper_write': 10}
+    PIN_TYPE_PULLUP = 11  # Tipo de pin que pymata4 pasa a los callbacks
+
+    def __init__(self, axes=None, baud_rate=115200, using_firmata_express=True,
+                 start_position=None, write_overhead=20e-6):
+        # axes: {'x': (step, dir, home), ...}
+        self.axes = axes or {}
+        self.baud_rate = baud_rate
+        self.using_firmata_express = using_firmata_express
+        self.write_overhead = write_overhead  # Coste en el PC de cada escritura (s)
+
+        self.pin_values = {}
+        self.pin_modes = {}
+        self.callbacks = {}
+        self.events = []    # (instante, pin, valor) de cada cambio en una salida
+        self.messages = 0   # Mensajes enviados por el PC
+        self.position = {axis: (start_position or {}).get(axis, 0) for axis in self.axes}
+        self._step_axis = {pins[0]: axis for axis, pins in self.axes.items()}
+        for _, _, home_pin in self.axes.values():
+            self.pin_values[home_pin] = self._home_value(home_pin)
+        self._stepper = None
+        self._link_free = 0.0   # Instante en que el enlace queda libre
+        self._board_free = 0.0  # Instante en que la placa termina lo que está haciendo
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def now(self):
+        """Segundos desde que se creó la placa"""
+        return time.perf_counter() - self._origin
+
+    def _receive(self, kind):
+        """Instante en que la placa procesa un mensaje enviado ahora"""
+        if self.write_overhead:
+            end = time.perf_counter() + self.write_overhead
+            while time.perf_counter() < end:
+                pass
+        self.messages += 1
+        sent = self.now()
+        self._link_free = max(self._link_free, sent) + self.MESSAGE_BYTES[kind] * 10 / self.baud_rate
+        return max(self._link_free, self._board_free)
+
+    def set_pin_mode_pwm_output(self, pin):
+        with self._lock:
+            self._receive('set_pin_mode')
+            self.pin_modes[pin] = 'pwm'
+            self.pin_values[pin] = 0
+
+    def set_pin_mode_digital_output(self, pin):
+        with self._lock:
+            self._receive('set_pin_mode')
+            self.pin_modes[pin] = 'output'
+            self.pin_values.setdefault(pin, 0)
+
+    def set_pin_mode_digital_input_pullup(self, pin, callback=None):
+        with self._lock:
+            self._receive('set_pin_mode')
+            self.pin_modes[pin] = 'pullup'
+            self.callbacks[pin] = callback
+            self.pin_values[pin] = self._home_value(pin)
+            if callback is not None:
+                # Firmata informa del estado del pin al activar su reporte
+                callback([self.PIN_TYPE_PULLUP, pin, self.pin_values[pin], self.now()])
+
+    def pwm_write(self, pin, value):
+        with self._lock:
+            self._set(pin, value, self._receive('pwm_write'))
+
+    def digital_write(self, pin, value):
+        with self._lock:
+            self._set(pin, value, self._receive('digital_write'))
+
+    def digital_read(self, pin):
+        """Último valor conocido del pin (pymata4 no pregunta a la placa)"""
+        with self._lock:
+            return [self.pin_values.get(pin, 0), self.now()]
+
+    def set_pin_mode_stepper(self, steps_per_revolution, stepper_pins):
+        with self._lock:
+            self._receive('stepper_config')
+            if not self.using_firmata_express:
+                return  # StandardFirmata ignora los comandos de motores
+            self._stepper = {'steps_per_revolution': steps_per_revolution,
+                             'pins': list(stepper_pins), 'step_number': 0}
+
+    def stepper_write(self, motor_speed, number_of_steps):
+        """Mover el motor como la librería Stepper de Arduino (dos hilos)"""
+        with self._lock:
+            when = self._receive('stepper_write')
+            if self._stepper is None:
+                return
+            stepper = self._stepper
+            pin1, pin2 = stepper['pins'][:2]
+            delay = int(60 * 1000 * 1000 / stepper['steps_per_revolution'] / motor_speed) / 1e6
+            forward = number_of_steps > 0
+            for _ in range(abs(number_of_steps)):
+                when += delay
+                if forward:
+                    stepper['step_number'] = (stepper['step_number'] + 1) % stepper['steps_per_revolution']
+                else:
+                    stepper['step_number'] = (stepper['step_number'] - 1) % stepper['steps_per_revolution']
+                phase = stepper['step_number'] % 4
+                self._set(pin1, (0, 1, 1, 0)[phase], when)
+                self._set(pin2, (1, 1, 0, 0)[phase], when)
+            self._board_free = when
+
+    def shutdown(self):
+        pass
+
+    def _set(self, pin, value, when):
+        """Cambiar una salida en el instante `when` de la placa"""
+        previous = self.pin_values.get(pin, 0)
+        if value == previous:
+            return
+        self.pin_values[pin] = value
+        self.events.append((when, pin, value))
+
+        # Flanco de subida en STEP: un paso en el sentido que marca DIR
+        axis = self._step_axis.get(pin)
+        if axis is not None and value == 1:
+            direction_pin, home_pin = self.axes[axis][1:]
+            self.position[axis] += 1 if self.pin_values.get(direction_pin, 0) else -1
+            home = self._home_value(home_pin)
+            if home != self.pin_values.get(home_pin):
+                self.pin_values[home_pin] = home
+                callback = self.callbacks.get(home_pin)
+                if callback is not None:
+                    callback([self.PIN_TYPE_PULLUP, home_pin, home, when])
+
+    def _home_value(self, pin):
+        """Final de carrera (activo en bajo) del eje que usa el pin"""
+        for axis, (_, _, home_pin) in self.axes.items():
+            if home_pin == pin:
+                return 0 if self.position[axis] <= 0 else 1
+        return 1
+
+    def step_times(self, pin):
+        """Instantes de los flancos de subida de un pin"""
+        return [when for when, event_pin, value in self.events if event_pin == pin and value == 1]
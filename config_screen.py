@@ -4,12 +4,13 @@ import json
 import os
 from PIL import Image, ImageTk
 from config_manager import ConfigManager
+from motion_planner import DEFAULT_MAX_FEED, DEFAULT_MAX_ACCEL, DEFAULT_JUNCTION_DEVIATION
 
 class ConfigScreen:
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("ARLA PWM - Configuración")
-        self.root.geometry("900x700")
+        self.root.geometry("900x800")
         self.root.configure(bg='#1e1e1e')
         
         # Estilo mejorado
@@ -200,6 +201,37 @@ class ConfigScreen:
         self.laser_type = ttk.Entry(row3, width=30)
         self.laser_type.pack(side='left')
         
+        # Cuarta fila: límites de movimiento por eje
+        row4 = ttk.Frame(machine_frame, style="Config.TFrame")
+        row4.pack(fill='x', pady=5)
+        
+        ttk.Label(row4, text="Vel. máx. X (mm/min):", style="Subtitle.TLabel").pack(side='left', padx=5)
+        self.max_feed_x = ttk.Entry(row4, width=8, validate='key', validatecommand=vcmd)
+        self.max_feed_x.pack(side='left', padx=(0,20))
+        
+        ttk.Label(row4, text="Vel. máx. Y (mm/min):", style="Subtitle.TLabel").pack(side='left', padx=5)
+        self.max_feed_y = ttk.Entry(row4, width=8, validate='key', validatecommand=vcmd)
+        self.max_feed_y.pack(side='left')
+        
+        # Quinta fila: aceleraciones y desviación en esquinas
+        row5 = ttk.Frame(machine_frame, style="Config.TFrame")
+        row5.pack(fill='x', pady=5)
+        
+        ttk.Label(row5, text="Acel. X (mm/s²):", style="Subtitle.TLabel").pack(side='left', padx=5)
+        self.max_accel_x = ttk.Entry(row5, width=8, validate='key', validatecommand=vcmd)
+        self.max_accel_x.pack(side='left', padx=(0,20))
+        
+        ttk.Label(row5, text="Acel. Y (mm/s²):", style="Subtitle.TLabel").pack(side='left', padx=5)
+        self.max_accel_y = ttk.Entry(row5, width=8, validate='key', validatecommand=vcmd)
+        self.max_accel_y.pack(side='left', padx=(0,20))
+        
+        ttk.Label(row5, text="Desviación esquinas (mm):", style="Subtitle.TLabel").pack(side='left', padx=5)
+        self.junction_deviation = ttk.Entry(row5, width=8, validate='key', validatecommand=vcmd)
+        self.junction_deviation.pack(side='left')
+        
+        # Valores por defecto hasta que se cargue una configuración
+        self.load_motion_fields({})
+        
         # Nota sobre pasos/mm
         note_frame = ttk.Frame(machine_frame, style="Config.TFrame")
         note_frame.pack(fill='x', pady=10)
@@ -228,7 +260,7 @@ class ConfigScreen:
             self.length.get(), self.width.get(), 
             self.steps_x.get(), self.steps_y.get(),
             self.machine_name.get(), self.laser_type.get()
-        ]):
+        ] + [entry.get() for entry, _, _ in self.motion_fields()]):
             messagebox.showerror("Error", "Todos los campos son obligatorios")
             return
         
@@ -247,6 +279,11 @@ class ConfigScreen:
             messagebox.showerror("Error", "Las dimensiones y pasos deben ser números")
             return
         
+        # Validar límites de movimiento (el validador de teclas ya garantiza números)
+        if any(float(entry.get()) <= 0 for entry, _, _ in self.motion_fields()):
+            messagebox.showerror("Error", "Las velocidades, aceleraciones y la desviación deben ser mayores que 0")
+            return
+        
         # Crear el diccionario de configuración
         config_data = {
             'x_dir': self.x_dir.get(),
@@ -265,6 +302,8 @@ class ConfigScreen:
             'machine_name': self.machine_name.get(),
             'laser_type': self.laser_type.get()
         }
+        for entry, key, _ in self.motion_fields():
+            config_data[key] = entry.get()
         
         # Guardar en el archivo
         configs = {'machines': {}}
@@ -312,9 +351,26 @@ class ConfigScreen:
                 self.steps_y.insert(0, config['steps_y'])
                 self.machine_name.insert(0, config['machine_name'])
                 self.laser_type.insert(0, config['laser_type'])
+                self.load_motion_fields(config)
             except:
                 pass
 
+    def motion_fields(self):
+        """Campos de límites de movimiento: (entrada, clave, valor por defecto)"""
+        return [
+            (self.max_feed_x, 'max_feed_x', DEFAULT_MAX_FEED),
+            (self.max_feed_y, 'max_feed_y', DEFAULT_MAX_FEED),
+            (self.max_accel_x, 'max_accel_x', DEFAULT_MAX_ACCEL),
+            (self.max_accel_y, 'max_accel_y', DEFAULT_MAX_ACCEL),
+            (self.junction_deviation, 'junction_deviation', DEFAULT_JUNCTION_DEVIATION)
+        ]
+
+    def load_motion_fields(self, config):
+        """Rellenar los límites de movimiento (las configuraciones antiguas no los tienen)"""
+        for entry, key, default in self.motion_fields():
+            entry.delete(0, tk.END)
+            entry.insert(0, config.get(key, f"{default:g}"))
+
     def run(self):
         self.root.mainloop()
 
@@ -361,6 +417,7 @@ class ConfigScreen:
                     self.steps_y.insert(0, config['steps_y'])
                     self.machine_name.insert(0, config['machine_name'])
                     self.laser_type.insert(0, config['laser_type'])
+                    self.load_motion_fields(config)
             except:
                 pass
 
@@ -380,6 +437,8 @@ class ConfigScreen:
         self.steps_y.delete(0, tk.END)
         self.machine_name.delete(0, tk.END)
         self.laser_type.delete(0, tk.END)
+        for entry, _, _ in self.motion_fields():
+            entry.delete(0, tk.END)
 
 if __name__ == "__main__":
     app = ConfigScreen()
@@ -2,331 +2,1224 @@ import logging
 import numpy as np
 from PIL import Image
 import cv2
-import re
 import math
+import os
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 from datetime import datetime
+from toolpath_optimizer import ToolpathOptimizer
+from job_estimator import JobEstimator
+from tiled_image import TiledImage, ContourStitcher
+from image_pipeline import ImagePipeline, resample_area
+from generation_report import GenerationReport
+from material_manager import DEFAULT_FILL_DIRECTION
+from toolpath_cache import CachedToolpaths, ToolpathCache, image_digest, make_key
 
 logger = logging.getLogger('GCodeGenerator')
 
+# Filas grabadas procesadas por bloque al extraer segmentos (limita memoria temporal)
+RUN_BAND_ROWS = 256
+
+# Umbral de gris: por encima es blanco (igual que cv2.THRESH_BINARY con 127)
+FILL_THRESHOLD = 127
+
+# Ancho y alto con los que se graba cada PCB (mm), sea cual sea el tamaño de la imagen
+TARGET_SIZE = (80, 50)  # (120 - 40 mm, 70 - 20 mm)
+
+def find_black_runs(binary):
+    """Encontrar todos los segmentos negros de una imagen binaria en una sola pasada
+
+    Devuelve tres arrays (filas, inicios, finales) con un elemento por segmento,
+    ordenados por fila y luego por columna. El final es exclusivo, igual que
+    en los segmentos (inicio, fin) del recorrido píxel a píxel anterior.
+    """
+    binary = np.asarray(binary)
+    if binary.ndim == 1:
+        binary = binary[np.newaxis, :]
+    
+    height, width = binary.shape
+    
+    # Marcar píxeles negros con un borde blanco a cada lado
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = binary == 0
+    
+    # +1 donde empieza un segmento negro, -1 donde termina
+    transitions = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(transitions == 1)
+    _, ends = np.nonzero(transitions == -1)
+    
+    return rows.astype(np.int32), starts.astype(np.int32), ends.astype(np.int32)
+
+def quantize_levels(gray, levels):
+    """Nivel de potencia de cada píxel: 0 (blanco, apagado) a `levels` (negro)"""
+    darkness = 255 - np.asarray(gray, dtype=np.uint16)
+    return ((darkness * levels + 127) // 255).astype(np.uint16)
+
+def find_level_runs(quantized):
+    """Encontrar los segmentos de nivel constante distinto de cero en una pasada
+
+    Devuelve cuatro arrays (filas, inicios, finales, niveles) con un elemento
+    por segmento, ordenados por fila y luego por columna. Los píxeles vecinos
+    con el mismo nivel forman un único segmento.
+    """
+    quantized = np.asarray(quantized)
+    if quantized.ndim == 1:
+        quantized = quantized[np.newaxis, :]
+    
+    height, width = quantized.shape
+    
+    # Nivel 0 a cada lado para que toda fila empiece y termine apagada
+    padded = np.zeros((height, width + 2), dtype=quantized.dtype)
+    padded[:, 1:-1] = quantized
+    
+    # Cada cambio de nivel cierra un segmento y abre el siguiente
+    rows, cuts = np.nonzero(padded[:, 1:] != padded[:, :-1])
+    same_row = rows[1:] == rows[:-1]
+    starts = cuts[:-1][same_row]
+    ends = cuts[1:][same_row]
+    rows = rows[:-1][same_row]
+    values = quantized[rows, starts]
+    
+    lit = values != 0
+    return (rows[lit].astype(np.int32), starts[lit].astype(np.int32),
+            ends[lit].astype(np.int32), values[lit])
+
+def _band_runs(gray, band_start, band_stop, levels=None):
+    """Segmentos de un bloque de filas en escala de grises (o ya binarizado)
+
+    Sin `levels` son los segmentos negros tras el umbral; con `levels` son los
+    segmentos de nivel de potencia constante (con su nivel como cuarto array).
+    """
+    if levels is None:
+        block = gray[band_start:band_stop]
+        binary = block if block.dtype == bool else block > FILL_THRESHOLD
+        rows, starts, ends = find_black_runs(binary)
+        return rows + band_start, starts, ends
+    
+    rows, starts, ends, values = find_level_runs(quantize_levels(gray[band_start:band_stop], levels))
+    return rows + band_start, starts, ends, values
+
+def _resampled_band_runs(source, height, size, band_start, band_stop, levels=None):
+    """Remuestrear las filas grabadas [band_start, band_stop) y extraer sus segmentos (proceso hijo)
+
+    `source` es una TiledImage, que se lee de su archivo, o (nombre, forma) de
+    la escala de grises completa en memoria compartida.
+    """
+    if not isinstance(source, tuple):
+        band = resample_area(source.read_rows, height, size, source.strip_rows,
+                             rows=(band_start, band_stop))
+    else:
+        shm = shared_memory.SharedMemory(name=source[0])
+        try:
+            gray = np.ndarray(source[1], dtype=np.uint8, buffer=shm.buf)
+            band = resample_area(lambda start, stop: gray[start:stop], height, size,
+                                 rows=(band_start, band_stop))
+            del gray
+        finally:
+            shm.close()
+    result = _band_runs(band, 0, len(band), levels)
+    return (result[0] + band_start,) + result[1:]
+
+def panel_offsets(panel):
+    """Desplazamientos (mm) de las copias de un panel en el orden de grabado
+
+    `panel` es una rejilla {'rows', 'cols', 'pitch': (x, y)} que se recorre en
+    serpentina (las filas impares de derecha a izquierda) o una lista
+    {'offsets': [(x, y), ...]} que se recorre yendo siempre a la copia más
+    cercana, empezando por la primera. Sin panel hay una sola copia en (0, 0).
+    """
+    if not panel:
+        return [(0.0, 0.0)]
+    
+    if 'offsets' in panel:
+        remaining = [(float(x), float(y)) for x, y in panel['offsets']]
+        if not remaining:
+            raise ValueError("El panel no tiene copias")
+        ordered = [remaining.pop(0)]
+        while remaining:
+            last_x, last_y = ordered[-1]
+            nearest = min(range(len(remaining)),
+                          key=lambda i: math.hypot(remaining[i][0] - last_x,
+                                                   remaining[i][1] - last_y))
+            ordered.append(remaining.pop(nearest))
+        return ordered
+    
+    rows, cols = int(panel.get('rows', 1)), int(panel.get('cols', 1))
+    pitch = panel.get('pitch', 0)
+    pitch_x, pitch_y = (pitch, pitch) if np.isscalar(pitch) else pitch
+    if rows < 1 or cols < 1:
+        raise ValueError(f"Rejilla de panel no válida: {rows}x{cols}")
+    
+    offsets = []
+    for row in range(rows):
+        columns = range(cols) if row % 2 == 0 else range(cols - 1, -1, -1)
+        offsets.extend((col * float(pitch_x), row * float(pitch_y)) for col in columns)
+    return offsets
+
+def engraved_size(rotation=0):
+    """Ancho y alto (mm) que ocupa en la máquina un PCB grabado con esa rotación"""
+    width, height = TARGET_SIZE
+    return (height, width) if int(rotation) % 180 == 90 else (width, height)
+
+class GenerationCancelled(Exception):
+    """La generación se interrumpió porque se activó el testigo de cancelación"""
+
+# Tipos de movimiento del toolpath
+MOVE_RAPID = 0
+MOVE_CUT = 1
+
+# Un movimiento: destino en mm, velocidad (mm/min), potencia (S) y tipo
+MOVE_DTYPE = np.dtype([
+    ('x', np.float64),
+    ('y', np.float64),
+    ('feed', np.float32),
+    ('power', np.uint16),
+    ('kind', np.uint8)
+])
+
+class Toolpath:
+    """Representación intermedia de un recorrido: array estructurado de movimientos
+
+    Los movimientos se agrupan en tramos continuos; `offsets` guarda el índice
+    del primer movimiento de cada tramo. Cada tramo empieza con un movimiento
+    rápido hasta su inicio seguido de uno o más movimientos de grabado.
+    `label` indica el origen del recorrido ('outline', 'fill' o 'grayscale').
+    """
+    def __init__(self, moves, offsets, label):
+        self.moves = moves
+        self.offsets = offsets
+        self.label = label
+    
+    def __len__(self):
+        return len(self.moves)
+    
+    @classmethod
+    def from_polylines(cls, polylines, feed, rapid_feed, power, label, closed=False):
+        """Crear toolpath a partir de polilíneas Nx2 en mm"""
+        if closed:
+            polylines = [np.vstack((p, p[:1])) for p in polylines]
+        if not polylines:
+            return cls(np.zeros(0, dtype=MOVE_DTYPE), np.zeros(0, dtype=np.int64), label)
+        
+        lengths = np.array([len(p) for p in polylines])
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        points = np.concatenate(polylines)
+        
+        moves = np.empty(len(points), dtype=MOVE_DTYPE)
+        moves['x'] = points[:, 0]
+        moves['y'] = points[:, 1]
+        moves['feed'] = feed
+        moves['power'] = power
+        moves['kind'] = MOVE_CUT
+        moves['feed'][offsets] = rapid_feed
+        moves['kind'][offsets] = MOVE_RAPID
+        
+        return cls(moves, offsets, label)
+    
+    @classmethod
+    def from_segments(cls, x1, x2, y, feed, rapid_feed, power, label):
+        """Crear toolpath de segmentos horizontales (rápido a x1, grabado hasta x2)"""
+        moves = np.empty(2 * len(x1), dtype=MOVE_DTYPE)
+        moves['x'][0::2] = x1
+        moves['x'][1::2] = x2
+        moves['y'][0::2] = y
+        moves['y'][1::2] = y
+        moves['feed'][0::2] = rapid_feed
+        moves['feed'][1::2] = feed
+        moves['power'] = power
+        moves['kind'][0::2] = MOVE_RAPID
+        moves['kind'][1::2] = MOVE_CUT
+        
+        return cls(moves, np.arange(0, len(moves), 2, dtype=np.int64), label)
+    
+    @classmethod
+    def from_runs(cls, x1, x2, y, power, feed, rapid_feed, label):
+        """Crear toolpath de segmentos horizontales con potencia propia
+
+        Un segmento que empieza donde terminó el anterior en la misma fila se
+        graba a continuación sin apagar el láser, solo cambia la potencia.
+        """
+        joined = np.zeros(len(x1), dtype=bool)
+        joined[1:] = (y[1:] == y[:-1]) & (x1[1:] == x2[:-1])
+        
+        # Cada segmento suelto añade un rápido antes de su movimiento de grabado
+        cut_index = np.cumsum(np.where(joined, 1, 2)) - 1
+        rapid_index = cut_index[~joined] - 1
+        
+        moves = np.empty(len(x1) + int((~joined).sum()), dtype=MOVE_DTYPE)
+        moves['x'][cut_index] = x2
+        moves['y'][cut_index] = y
+        moves['feed'][cut_index] = feed
+        moves['power'][cut_index] = power
+        moves['kind'][cut_index] = MOVE_CUT
+        moves['x'][rapid_index] = x1[~joined]
+        moves['y'][rapid_index] = y[~joined]
+        moves['feed'][rapid_index] = rapid_feed
+        moves['power'][rapid_index] = power[~joined]
+        moves['kind'][rapid_index] = MOVE_RAPID
+        
+        return cls(moves, rapid_index.astype(np.int64), label)
+    
+    def transformed(self, matrix, offset):
+        """Copia del toolpath con la transformación afín p' = matrix @ p + offset"""
+        (a, b), (c, d) = matrix
+        moves = self.moves.copy()
+        x = self.moves['x']
+        y = self.moves['y']
+        moves['x'] = a * x + b * y + offset[0]
+        moves['y'] = c * x + d * y + offset[1]
+        return Toolpath(moves, self.offsets, self.label)
+    
+    def quantized(self, steps_x, steps_y):
+        """Copia con las coordenadas en la rejilla de pasos del motor
+
+        Trabaja en pasos enteros: elimina los grabados que quedan de longitud
+        cero, los puntos intermedios alineados (mismo sentido, velocidad y
+        potencia) y los tramos que se quedan sin grabado. Devuelve el toolpath
+        y el número de movimientos eliminados.
+        """
+        moves = self.moves
+        ix = np.rint(moves['x'] * steps_x).astype(np.int64)
+        iy = np.rint(moves['y'] * steps_y).astype(np.int64)
+        cut = moves['kind'] == MOVE_CUT
+        
+        # Grabados que no avanzan ningún paso (el primero de cada tramo es rápido)
+        keep = np.ones(len(moves), dtype=bool)
+        keep[1:] = ~cut[1:] | (ix[1:] != ix[:-1]) | (iy[1:] != iy[:-1])
+        
+        # Puntos alineados con el anterior y el siguiente que se conservan
+        kept = np.flatnonzero(keep)
+        kx, ky, kcut = ix[kept], iy[kept], cut[kept]
+        dx1, dy1 = kx[1:-1] - kx[:-2], ky[1:-1] - ky[:-2]
+        dx2, dy2 = kx[2:] - kx[1:-1], ky[2:] - ky[1:-1]
+        feed, power = moves['feed'][kept], moves['power'][kept]
+        collinear = (kcut[1:-1] & kcut[2:]
+                     & (dx1 * dy2 == dy1 * dx2) & (dx1 * dx2 + dy1 * dy2 > 0)
+                     & (feed[1:-1] == feed[2:]) & (power[1:-1] == power[2:]))
+        keep[kept[1:-1][collinear]] = False
+        
+        # Tramos sin ningún grabado: se quita también su movimiento rápido
+        has_cut = np.add.reduceat((keep & cut).astype(np.int64), self.offsets) > 0
+        keep[self.offsets[~has_cut]] = False
+        
+        result = moves[keep]
+        result['x'] = ix[keep] / steps_x
+        result['y'] = iy[keep] / steps_y
+        offsets = (np.cumsum(keep) - 1)[self.offsets[has_cut]]
+        return Toolpath(result, offsets, self.label), int(len(moves) - len(result))
+    
+    @classmethod
+    def concatenate(cls, toolpaths, label=None):
+        """Unir varios toolpaths en uno solo"""
+        toolpaths = list(toolpaths)
+        if label is None:
+            label = toolpaths[0].label if toolpaths else None
+        if not toolpaths:
+            return cls(np.zeros(0, dtype=MOVE_DTYPE), np.zeros(0, dtype=np.int64), label)
+        
+        starts = np.cumsum([0] + [len(t) for t in toolpaths[:-1]])
+        moves = np.concatenate([t.moves for t in toolpaths])
+        offsets = np.concatenate([t.offsets + start for t, start in zip(toolpaths, starts)])
+        return cls(moves, offsets, label)
+    
+    def paths(self):
+        """Recorrer los tramos como vistas del array de movimientos"""
+        bounds = self.offsets.tolist() + [len(self.moves)]
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            yield self.moves[first:last]
+
 class GCodeGenerator:
-    def __init__(self):
+    def __init__(self, optimize_order=True, two_opt=True, order_time_budget=2.0,
+                 simplify=True, spot_size=0.1, workers=None, use_cache=True, profile=False,
+                 quantize=True):
         self.ARLA_HEADER = ";ARLA-GCODE-V1.0"
         self.MAX_RAPID_SPEED = 2000  # Límite máximo seguro para G0
+        self.DEFAULT_POWER_LEVELS = 16  # Niveles de potencia en escala de grises
+        self.LINE_SPACING = 0.2  # Espaciado entre líneas de relleno si el material no lo define (mm)
+        self.CANNY_THRESHOLDS = (100, 200)  # Umbrales de detección de bordes
+        self.TARGET_WIDTH, self.TARGET_HEIGHT = TARGET_SIZE  # Tamaño grabado en mm
+        self.STATS_FIELDS = ['total_lines', 'estimated_time', 'total_distance',
+                             'travel_saved', 'outline_rapid']
+        self.stats = GCodeStats()
+        self.estimator = JobEstimator()
+        
+        # Orden de contornos para minimizar movimientos rápidos
+        self.optimize_order = optimize_order
+        self.two_opt = two_opt
+        self.order_time_budget = order_time_budget  # Segundos para la mejora 2-opt
+        
+        # Coordenadas en la rejilla de pasos de los motores (pasos/mm de la máquina)
+        self.quantize = quantize
+        
+        # Simplificación de contornos según resolución de la máquina
+        self.simplify = simplify
+        self.spot_size = spot_size  # Diámetro del punto láser (mm)
+        
+        # Procesos para el relleno (None = uno por CPU, 1 = sin paralelismo)
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.PARALLEL_MIN_PIXELS = 16_000_000  # Píxeles de origen por debajo de los que no compensa
+        
+        # Filas extra leídas arriba y abajo de cada franja al detectar bordes
+        self.TILE_MARGIN = 2
+        
+        # Geometría ya generada para la misma imagen y parámetros
+        self.cache = ToolpathCache() if use_cache else None
+        
+        # Tiempos por etapa de la última generación (y perfil con cProfile si se pide)
+        self.profile = profile
+        self.report = GenerationReport()
+        self.last_stats = None  # Estadísticas del último archivo generado
+        
+        # Progreso y cancelación de la generación en curso
+        self.PROGRESS_LINES = 4096  # Líneas escritas entre avisos de progreso
+        self._start_progress(None, None, 1)
     
-    def generate(self, data, output_path):
-        """Generar archivo G-code ARLA"""
+    def generate(self, data, output_path, progress=None, cancel=None):
+        """Generar archivo G-code ARLA
+
+        Los tiempos por etapa quedan en `self.report` y se resumen en la cabecera.
+        `progress(etapa, porcentaje, movimientos)` se llama desde el hilo que
+        genera; si `cancel` (threading.Event) se activa, la generación se
+        detiene, se borra el archivo a medias y se devuelve False.
+        """
+        self._start_progress(progress, cancel,
+                             2 if data.get('material', {}).get('engrave_type') == 'mixed' else 1)
+        self.report = GenerationReport()
+        self.last_stats = None
+        self.report.start(self.profile)
         try:
             # Verificar datos
             if not self._validate_data(data):
                 return False
             
             # Obtener velocidades (la de grabado ya viene del material)
-            engrave_speed = int(data['material']['speed'])
-            rapid_speed = min(engrave_speed * 2, self.MAX_RAPID_SPEED)  # G0 al doble de velocidad, con límite
-            
-            # Iniciar G-code con metadata
-            gcode_lines = [
-                self.ARLA_HEADER,
-                f";Material: {data['material']['name']}",
-                f";Engrave Speed: {engrave_speed}",
-                f";Rapid Speed: {rapid_speed}",
-                f";Power: {data['material']['power']}",
-                f";Type: {data['material']['engrave_type']}",
-                f";Position: X={data['position']['x']:.3f} Y={data['position']['y']:.3f}",
-                f";Image Size: {data['image'].size[0]}x{data['image'].size[1]} px",
-                f";Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-                "",
-                "G90 ; Coordenadas absolutas",
-                "M5  ; Láser apagado",
-                f"G0 F{rapid_speed} ; Velocidad para movimientos rápidos",
-                ""
-            ]
-            
-            # Generar según tipo
-            if data['material']['engrave_type'] == 'outline':
-                type_gcode = self._generate_outline(data)
-            elif data['material']['engrave_type'] == 'fill':
-                type_gcode = self._generate_fill(data)
-            else:
-                type_gcode = self._generate_mixed(data)
+            engrave_speed, rapid_speed = self._speeds(data)
             
-            # Añadir estadísticas
-            stats = self._calculate_stats(type_gcode)
-            gcode_lines.extend([
-                "",
-                f";Total Lines: {stats['total_lines']}",
-                f";Estimated Time: {stats['estimated_time']:.2f} min",
-                f";Total Distance: {stats['total_distance']:.2f} mm",
-                ""
-            ])
+            # Estadísticas y tiempo estimado, se acumulan mientras se genera
+            self.stats = GCodeStats()
+            self.estimator = JobEstimator.from_config(data['machine_config'])
             
-            # Añadir código generado
-            gcode_lines.extend(type_gcode)
+            # Generar según tipo (generadores, el cuerpo no se guarda en memoria)
+            type_gcode = self._generate_type(data)
             
-            # Añadir footer
-            gcode_lines.extend([
-                "",
-                "M5 ; Láser apagado",
-                "G0 X0 Y0 ; Volver a origen",
-                f";End of ARLA-GCODE - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            ])
-            
-            # Guardar archivo
             with open(output_path, 'w') as f:
-                f.write('\n'.join(gcode_lines))
+                writer = GCodeWriter(f, report=self.report)
+                
+                # Iniciar G-code con metadata
+                writer.write_lines([
+                    self.ARLA_HEADER,
+                    f";Material: {data['material']['name']}",
+                    f";Engrave Speed: {engrave_speed}",
+                    f";Rapid Speed: {rapid_speed}",
+                    f";Power: {data['material']['power']}",
+                    f";Type: {data['material']['engrave_type']}",
+                    f";Position: X={data['position']['x']:.3f} Y={data['position']['y']:.3f}",
+                    f";Rotation: {int(data.get('rotation', 0)) % 360}",
+                    *self._panel_header(data),
+                    f";Image Size: {data['image'].size[0]}x{data['image'].size[1]} px",
+                    f";Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                    "",
+                    "G90 ; Coordenadas absolutas",
+                    "M5  ; Láser apagado",
+                    f"G0 F{rapid_speed} ; Velocidad para movimientos rápidos",
+                    "",
+                    ""
+                ])
+                
+                # Reservar las estadísticas y los tiempos, se conocen al terminar el cuerpo
+                for name in self.STATS_FIELDS:
+                    writer.reserve(name)
+                for name, _ in self.report.summary_lines():
+                    writer.reserve(name, width=160 if name == 'timing_counts' else 64)
+                writer.write("")
+                
+                # Escribir código generado a medida que se produce
+                serializer = GCodeSerializer()
+                for item in self.report.iterate('geometry', type_gcode):
+                    self._check_cancelled()
+                    if not isinstance(item, Toolpath):
+                        self.stats.total_lines += 1
+                        writer.write(item)
+                        continue
+                    
+                    moves = item.moves
+                    self.report.count('toolpaths')
+                    self.report.count('moves', len(moves))
+                    with self.report.stage('estimate'):
+                        self.estimator.add_moves(moves['x'], moves['y'], moves['feed'],
+                                                 moves['kind'] == MOVE_CUT)
+                    
+                    # El progreso avanza con las líneas escritas hasta lo que cubre el toolpath
+                    start, end = self._done, self._target
+                    expected = len(moves) + 2 * len(item.offsets)
+                    written = 0
+                    with self.report.stage('serialize'):
+                        for line in serializer.lines(item):
+                            self.stats.total_lines += 1
+                            writer.write(line)
+                            written += 1
+                            if written % self.PROGRESS_LINES == 0:
+                                self._check_cancelled()
+                                self._emitted += self.PROGRESS_LINES
+                                self._notify(item.label,
+                                             start + (end - start) * min(1.0, written / expected))
+                    self._emitted += written % self.PROGRESS_LINES
+                    self._notify(item.label, end)
+                
+                # Añadir footer
+                writer.write_lines([
+                    "",
+                    "M5 ; Láser apagado",
+                    "G0 X0 Y0 ; Volver a origen",
+                    f";End of ARLA-GCODE - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                ])
+                self.estimator.add_moves([0.0], [0.0], rapid_speed, False)
+                
+                # Completar estadísticas en la cabecera
+                with self.report.stage('estimate'):
+                    stats = self._calculate_stats()
+                self.last_stats = stats
+                for name, text in self._format_stats(stats):
+                    writer.patch(name, text)
+                writer.flush()
+                
+                # Completar tiempos (la escritura de esta última parte ya no cuenta)
+                self.report.count('lines', self.stats.total_lines)
+                self.report.stop()
+                for name, text in self.report.summary_lines():
+                    writer.patch(name, text[:writer.width(name)])
+                writer.flush()
             
+            self._section = self._sections - 1
+            self._notify('finish', 1.0)
+            removed = self.report.counts.get('quantize_removed', 0)
+            if removed:
+                logger.info(f"Rejilla de pasos: {removed} movimientos eliminados")
+            logger.info(f"G-code generado en {self.report.total:.3f} s: " + ", ".join(
+                f"{name} {seconds:.3f} s" for name, seconds in self.report.stages.items()))
             return True
             
+        except GenerationCancelled:
+            logger.info("Generación de G-code cancelada")
+            try:
+                os.remove(output_path)
+            except OSError:
+                pass
+            return False
+            
         except Exception as e:
             logger.error(f"Error generando G-code: {e}")
             return False
+        finally:
+            self.report.stop()
+    
+    def build_toolpaths(self, data):
+        """Generar los toolpaths del trabajo sin escribir G-code (uno por sección)"""
+        self.stats = GCodeStats()
+        self.report = GenerationReport()
+        self.report.start(self.profile)
+        self._start_progress(None, None, 1)
+        
+        sections = {}
+        try:
+            for item in self.report.iterate('geometry', self._generate_type(data)):
+                if isinstance(item, Toolpath):
+                    sections.setdefault(item.label, []).append(item)
+        finally:
+            self.report.stop()
+        
+        return [Toolpath.concatenate(chunks) for chunks in sections.values()]
+    
+    def _start_progress(self, callback, cancel, sections):
+        """Preparar el seguimiento de progreso y el testigo de cancelación"""
+        self._progress = callback
+        self._cancel = cancel
+        self._sections = sections
+        self._section = -1     # Sección en curso
+        self._done = 0.0       # Parte de la sección ya escrita
+        self._target = 0.0     # Parte de la sección escrita al terminar el toolpath siguiente
+        self._emitted = 0      # Líneas de G-code de movimientos escritas
+        self._copy = 0         # Copia del panel en curso dentro de la sección
+        self._copies = 1       # Copias del panel (cada una es una parte igual de la sección)
+    
+    def _check_cancelled(self):
+        """Interrumpir la generación si se pidió cancelarla"""
+        if self._cancel is not None and self._cancel.is_set():
+            raise GenerationCancelled()
+    
+    def _reached(self, stage, fraction):
+        """Avisar del progreso: `fraction` de la copia en curso ya está hecha"""
+        self._notify(stage, (self._copy + fraction) / self._copies)
+    
+    def _notify(self, stage, done):
+        """Avisar del progreso: la parte `done` de la sección en curso ya está hecha"""
+        self._done = done
+        if self._progress is not None:
+            percent = 100.0 * (max(self._section, 0) + done) / self._sections
+            self._progress(stage, min(percent, 100.0), self._emitted)
+    
+    def _advance(self, fraction):
+        """Marcar qué parte de la copia estará hecha al escribir el toolpath siguiente"""
+        self._target = (self._copy + fraction) / self._copies
+        self._check_cancelled()
+    
+    def _generate_type(self, data):
+        """Seleccionar el generador según el tipo de grabado"""
+        # Todas las secciones comparten el mismo preprocesado de la imagen
+        data = self._shared_image(data)
+        if data['material']['engrave_type'] == 'outline':
+            return self._generate_outline(data)
+        elif data['material']['engrave_type'] in ('fill', 'grayscale'):
+            return self._generate_fill(data)
+        return self._generate_mixed(data)
+    
+    def _shared_image(self, data):
+        """Datos con la imagen envuelta en un ImagePipeline (si no lo está ya)"""
+        if isinstance(data['image'], (TiledImage, ImagePipeline)):
+            return data
+        return dict(data, image=ImagePipeline(data['image']))
     
     def _generate_outline(self, data):
-        """Generar G-code para contorno"""
+        """Generar toolpath de contorno"""
+        yield from self._placed(data, 'outline', self._outline_geometry)
+    
+    def _generate_fill(self, data):
+        """Generar toolpath de relleno (o de escala de grises)"""
+        section = 'grayscale' if data['material']['engrave_type'] == 'grayscale' else 'fill'
+        yield from self._placed(data, section, self._fill_geometry)
+    
+    def _placed(self, data, section, build):
+        """Geometría de una sección (de la caché si ya existe) colocada en el trabajo
+
+        La geometría se genera en mm relativos a la esquina del PCB y con la
+        potencia como nivel (1 = potencia del material). La posición, las
+        velocidades y la potencia se aplican al emitirla, así que cambiarlas
+        no obliga a regenerar. En un panel la geometría se genera una vez y
+        se emite desplazada para cada copia.
+        """
+        offsets = panel_offsets(data.get('panel'))
+        self._section += 1
+        self._copy, self._copies = 0, len(offsets)
+        self._target = 0.0
+        self._reached(section, 0.0)
         try:
-            logger.debug("Iniciando generación de outline")
-            
-            # Obtener imagen y sus dimensiones en píxeles
-            image = data['image']
-            img_width, img_height = image.size
-            logger.debug(f"Tamaño en píxeles: {img_width}x{img_height}")
-            
-            # Obtener posición inicial en la cuadrícula (mm)
-            start_x = float(data['position']['x'])
-            start_y = float(data['position']['y'])
-            logger.debug(f"Posición inicial en cuadrícula (mm): ({start_x}, {start_y})")
-            
-            # Dimensiones deseadas en mm
-            target_width = 80   # 120 - 40 mm
-            target_height = 50  # 70 - 20 mm
-            
-            # Calcular factores de escala (píxeles a mm)
-            scale_x = target_width / img_width
-            scale_y = target_height / img_height
-            logger.debug(f"Factores de escala: X={scale_x:.3f}, Y={scale_y:.3f}")
-            
-            # Convertir a escala de grises
-            if image.mode != 'L':
-                image = image.convert('L')
-            
-            # Convertir a array numpy
-            img_array = np.array(image)
-            img_array = img_array.astype(np.uint8)
+            with self.report.stage('cache'):
+                key = self._cache_key(data, section) if self.cache is not None else None
+                entry = self.cache.get(key) if key else None
             
-            # Detectar bordes
-            edges = cv2.Canny(img_array, 100, 200)
-            
-            # Encontrar contornos
-            contours, _ = cv2.findContours(edges, 
-                                         cv2.RETR_EXTERNAL, 
-                                         cv2.CHAIN_APPROX_SIMPLE)
-            
-            logger.debug(f"Contornos encontrados: {len(contours)}")
-            
-            # Generar G-code
-            gcode_lines = []
-            
-            for i, contour in enumerate(contours):
-                # Mover a inicio de contorno
-                x = float(contour[0][0][0]) * scale_x
-                y = float(contour[0][0][1]) * scale_y
-                
-                # Coordenadas absolutas desde la posición inicial
-                abs_x = start_x + x
-                abs_y = start_y + y
-                
-                gcode_lines.extend([
-                    f"G0 X{abs_x:.3f} Y{abs_y:.3f} ; Inicio contorno {i+1}",
-                    f"M3 S{data['material']['power']} ; Láser encendido"
-                ])
-                
-                # Seguir contorno
-                for point in contour[1:]:
-                    x = float(point[0][0]) * scale_x
-                    y = float(point[0][1]) * scale_y
-                    abs_x = start_x + x
-                    abs_y = start_y + y
-                    gcode_lines.append(f"G1 X{abs_x:.3f} Y{abs_y:.3f}")
+            first = 0
+            if entry is not None:
+                logger.info(f"Toolpath de {section} recuperado de la caché")
+                self.report.count('cache_hits')
+                chunks, stats = entry['toolpaths'], entry['stats']
+            else:
+                # La primera copia se emite a medida que se genera la geometría y
+                # cada trozo va directo a la caché en disco. Las copias de un panel
+                # se leen después de esa entrada (sin límite de tamaño); sin
+                # caché se guardan en memoria
+                before = self.stats.geometry()
+                replay = len(offsets) > 1
+                writer = None
+                if key:
+                    writer = self.cache.writer(key, None if replay else self.cache.MAX_ENTRY_BYTES)
+                chunks = [] if replay and (writer is None or not writer.active) else None
+                try:
+                    for toolpath in build(data):
+                        if writer is not None and writer.active:
+                            with self.report.stage('cache'):
+                                writer.add(toolpath)
+                        if chunks is not None:
+                            chunks.append(toolpath)
+                        with self.report.stage('bind'):
+                            placed = self._bind(toolpath, data, offsets[0])
+                        yield placed
+                    
+                    stats = {name: value - before[name]
+                             for name, value in self.stats.geometry().items()}
+                    if writer is not None:
+                        with self.report.stage('cache'):
+                            stored = writer.commit(stats)
+                        if chunks is None:
+                            chunks = stored
+                finally:
+                    if writer is not None:
+                        writer.discard()
                 
-                # Cerrar contorno
-                x = float(contour[0][0][0]) * scale_x
-                y = float(contour[0][0][1]) * scale_y
-                abs_x = start_x + x
-                abs_y = start_y + y
-                gcode_lines.extend([
-                    f"G1 X{abs_x:.3f} Y{abs_y:.3f} ; Cerrar contorno {i+1}",
-                    "M5 ; Láser apagado"
-                ])
+                if not replay:
+                    if isinstance(chunks, CachedToolpaths):
+                        chunks.close()
+                    return
+                if chunks is None:
+                    raise RuntimeError("No se pudo guardar la geometría para las copias del panel")
+                first = 1
             
-            return gcode_lines
+            # Resto de copias: la misma geometría con otro desplazamiento
+            try:
+                for copy in range(first, len(offsets)):
+                    self._copy = copy
+                    self.stats.add(stats)
+                    for index in range(len(chunks)):
+                        self._advance((index + 1) / len(chunks))
+                        toolpath = chunks[index]
+                        with self.report.stage('bind'):
+                            placed = self._bind(toolpath, data, offsets[copy])
+                        yield placed
+            finally:
+                if isinstance(chunks, CachedToolpaths):
+                    chunks.close()
             
+        except GenerationCancelled:
+            raise
         except Exception as e:
-            logger.error(f"Error generando outline: {e}")
+            logger.error(f"Error generando {section}: {e}")
             logger.exception("Detalles del error:")
-            return []
     
-    def _generate_fill(self, data):
-        """Generar G-code para relleno"""
+    def _cache_key(self, data, section):
+        """Clave de caché: contenido de la imagen y parámetros que cambian la geometría"""
+        material = data['material']
+        params = {
+            'section': section,
+            'target': [self.TARGET_WIDTH, self.TARGET_HEIGHT]
+        }
+        if section == 'outline':
+            params.update({
+                'canny': list(self.CANNY_THRESHOLDS),
+                'simplify': (self._simplify_tolerance(data['machine_config'], data['image'].size)
+                             if self.simplify else 0),
+                'order': [self.optimize_order, self.two_opt]
+            })
+        else:
+            params.update({
+                'threshold': FILL_THRESHOLD,
+                'size': list(self._fill_size(data['image'], data)),
+                'direction': material.get('fill_direction', DEFAULT_FILL_DIRECTION)
+            })
+            if section == 'grayscale':
+                params['levels'] = len(self._level_powers(material)) - 1
+        return make_key(image_digest(data['image']), params)
+    
+    def _bind(self, toolpath, data, shift=(0.0, 0.0)):
+        """Aplicar colocación (más el desplazamiento de la copia), velocidades y potencia"""
+        engrave_speed, rapid_speed = self._speeds(data)
+        if data['material']['engrave_type'] == 'grayscale':
+            powers = self._level_powers(data['material'])
+        else:
+            powers = np.array([0, data['material']['power']], dtype=np.uint16)
+        
+        placed = toolpath.transformed(*self._placement(data, shift))
+        moves = placed.moves
+        moves['feed'] = np.where(moves['kind'] == MOVE_CUT, engrave_speed, rapid_speed)
+        moves['power'] = powers[moves['power']]
+        
+        # La máquina solo puede parar en múltiplos de un paso
+        steps = self._steps_per_mm(data['machine_config'])
+        if self.quantize and steps and len(placed):
+            placed, removed = placed.quantized(*steps)
+            self.report.count('quantize_removed', removed)
+        return placed
+    
+    def _steps_per_mm(self, machine_config):
+        """Pasos/mm de X e Y, o None si la máquina no los define"""
         try:
-            # Obtener imagen y dimensiones
-            image = data['image']
-            img_width, img_height = image.size
-            
-            # Obtener posición inicial (mm)
-            start_x = float(data['position']['x'])
-            start_y = float(data['position']['y'])
-            
-            # Calcular factores de escala
-            target_width = 80   # mm
-            target_height = 50  # mm
-            scale_x = target_width / img_width
-            scale_y = target_height / img_height
-            
-            # Convertir a escala de grises
-            if image.mode != 'L':
-                image = image.convert('L')
+            steps = tuple(float(machine_config.get(key) or 0) for key in ('steps_x', 'steps_y'))
+        except (TypeError, ValueError):
+            return None
+        return steps if all(s > 0 for s in steps) else None
+    
+    def _placement(self, data, shift=(0.0, 0.0)):
+        """Transformación afín de mm relativos al PCB a mm de la máquina
+
+        Gira el PCB en sentido antihorario (como PIL en la vista previa, con Y
+        hacia abajo) manteniendo su esquina superior izquierda en la posición
+        (desplazada `shift` mm en las copias de un panel).
+        """
+        rotation = int(data.get('rotation', 0)) % 360
+        if rotation % 90:
+            raise ValueError(f"Rotación no soportada: {rotation}")
+        
+        width, height = self.TARGET_WIDTH, self.TARGET_HEIGHT
+        matrix, corner = {
+            0: (((1, 0), (0, 1)), (0, 0)),
+            90: (((0, 1), (-1, 0)), (0, width)),
+            180: (((-1, 0), (0, -1)), (width, height)),
+            270: (((0, -1), (1, 0)), (height, 0))
+        }[rotation]
+        
+        offset = (corner[0] + float(data['position']['x']) + shift[0],
+                  corner[1] + float(data['position']['y']) + shift[1])
+        return matrix, offset
+    
+    def _outline_geometry(self, data):
+        """Geometría de contorno en mm relativos al PCB"""
+        logger.debug("Iniciando generación de outline")
+        
+        # Obtener imagen y sus dimensiones en píxeles
+        image = data['image']
+        img_width, img_height = image.size
+        logger.debug(f"Tamaño en píxeles: {img_width}x{img_height}")
+        
+        # Calcular factores de escala (píxeles a mm)
+        scale_x = self.TARGET_WIDTH / img_width
+        scale_y = self.TARGET_HEIGHT / img_height
+        logger.debug(f"Factores de escala: X={scale_x:.3f}, Y={scale_y:.3f}")
+        
+        # Imágenes grandes: contornos por franjas unidos entre sí
+        if isinstance(image, TiledImage):
+            contours = self._tiled_contours(image)
+        else:
+            # Bordes y contornos compartidos con el resto de secciones
+            with self.report.stage('preprocess'):
+                contours = image.contours(self.CANNY_THRESHOLDS)
+        self.report.count('contours', len(contours))
+        self._reached('outline', 0.3)
+        
+        logger.debug(f"Contornos encontrados: {len(contours)}")
+        
+        # Pasar contornos a mm relativos al PCB
+        scale = np.array([scale_x, scale_y])
+        contours = [c.reshape(-1, 2) * scale for c in contours]
+        
+        optimizer = ToolpathOptimizer(two_opt=self.two_opt,
+                                      time_budget=self.order_time_budget)
+        
+        # Eliminar vértices que la máquina no puede distinguir
+        if self.simplify:
+            tolerance = self._simplify_tolerance(data['machine_config'], image.size)
+            vertices_before = sum(len(c) for c in contours)
+            contours = optimizer.simplify_contours(contours, tolerance)
+            vertices_after = sum(len(c) for c in contours)
+            logger.info(f"Contornos simplificados (tolerancia {tolerance:.3f} mm): "
+                        f"{vertices_before} -> {vertices_after} vértices")
+        self._check_cancelled()
+        self._reached('outline', 0.4)
+        
+        # Ordenar contornos y elegir vértice de entrada para reducir movimientos rápidos
+        order = list(range(len(contours)))
+        entries = [0] * len(contours)
+        if self.optimize_order:
+            ordering = optimizer.order_contours(contours)
+            order, entries = ordering['order'], ordering['entries']
+            self.stats.outline_rapid_before += ordering['rapid_before']
+            self.stats.outline_rapid_after += ordering['rapid_after']
+        
+        # Cada contorno empieza por su vértice de entrada y se cierra sobre él
+        paths = [np.roll(contours[index], -entry, axis=0) for index, entry in zip(order, entries)]
+        self._reached('outline', 0.6)
+        self._advance(1.0)
+        yield Toolpath.from_polylines(paths, 0, 0, 1, 'outline', closed=True)
+    
+    def _fill_geometry(self, data):
+        """Geometría de relleno por bloques de filas en mm relativos al PCB
+
+        En modo 'grayscale' el nivel de cada segmento sale del gris de sus
+        píxeles en lugar de grabar a nivel 1 lo que queda bajo el umbral.
+        """
+        # Imagen remuestreada: una fila por línea grabada y una columna por paso
+        image = data['image']
+        size = self._fill_size(image, data)
+        
+        # Calcular factores de escala (cada fila es la línea central de su franja)
+        scale_x = self.TARGET_WIDTH / size[0]
+        pitch = self.TARGET_HEIGHT / size[1]
+        
+        # Barrido en ambos sentidos: se invierten las filas alternas
+        direction = data['material'].get('fill_direction', DEFAULT_FILL_DIRECTION)
+        bidirectional = direction == 'bidirectional'
+        
+        # Escala de grises: número de niveles de potencia (el nivel 0 no se graba)
+        levels = None
+        label = 'fill'
+        if data['material']['engrave_type'] == 'grayscale':
+            levels = len(self._level_powers(data['material'])) - 1
+            label = 'grayscale'
+        
+        # Final de la fila anterior (real y el que tendría el barrido en un sentido)
+        last_x = last_forward_x = last_y = np.nan
+        row_count = 0
+        
+        # Generar líneas horizontales por bloques de filas
+        for runs in self._engraved_runs(image, size, levels):
+            rows, starts, ends = runs[:3]
+            self.report.count('segments', len(rows))
+            if len(rows) == 0:
+                continue
             
-            # Convertir a array numpy
-            img_array = np.array(image)
-            img_array = img_array.astype(np.uint8)
+            # Convertir a mm
+            x_starts = starts * scale_x
+            x_ends = ends * scale_x
+            y_pos = (rows + 0.5) * pitch
             
-            # Umbral para detectar áreas a rellenar
-            _, binary = cv2.threshold(img_array, 127, 255, cv2.THRESH_BINARY)
+            # Número de fila grabada de cada segmento y primer/último segmento de cada fila
+            new_row = np.concatenate(([True], rows[1:] != rows[:-1]))
+            row_rank = row_count + np.cumsum(new_row) - 1
+            firsts = np.flatnonzero(new_row)
+            lasts = np.concatenate((firsts[1:], [len(rows)])) - 1
             
-            # Generar G-code
-            gcode_lines = []
+            # Invertir orden y sentido de los segmentos en las filas alternas
+            reverse = bidirectional & (row_rank % 2 == 1)
+            order = np.lexsort((np.where(reverse, -starts, starts), rows))
+            reverse = reverse[order]
+            x1 = np.where(reverse, x_ends[order], x_starts[order])
+            x2 = np.where(reverse, x_starts[order], x_ends[order])
             
-            # Espaciado entre líneas (mm)
-            line_spacing = 0.2  # Ajustar según necesidad
+            # Recorrido rápido ahorrado respecto a volver siempre a la izquierda
+            entry_y = y_pos[firsts]
+            prev_y = np.concatenate(([last_y], entry_y[:-1]))
+            prev_x = np.concatenate(([last_x], x2[lasts][:-1]))
+            prev_forward_x = np.concatenate(([last_forward_x], x_ends[lasts][:-1]))
+            travel = np.hypot(x1[firsts] - prev_x, entry_y - prev_y)
+            forward_travel = np.hypot(x_starts[firsts] - prev_forward_x, entry_y - prev_y)
+            self.stats.travel_saved += float(np.nansum(forward_travel - travel))
             
-            # Generar líneas horizontales
-            for y in range(img_height):
-                y_mm = y * scale_y
-                y_pos = start_y + y_mm
-                
-                # Encontrar segmentos en esta línea
-                row = binary[y]
-                segments = self._find_segments(row)
-                
-                # Si hay segmentos para grabar
-                if segments and y % int(line_spacing/scale_y) == 0:
-                    for start_seg, end_seg in segments:
-                        # Convertir a mm
-                        x1 = start_x + (start_seg * scale_x)
-                        x2 = start_x + (end_seg * scale_x)
-                        
-                        # Mover a inicio de segmento
-                        gcode_lines.extend([
-                            f"G0 X{x1:.3f} Y{y_pos:.3f} ; Inicio segmento",
-                            f"M3 S{data['material']['power']} ; Láser encendido",
-                            f"G1 X{x2:.3f} Y{y_pos:.3f} ; Fin segmento",
-                            "M5 ; Láser apagado"
-                        ])
+            last_x = float(x2[-1])
+            last_forward_x = float(x_ends[-1])
+            last_y = float(y_pos[-1])
+            row_count += len(firsts)
             
-            return gcode_lines
+            # Parte del relleno cubierta al escribir este bloque
+            self._advance((int(rows[-1]) + 1) / size[1])
             
-        except Exception as e:
-            logger.error(f"Error generando fill: {e}")
-            logger.exception("Detalles del error:")
-            return []
+            if levels is None:
+                yield Toolpath.from_segments(x1, x2, y_pos, 0, 0, 1, label)
+            else:
+                yield Toolpath.from_runs(x1, x2, y_pos, runs[3][order], 0, 0, label)
+    
+    def _engraved_runs(self, image, size, levels=None):
+        """Segmentos de las filas grabadas (índice de línea, inicio, fin[, nivel])"""
+        # Lo caro es remuestrear los píxeles de origen: en imágenes grandes
+        # cada proceso remuestrea su bloque de filas grabadas
+        if self.workers > 1 and size[1] > 1 and image.size[0] * image.size[1] >= self.PARALLEL_MIN_PIXELS:
+            yield from self._parallel_runs(image, size, levels)
+            return
+        
+        # Remuestreo por áreas una sola vez (por franjas si la imagen es grande);
+        # el trabajo siguiente depende de las líneas grabadas, no de los píxeles
+        with self.report.stage('preprocess'):
+            gray = image.resampled(size)
+        yield from self._fill_runs(gray, levels)
     
-    def _find_segments(self, row):
-        """Encontrar segmentos continuos en una fila"""
-        segments = []
-        start = None
+    def _fill_size(self, image, data):
+        """Tamaño (columnas, filas) de la imagen remuestreada para el relleno
+
+        Una fila por línea según el espaciado del material y, como mucho, una
+        columna por paso del motor X (nunca más columnas que la imagen).
+        """
+        spacing = self._line_spacing(data['material'])
+        rows = max(1, int(round(self.TARGET_HEIGHT / spacing)))
+        columns = image.size[0]
+        steps = self._steps_per_mm(data['machine_config'])
+        if steps:
+            columns = min(columns, int(math.ceil(self.TARGET_WIDTH * steps[0])))
+        return columns, rows
+    
+    def _line_spacing(self, material):
+        """Espaciado entre líneas de relleno (mm) del material"""
+        try:
+            spacing = float(material.get('line_spacing') or self.LINE_SPACING)
+        except (TypeError, ValueError):
+            spacing = self.LINE_SPACING
+        return spacing if spacing > 0 else self.LINE_SPACING
+    
+    def _tiled_contours(self, image):
+        """Contornos de una imagen por franjas, unidos en los cortes entre franjas"""
+        stitcher = ContourStitcher()
         
-        for i, val in enumerate(row):
-            if val == 0 and start is None:  # Inicio de segmento negro
-                start = i
-            elif val == 255 and start is not None:  # Fin de segmento negro
-                segments.append((start, i))
-                start = None
+        # Margen para que Canny vea los vecinos de las filas del borde de la franja
+        for strip_start, strip_stop, gray, top in self.report.iterate(
+                'preprocess', image.strips(margin=self.TILE_MARGIN)):
+            self._check_cancelled()
+            self._reached('outline', 0.3 * strip_stop / image.height)
+            height = strip_stop - strip_start
+            with self.report.stage('preprocess'):
+                edges = cv2.Canny(gray, *self.CANNY_THRESHOLDS)[top:top + height]
+                contours, _ = cv2.findContours(np.ascontiguousarray(edges),
+                                               cv2.RETR_EXTERNAL,
+                                               cv2.CHAIN_APPROX_NONE)
+            stitcher.add_strip(strip_start, height, contours,
+                               strip_start > 0, strip_stop < image.height)
         
-        # Si hay un segmento abierto al final
-        if start is not None:
-            segments.append((start, len(row)))
+        return stitcher.finish()
+    
+    def _fill_runs(self, gray, levels=None):
+        """Segmentos de cada bloque de filas de la imagen remuestreada, en orden"""
+        for band_start in range(0, gray.shape[0], RUN_BAND_ROWS):
+            yield _band_runs(gray, band_start, min(band_start + RUN_BAND_ROWS, gray.shape[0]), levels)
+    
+    def _parallel_runs(self, image, size, levels=None):
+        """Segmentos remuestreando cada bloque de filas grabadas en un proceso"""
+        # Bloques más pequeños que RUN_BAND_ROWS si hace falta para repartir
+        # varios a cada proceso (a 0.2 mm hay solo 250 líneas)
+        rows = size[1]
+        band_rows = max(1, min(RUN_BAND_ROWS, -(-rows // (self.workers * 2))))
+        bands = [(start, min(start + band_rows, rows)) for start in range(0, rows, band_rows)]
         
-        return segments
+        # Una TiledImage se vuelve a abrir en cada proceso; una imagen en
+        # memoria se copia una sola vez a memoria compartida
+        shm = None
+        source = image
+        try:
+            if not isinstance(image, TiledImage):
+                gray = image.gray
+                shm = shared_memory.SharedMemory(create=True, size=gray.nbytes)
+                shared = np.ndarray(gray.shape, dtype=np.uint8, buffer=shm.buf)
+                shared[:] = gray
+                del shared
+                source = (shm.name, gray.shape)
+            
+            logger.debug(f"Relleno en paralelo: {len(bands)} bloques, {self.workers} procesos")
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(_resampled_band_runs, source, image.size[1], size,
+                                           band_start, band_stop, levels)
+                           for band_start, band_stop in bands]
+                
+                # Unir resultados en el orden de las filas
+                for future in futures:
+                    with self.report.stage('preprocess'):
+                        result = future.result()
+                    yield result
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
     
     def _generate_mixed(self, data):
         """Generar G-code mixto (outline + fill)"""
         try:
-            # Generar ambos tipos
-            outline_gcode = self._generate_outline(data)
-            fill_gcode = self._generate_fill(data)
-            
-            # Combinar, primero fill y luego outline
-            gcode_lines = []
-            gcode_lines.extend([
-                "; Inicio de relleno",
-                "G0 F{} ; Velocidad para relleno".format(data['material']['speed'])
-            ])
-            gcode_lines.extend(fill_gcode)
+            # Combinar, primero fill y luego outline; los G0 van a la velocidad
+            # de rápidos de la cabecera (el ejecutor toma el F de G0 para rápidos)
+            rapid_speed = self._speeds(data)[1]
+            yield "; Inicio de relleno"
+            yield "G0 F{} ; Velocidad para relleno".format(rapid_speed)
+            yield from self._generate_fill(data)
             
-            gcode_lines.extend([
-                "",
-                "; Inicio de contorno",
-                "G0 F{} ; Velocidad para contorno".format(data['material']['speed'])
-            ])
-            gcode_lines.extend(outline_gcode)
-            
-            return gcode_lines
+            yield ""
+            yield "; Inicio de contorno"
+            yield "G0 F{} ; Velocidad para contorno".format(rapid_speed)
+            yield from self._generate_outline(data)
             
+        except GenerationCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error generando mixed: {e}")
             logger.exception("Detalles del error:")
-            return []
+    
+    def _simplify_tolerance(self, machine_config, image_size):
+        """Tolerancia de simplificación (mm) a partir de pasos/mm, spot y tamaño de píxel"""
+        # Una desviación menor que un paso no se puede reproducir, y una menor
+        # que un cuarto del spot no se distingue en el grabado
+        steps = [float(machine_config.get(key) or 0) for key in ('steps_x', 'steps_y')]
+        step_mm = max((1 / s for s in steps if s > 0), default=0)
+        # Los contornos siguen el borde de los píxeles: la escalera de una línea
+        # inclinada se aparta del borde real hasta media diagonal de píxel
+        pixel_mm = max(self.TARGET_WIDTH / image_size[0], self.TARGET_HEIGHT / image_size[1])
+        return max(step_mm, self.spot_size / 4, pixel_mm * math.sqrt(0.5))
+    
+    def _level_powers(self, material):
+        """Potencia S de cada nivel de gris: 0 apagado, luego de mínima a máxima"""
+        levels = max(1, int(material.get('power_levels', self.DEFAULT_POWER_LEVELS)))
+        max_power = int(material['power'])
+        min_power = min(int(material.get('min_power', 0)), max_power)
+        
+        powers = np.zeros(levels + 1, dtype=np.uint16)
+        powers[1:] = np.round(np.linspace(min_power if levels > 1 else max_power,
+                                          max_power, levels))
+        return powers
     
     def _validate_data(self, data):
         """Validar datos necesarios"""
         required = ['image', 'position', 'material', 'machine_config']
-        return all(k in data for k in required) 
+        if not all(k in data for k in required):
+            return False
+        try:
+            panel_offsets(data.get('panel'))
+        except (TypeError, ValueError) as e:
+            logger.error(f"Panel no válido: {e}")
+            return False
+        
+        # _placement solo sabe girar en múltiplos de 90°
+        rotation = data.get('rotation', 0)
+        try:
+            valid = float(rotation) % 90 == 0
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            logger.error(f"Rotación no soportada: {rotation} (0, 90, 180 o 270)")
+            return False
+        
+        # Copias de una rejilla más juntas que su tamaño grabado se solapan
+        panel = data.get('panel')
+        if panel and 'offsets' not in panel:
+            pitch = panel.get('pitch', 0)
+            pitch_x, pitch_y = (pitch, pitch) if np.isscalar(pitch) else pitch
+            width, height = engraved_size(rotation)
+            if ((int(panel.get('cols', 1)) > 1 and float(pitch_x) < width) or
+                    (int(panel.get('rows', 1)) > 1 and float(pitch_y) < height)):
+                logger.warning(f"Las copias del panel se solapan: paso {pitch_x} x {pitch_y} mm, "
+                               f"cada copia ocupa {width} x {height} mm")
+        return True
+    
+    def _panel_header(self, data):
+        """Línea de cabecera con las copias del panel (ninguna sin panel)"""
+        panel = data.get('panel')
+        if not panel:
+            return []
+        copies = len(panel_offsets(panel))
+        if 'offsets' in panel:
+            return [f";Panel: {copies} copies"]
+        pitch = panel.get('pitch', 0)
+        pitch_x, pitch_y = (pitch, pitch) if np.isscalar(pitch) else pitch
+        return [f";Panel: {copies} copies ({int(panel.get('rows', 1))}x{int(panel.get('cols', 1))}, "
+                f"pitch X={float(pitch_x):.3f} Y={float(pitch_y):.3f})"]
+    
+    def _speeds(self, data):
+        """Velocidades de grabado y de movimiento rápido (mm/min)"""
+        engrave_speed = int(data['material']['speed'])
+        rapid_speed = min(engrave_speed * 2, self.MAX_RAPID_SPEED)  # G0 al doble de velocidad, con límite
+        return engrave_speed, rapid_speed
     
-    def _calculate_stats(self, gcode_lines):
+    def _calculate_stats(self):
         """Calcular estadísticas del G-code"""
-        stats = {
-            'total_lines': len(gcode_lines),
-            'total_distance': 0,
-            'estimated_time': 0
+        estimate = self.estimator.result()
+        
+        return {
+            'total_lines': self.stats.total_lines,
+            'total_distance': estimate['total_distance'],
+            'estimated_time': estimate['estimated_time'],
+            'travel_saved': self.stats.travel_saved,
+            'outline_rapid_before': self.stats.outline_rapid_before,
+            'outline_rapid_after': self.stats.outline_rapid_after
         }
+    
+    def _format_stats(self, stats):
+        """Líneas de cabecera con las estadísticas"""
+        return [
+            ('total_lines', f";Total Lines: {stats['total_lines']}"),
+            ('estimated_time', f";Estimated Time: {stats['estimated_time']:.2f} min"),
+            ('total_distance', f";Total Distance: {stats['total_distance']:.2f} mm"),
+            ('travel_saved', f";Travel Saved: {stats['travel_saved']:.2f} mm"),
+            ('outline_rapid', f";Outline Rapid: {stats['outline_rapid_before']:.2f} mm -> "
+                              f"{stats['outline_rapid_after']:.2f} mm")
+        ]
+
+class GCodeStats:
+    """Contadores del trabajo acumulados mientras se escribe el G-code"""
+    # Contadores que dependen solo de la geometría (se guardan en la caché)
+    GEOMETRY_FIELDS = ('travel_saved', 'outline_rapid_before', 'outline_rapid_after')
+    
+    def __init__(self):
+        self.total_lines = 0
+        self.travel_saved = 0  # Recorrido rápido evitado por el barrido bidireccional
+        self.outline_rapid_before = 0  # Recorrido rápido entre contornos sin ordenar
+        self.outline_rapid_after = 0   # Recorrido rápido entre contornos ordenados
+    
+    def geometry(self):
+        """Valores actuales de los contadores de geometría"""
+        return {name: getattr(self, name) for name in self.GEOMETRY_FIELDS}
+    
+    def add(self, values):
+        """Sumar contadores de geometría guardados"""
+        for name, value in values.items():
+            setattr(self, name, getattr(self, name) + value)
+
+class GCodeSerializer:
+    """Convertir toolpaths en líneas de G-code ARLA"""
+    # Comentarios del inicio y del final de cada tramo según su origen
+    PATH_COMMENTS = {
+        'outline': ("Inicio contorno {n}", "Cerrar contorno {n}"),
+        'fill': ("Inicio segmento", "Fin segmento"),
+        'grayscale': ("Inicio línea", "Fin línea")
+    }
+    
+    def __init__(self):
+        self.path_numbers = {}  # Tramos emitidos por etiqueta
+        self.feed = None        # Velocidad modal de G1
+    
+    def lines(self, item):
+        """Líneas de G-code de un toolpath (las cadenas se emiten tal cual)"""
+        if isinstance(item, str):
+            yield item
+            return
         
-        last_x = last_y = None
-        laser_on = False
-        move_distance = 0
-        engrave_distance = 0
+        moves = item.moves
+        xs = moves['x'].tolist()
+        ys = moves['y'].tolist()
+        feeds = moves['feed'].tolist()
+        powers = moves['power'].tolist()
+        start_comment, end_comment = self.PATH_COMMENTS.get(item.label, ("", ""))
+        number = self.path_numbers.get(item.label, 0)
         
-        for line in gcode_lines:
-            if 'M3' in line:
-                laser_on = True
-            elif 'M5' in line:
-                laser_on = False
-                
-            if 'X' in line and 'Y' in line:
-                try:
-                    # Extraer coordenadas
-                    x = float(re.search(r'X([-\d.]+)', line).group(1))
-                    y = float(re.search(r'Y([-\d.]+)', line).group(1))
-                    
-                    if last_x is not None and last_y is not None:
-                        # Calcular distancia
-                        distance = math.sqrt(
-                            (x - last_x)**2 + (y - last_y)**2
-                        )
-                        stats['total_distance'] += distance
-                        
-                        if laser_on:
-                            engrave_distance += distance
-                        else:
-                            move_distance += distance
-                    
-                    last_x, last_y = x, y
-                    
-                except Exception:
-                    continue
+        bounds = item.offsets.tolist() + [len(moves)]
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            number += 1
+            
+            # Mover a inicio del tramo
+            yield f"G0 X{xs[first]:.3f} Y{ys[first]:.3f} ; {start_comment.format(n=number)}"
+            power = powers[first + 1] if last > first + 1 else powers[first]
+            yield f"M3 S{power} ; Láser encendido"
+            
+            # Grabar el tramo
+            for k in range(first + 1, last):
+                line = f"G1 X{xs[k]:.3f} Y{ys[k]:.3f}"
+                if feeds[k] != self.feed:
+                    self.feed = feeds[k]
+                    line += f" F{self.feed:g}"
+                if powers[k] != power:
+                    power = powers[k]
+                    line += f" S{power}"
+                if k == last - 1:
+                    line += f" ; {end_comment.format(n=number)}"
+                yield line
+            
+            yield "M5 ; Láser apagado"
         
-        # Estimar tiempo (considerando diferentes velocidades)
-        move_time = move_distance / 800  # mm/min
-        engrave_time = engrave_distance / 800  # mm/min
-        stats['estimated_time'] = (move_time + engrave_time) * 60  # min
+        self.path_numbers[item.label] = number
+
+class GCodeWriter:
+    """Escritura de G-code con buffer y líneas reservadas que se completan al final"""
+    def __init__(self, file, buffer_lines=8192, report=None):
+        self.file = file
+        self.buffer_lines = buffer_lines
+        self.report = report  # GenerationReport donde se cuenta el tiempo de escritura
+        self._buffer = []
+        self._reserved = {}
+    
+    def write(self, line):
+        """Añadir una línea al buffer"""
+        self._buffer.append(line)
+        if len(self._buffer) >= self.buffer_lines:
+            self.flush()
+    
+    def write_lines(self, lines):
+        """Añadir varias líneas al buffer"""
+        for line in lines:
+            self.write(line)
+    
+    def reserve(self, name, width=64):
+        """Reservar una línea de ancho fijo para reescribirla más tarde"""
+        self.flush()
+        self._reserved[name] = (self.file.tell(), width)
+        self.file.write(';'.ljust(width) + '\n')
+    
+    def patch(self, name, text):
+        """Reescribir una línea reservada sin tocar el resto del archivo"""
+        position, width = self._reserved[name]
+        if len(text) > width:
+            raise ValueError(f"Texto demasiado largo para la línea reservada '{name}'")
         
-        return stats 
\ No newline at end of file
+        self.flush()
+        end = self.file.tell()
+        self.file.seek(position)
+        self.file.write(text.ljust(width))
+        self.file.seek(end)
+    
+    def width(self, name):
+        """Ancho de una línea reservada"""
+        return self._reserved[name][1]
+    
+    def flush(self):
+        """Volcar el buffer al archivo"""
+        if self._buffer:
+            with self.report.stage('write') if self.report else nullcontext():
+                self.file.write('\n'.join(self._buffer) + '\n')
+            self._buffer = []
@@ -0,0 +1,110 @@
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager
+
+class GenerationReport:
+    """Tiempos por etapa, contadores y perfil opcional de una generación de G-code
+
+    Las etapas se pueden anidar: el tiempo de una etapa interna no cuenta en la
+    externa, así la suma de las etapas no supera el tiempo total. Los tiempos
+    son de reloj monotónico (time.perf_counter).
+    """
+    # Etapas en el orden en que se escriben en la cabecera del .arla
+    STAGES = ('preprocess', 'geometry', 'cache', 'bind', 'serialize', 'estimate', 'write')
+
+    def __init__(self):
+        self.stages = {name: 0.0 for name in self.STAGES}
+        self.counts = {}
+        self.total = 0.0
+        self.profile = None  # pstats.Stats si se generó con perfil
+        self._stack = []  # [nombre, inicio del tramo actual]
+        self._started = None
+        self._profiler = None
+        self._profiled = None
+
+    def start(self, profile=False):
+        """Empezar a medir el tiempo total (y el perfil con cProfile si se pide)"""
+        self._started = time.perf_counter()
+        if profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self):
+        """Terminar la medida del tiempo total y del perfil"""
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.profile = pstats.Stats(self._profiler)
+            self._profiled = self._profiler
+            self._profiler = None
+        if self._started is not None:
+            self.total = time.perf_counter() - self._started
+            self._started = None
+
+    @contextmanager
+    def stage(self, name):
+        """Medir un bloque como etapa `name`, pausando la etapa que lo contiene"""
+        now = time.perf_counter()
+        if self._stack:
+            self._charge(now)
+        self._stack.append([name, now])
+        try:
+            yield
+        finally:
+            self._charge(time.perf_counter())
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][1] = time.perf_counter()
+
+    def iterate(self, name, iterable):
+        """Recorrer un iterable contando como etapa `name` el tiempo de producir cada elemento"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name, amount=1):
+        """Sumar elementos procesados a un contador"""
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def _charge(self, now):
+        current = self._stack[-1]
+        self.stages[current[0]] = self.stages.get(current[0], 0.0) + now - current[1]
+        current[1] = now
+
+    def as_dict(self):
+        """Informe como diccionario serializable en JSON"""
+        return {
+            'total': self.total,
+            'stages': dict(self.stages),
+            'counts': dict(self.counts)
+        }
+
+    def summary_lines(self):
+        """Resumen como líneas de comentario (nombre de línea reservada, texto)"""
+        lines = [('timing_total', f";Timing total: {self.total:.3f} s")]
+        for name in self.STAGES:
+            share = self.stages[name] / self.total * 100 if self.total else 0
+            lines.append((f'timing_{name}',
+                          f";Timing {name}: {self.stages[name]:.3f} s ({share:.0f}%)"))
+        counts = ' '.join(f"{name}={value}" for name, value in sorted(self.counts.items()))
+        lines.append(('timing_counts', f";Counts: {counts}"))
+        return lines
+
+    def profile_summary(self, limit=20, sort='cumulative'):
+        """Funciones más costosas del perfil como texto (vacío sin perfil)"""
+        if self.profile is None:
+            return ""
+        stream = io.StringIO()
+        pstats.Stats(self._profiled, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def dump_profile(self, path):
+        """Guardar el perfil para abrirlo con pstats o snakeviz"""
+        if self.profile is not None:
+            self.profile.dump_stats(path)
@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2
+from PIL import Image
+
+logger = logging.getLogger('ImagePipeline')
+
+def resample_area(read_rows, height, size, band_rows=512, rows=None):
+    """Reducir una imagen en escala de grises a `size` (ancho, alto) promediando áreas
+
+    `read_rows(inicio, fin)` devuelve las filas [inicio, fin) como array uint8;
+    se leen unas `band_rows` filas cada vez. En vertical cada fila de salida es
+    la media exacta de la franja de filas que cubre (con peso parcial en los
+    bordes) y en horizontal se promedia con cv2.INTER_AREA. Cada fila de salida
+    se calcula solo con sus filas, así el resultado no depende de las franjas
+    y con `rows` = (primera, última + 1) se puede calcular solo una parte.
+    """
+    width_out, height_out = size
+    row_start, row_stop = rows if rows is not None else (0, height_out)
+    factor = height / height_out
+    edges = np.arange(height_out + 1) * factor
+    result = np.empty((row_stop - row_start, width_out), dtype=np.uint8)
+
+    step = max(1, int(band_rows / factor))
+    for first in range(row_start, row_stop, step):
+        band_edges = edges[first:min(first + step, row_stop) + 1]
+        start = int(np.floor(band_edges[0]))
+        stop = min(height, int(np.ceil(band_edges[-1])))
+        rows = read_rows(start, stop)
+
+        # Filas enteras de cada franja (sumas por bloques sobre uint8)
+        index = np.floor(band_edges).astype(np.int64) - start
+        blocks = np.zeros((len(band_edges) - 1, rows.shape[1]), dtype=np.float32)
+        whole = index[1:] > index[:-1]
+        if whole.any():
+            blocks[whole] = np.add.reduceat(rows[:index[-1]], index[:-1][whole],
+                                            axis=0, dtype=np.float32)
+
+        # Parte de la fila en la que cae cada borde: se suma al final de una
+        # franja y se resta al principio de la siguiente
+        fraction = (band_edges - np.floor(band_edges)).astype(np.float32)[:, np.newaxis]
+        partial = rows[np.minimum(index, len(rows) - 1)] * fraction
+        band = (blocks + partial[1:] - partial[:-1]) / np.float32(factor)
+
+        if band.shape[1] != width_out:
+            band = cv2.resize(band, (width_out, len(band)), interpolation=cv2.INTER_AREA)
+        result[first - row_start:first - row_start + len(band)] = np.clip(np.rint(band), 0, 255)
+    return result
+
+class ImagePipeline:
+    """Etapas de preprocesado de la imagen de un PCB, calculadas una sola vez
+
+    Escala de grises, imagen binaria, versiones remuestreadas, mapa de bordes y
+    contornos se calculan al pedirlos por primera vez y se guardan para el resto
+    de consumidores (vistas previas, área de trabajo y generador de G-code). Los
+    arrays son de solo lectura y la imagen PIL de `image` comparte memoria con
+    `gray`.
+    """
+    MAX_SCALED = 4  # Versiones escaladas/rotadas guardadas para la vista previa
+
+    def __init__(self, image, invert=False):
+        self.source = image
+        self.invert = invert
+        self.size = image.size
+        self.mode = 'L'
+        self._gray = None
+        self._image = None
+        self._hash = None
+        self._binary = {}
+        self._resampled = {}
+        self._edges = {}
+        self._contours = {}
+        self._scaled = OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    @property
+    def gray(self):
+        """Escala de grises (uint8, filas x columnas), invertida si se pidió"""
+        with self._lock:
+            if self._gray is None:
+                source = self.source if self.source.mode == 'L' else self.source.convert('L')
+                gray = np.array(source)
+                if self.invert:
+                    np.subtract(255, gray, out=gray)
+                gray.flags.writeable = False
+                self._gray = gray
+                logger.debug(f"Escala de grises calculada: {self.size[0]}x{self.size[1]}")
+            return self._gray
+
+    @property
+    def image(self):
+        """Imagen PIL en modo 'L' sobre el mismo buffer que `gray` (sin copia)"""
+        with self._lock:
+            if self._image is None:
+                self._image = Image.frombuffer('L', self.size, self.gray, 'raw', 'L', 0, 1)
+            return self._image
+
+    def binary(self, threshold):
+        """Máscara True donde el gris supera el umbral (blanco, no se graba)"""
+        with self._lock:
+            if threshold not in self._binary:
+                binary = self.gray > threshold
+                binary.flags.writeable = False
+                self._binary[threshold] = binary
+            return self._binary[threshold]
+
+    def resampled(self, size):
+        """Escala de grises reducida a `size` (ancho, alto) promediando áreas"""
+        size = tuple(size)
+        with self._lock:
+            if size not in self._resampled:
+                gray = self.gray
+                resampled = resample_area(lambda start, stop: gray[start:stop],
+                                          self.size[1], size)
+                resampled.flags.writeable = False
+                self._resampled[size] = resampled
+                logger.debug(f"Escala de grises remuestreada a {size[0]}x{size[1]}")
+            return self._resampled[size]
+
+    def edges(self, thresholds):
+        """Mapa de bordes de Canny con los umbrales (bajo, alto)"""
+        thresholds = tuple(thresholds)
+        with self._lock:
+            if thresholds not in self._edges:
+                edges = cv2.Canny(self.gray, *thresholds)
+                edges.flags.writeable = False
+                self._edges[thresholds] = edges
+            return self._edges[thresholds]
+
+    def contours(self, thresholds):
+        """Contornos externos del mapa de bordes (lista de arrays de OpenCV)"""
+        thresholds = tuple(thresholds)
+        with self._lock:
+            if thresholds not in self._contours:
+                # findContours no modifica la entrada desde OpenCV 3.2, pero
+                # necesita un array escribible
+                contours, _ = cv2.findContours(np.array(self.edges(thresholds)),
+                                               cv2.RETR_EXTERNAL,
+                                               cv2.CHAIN_APPROX_SIMPLE)
+                self._contours[thresholds] = contours
+                logger.debug(f"Contornos calculados: {len(contours)}")
+            return self._contours[thresholds]
+
+    def content_hash(self):
+        """Huella del contenido (la misma que la de una imagen PIL 'L' igual)"""
+        with self._lock:
+            if self._hash is None:
+                digest = hashlib.blake2b(digest_size=20)
+                digest.update(f"L:{self.size[0]}x{self.size[1]}".encode())
+                digest.update(self.gray.data)
+                self._hash = digest.hexdigest()
+            return self._hash
+
+    def scaled(self, size, rotation=0):
+        """Pipeline de una versión girada (antihorario) y escalada para mostrar"""
+        key = (tuple(size), rotation % 360)
+        with self._lock:
+            pipeline = self._scaled.get(key)
+            if pipeline is not None:
+                self._scaled.move_to_end(key)
+                return pipeline
+
+            image = self.image
+            if key[1]:
+                image = image.rotate(key[1], expand=True)
+            image = image.resize(key[0], Image.LANCZOS)
+
+            pipeline = ImagePipeline(image)
+            self._scaled[key] = pipeline
+            while len(self._scaled) > self.MAX_SCALED:
+                self._scaled.popitem(last=False)
+            return pipeline
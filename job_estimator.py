@@ -0,0 +1,181 @@
+import logging
+import numpy as np
+from motion_planner import (DEFAULT_JUNCTION_DEVIATION, DEFAULT_MAX_ACCEL, DEFAULT_MAX_FEED,
+                            MotionPlanner)
+
+logger = logging.getLogger('JobEstimator')
+
+class JobEstimator:
+    """Tiempo de un trabajo con el mismo modelo de movimiento que MotionPlanner
+
+    Cada movimiento va a su F limitada por la velocidad máxima de los ejes en
+    su dirección y acelera con la aceleración de los ejes. La velocidad en
+    cada vértice sale del ángulo entre tramos y de la desviación en esquinas,
+    y solo se miran `lookahead` tramos por delante (el último del buffer
+    termina parado), igual que en el ejecutor.
+
+    Las dos pasadas del planificador se calculan con arrays: en velocidades al
+    cuadrado, frenar o acelerar a lo largo de un tramo suma 2·a·L, así que
+    "como mucho lo que permite el siguiente" es un mínimo acumulado sobre las
+    sumas de 2·a·L. Los últimos tramos se guardan hasta que llegan los que
+    caben en su ventana.
+    """
+    def __init__(self, max_feed=(DEFAULT_MAX_FEED, DEFAULT_MAX_FEED),
+                 max_accel=(DEFAULT_MAX_ACCEL, DEFAULT_MAX_ACCEL),
+                 junction_deviation=DEFAULT_JUNCTION_DEVIATION,
+                 lookahead=MotionPlanner.LOOKAHEAD, origin=(0.0, 0.0)):
+        self.max_speed = np.array(max_feed, dtype=np.float64) / 60.0  # mm/s por eje
+        self.max_accel = np.array(max_accel, dtype=np.float64)        # mm/s² por eje
+        self.junction_deviation = float(junction_deviation)
+        self.lookahead = int(lookahead)
+        self.last_x, self.last_y = origin
+
+        self.moves = 0
+        self.rapid_distance = 0.0
+        self.engrave_distance = 0.0
+        self.rapid_time = 0.0      # s
+        self.engrave_time = 0.0    # s
+
+        # Dirección y velocidad del último tramo (None: la máquina parte parada)
+        self._previous = None
+        # Tramos aún sin tiempo definitivo: longitud, nominal, aceleración,
+        # entrada máxima al cuadrado y láser
+        self._pending = {name: np.zeros(0) for name in ('length', 'nominal', 'accel', 'entry')}
+        self._pending['laser'] = np.zeros(0, dtype=bool)
+        self._reach = 0.0  # Velocidad² alcanzable al empezar el primer tramo pendiente
+
+    @classmethod
+    def from_config(cls, config):
+        """Estimador con los límites de movimiento de la configuración de la máquina"""
+        def value(key, default):
+            return float(config.get(key) or default)
+
+        return cls(max_feed=(value('max_feed_x', DEFAULT_MAX_FEED),
+                             value('max_feed_y', DEFAULT_MAX_FEED)),
+                   max_accel=(value('max_accel_x', DEFAULT_MAX_ACCEL),
+                              value('max_accel_y', DEFAULT_MAX_ACCEL)),
+                   junction_deviation=value('junction_deviation', DEFAULT_JUNCTION_DEVIATION))
+
+    def add_moves(self, x, y, feed, laser):
+        """Acumular un bloque de movimientos (destino, velocidad mm/min, láser encendido)"""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if len(x) == 0:
+            return
+
+        feed = np.broadcast_to(np.asarray(feed, dtype=np.float64), x.shape)
+        laser = np.broadcast_to(np.asarray(laser, dtype=bool), x.shape)
+
+        # Longitud de cada movimiento desde el destino anterior
+        dx = np.diff(x, prepend=self.last_x)
+        dy = np.diff(y, prepend=self.last_y)
+        lengths = np.hypot(dx, dy)
+
+        self.moves += len(x)
+        self.engrave_distance += float(lengths[laser].sum())
+        self.rapid_distance += float(lengths[~laser].sum())
+        self.last_x, self.last_y = float(x[-1]), float(y[-1])
+
+        # Los movimientos nulos no cuentan para el planificador
+        moving = lengths > 0
+        if moving.any():
+            self._add_blocks(dx[moving], dy[moving], lengths[moving], feed[moving], laser[moving])
+
+    def _add_blocks(self, dx, dy, lengths, feed, laser):
+        """Limitar cada tramo y dar tiempo a los que ya tienen su ventana completa"""
+        unit = np.stack((dx / lengths, dy / lengths), axis=1)
+        with np.errstate(divide='ignore'):
+            axis_speed = np.where(unit != 0, self.max_speed / np.abs(unit), np.inf).min(axis=1)
+            accel = np.where(unit != 0, self.max_accel / np.abs(unit), np.inf).min(axis=1)
+        nominal = np.where(feed > 0, np.minimum(feed / 60.0, axis_speed), axis_speed)
+
+        # Velocidad máxima en cada vértice con el tramo anterior
+        if self._previous is None:
+            previous_unit = np.vstack(([np.nan, np.nan], unit[:-1]))
+            previous_nominal = np.concatenate(([0.0], nominal[:-1]))
+        else:
+            previous_unit = np.vstack((self._previous[0], unit[:-1]))
+            previous_nominal = np.concatenate(([self._previous[1]], nominal[:-1]))
+        junction = self._junction_speeds(previous_unit, unit, accel)
+        entry = np.minimum(np.minimum(junction, nominal), previous_nominal)
+        if self._previous is None:
+            entry[0] = 0.0
+        self._previous = (unit[-1], float(nominal[-1]))
+
+        pending = self._pending
+        pending['length'] = np.concatenate((pending['length'], lengths))
+        pending['nominal'] = np.concatenate((pending['nominal'], nominal))
+        pending['accel'] = np.concatenate((pending['accel'], accel))
+        pending['entry'] = np.concatenate((pending['entry'], entry * entry))
+        pending['laser'] = np.concatenate((pending['laser'], laser))
+
+        # Un tramo tiene tiempo definitivo cuando ya se conoce la ventana del siguiente
+        final = len(pending['length']) - self.lookahead + 1
+        if final > 0:
+            times, self._reach = self._block_times(final, finished=False)
+            self._account(times, pending['laser'][:final])
+            for name in pending:
+                pending[name] = pending[name][final:]
+
+    def _junction_speeds(self, previous, unit, accel):
+        """Velocidad máxima en cada vértice (desviación en esquinas, como MotionPlanner)"""
+        cos_theta = -(previous * unit).sum(axis=1)
+        cos_theta = np.nan_to_num(cos_theta, nan=1.0)
+        sin_half = np.sqrt(0.5 * (1.0 - np.clip(cos_theta, -0.999999, 0.999999)))
+        speed = np.sqrt(accel * self.junction_deviation * sin_half / (1.0 - sin_half))
+        speed = np.where(cos_theta < -0.999999, np.inf, speed)
+        return np.where(cos_theta > 0.999999, 0.0, speed)
+
+    def _block_times(self, count, finished):
+        """Tiempo de los `count` primeros tramos pendientes y velocidad² alcanzable tras ellos
+
+        Con `finished` el trabajo ha terminado y el último tramo acaba parado.
+        """
+        pending = self._pending
+        n = len(pending['length'])
+        window = self.lookahead
+        reach_step = 2.0 * pending['accel'] * pending['length']
+        total = np.concatenate(([0.0], np.cumsum(reach_step)))
+
+        # Hacia atrás: al sacar un tramo del buffer, el siguiente entra como mucho
+        # a lo que deja frenar hasta el final de los que hay detrás (window - 1)
+        limits = np.concatenate((pending['entry'] + total[:n], np.full(window - 2, np.inf)))
+        ahead = np.lib.stride_tricks.sliding_window_view(limits, window - 1).min(axis=1)[:n]
+        ends = total[np.minimum(np.arange(n) + window - 1, n)]
+        entry = np.minimum(ahead, ends) - total[:n]
+
+        # Hacia delante: desde la velocidad alcanzable al empezar
+        entry = total[:n] + np.minimum(self._reach, np.minimum.accumulate(entry - total[:n]))
+        entry = np.maximum(entry, 0.0)
+        exit = np.append(entry[1:], 0.0) if finished else entry[1:count + 1]
+        entry = entry[:count]
+
+        length = pending['length'][:count]
+        accel = pending['accel'][:count]
+        nominal = pending['nominal'][:count]
+        peak_sq = np.minimum(nominal * nominal, (reach_step[:count] + entry + exit[:count]) / 2.0)
+        peak = np.sqrt(peak_sq)
+        ramps = (2.0 * peak - np.sqrt(entry) - np.sqrt(exit[:count])) / accel
+        cruise = np.maximum(length - (2.0 * peak_sq - entry - exit[:count]) / (2.0 * accel), 0.0) / peak
+        return ramps + cruise, float(entry[-1] + reach_step[count - 1])
+
+    def _account(self, times, laser):
+        self.engrave_time += float(times[laser].sum())
+        self.rapid_time += float(times[~laser].sum())
+
+    def result(self):
+        """Resumen del trabajo estimado (los tramos pendientes terminan parados)"""
+        engrave_time, rapid_time = self.engrave_time, self.rapid_time
+        count = len(self._pending['length'])
+        if count:
+            times, _ = self._block_times(count, finished=True)
+            laser = self._pending['laser']
+            engrave_time += float(times[laser].sum())
+            rapid_time += float(times[~laser].sum())
+        return {
+            'moves': self.moves,
+            'rapid_distance': self.rapid_distance,
+            'engrave_distance': self.engrave_distance,
+            'total_distance': self.rapid_distance + self.engrave_distance,
+            'estimated_time': (rapid_time + engrave_time) / 60.0  # min
+        }
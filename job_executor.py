@@ -0,0 +1,352 @@
+from arduino_manager import ArduinoManager
+from config_manager import ConfigManager
+from motion_planner import MotionPlanner
+from stepper_backend import DEFAULT_STEP_RATE
+from collections import namedtuple, deque
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger('JobExecutor')
+
+# Estado que debe tener la máquina al ejecutar una línea: destino en pasos,
+# velocidad (mm/min, la de rápidos en G0), potencia S, láser encendido (M3) y
+# si es movimiento rápido
+Command = namedtuple('Command', 'line offset x y feed power laser rapid')
+
+class GCodeParser:
+    """Lectura perezosa de un archivo G-code ARLA convertido en comandos
+
+    Mantiene el estado modal (G90/G91, F, S, M3/M5) y devuelve un Command por
+    cada línea que cambia el estado de la máquina, con el destino ya pasado a
+    pasos absolutos. Los comentarios y las líneas vacías se saltan. Una F en
+    una línea G0 fija la velocidad de los rápidos (como el 'G0 F...' de la
+    cabecera ARLA); mientras no haya una, los rápidos usan la F de grabado.
+    """
+    def __init__(self, steps_x, steps_y, start=(0.0, 0.0)):
+        self.steps_x = steps_x
+        self.steps_y = steps_y
+        self.x, self.y = start   # Posición programada (mm)
+        self.absolute = True     # G90 / G91
+        self.feed = 0.0
+        self.rapid_feed = None
+        self.power = 0
+        self.laser = False
+        self.unsupported = set()  # Códigos ya avisados
+
+    def commands(self, path):
+        """Recorrer los comandos del archivo sin cargarlo entero en memoria"""
+        offset = 0
+        with open(path, 'rb') as f:
+            for number, raw in enumerate(f, 1):
+                offset += len(raw)
+                command = self.parse_line(raw.decode('utf-8', 'replace'), number, offset)
+                if command is not None:
+                    yield command
+
+    def parse_line(self, text, number=0, offset=0):
+        """Comando de una línea (None si no cambia nada en la máquina)"""
+        text = text.split(';', 1)[0].strip().upper()
+        if not text:
+            return None
+
+        words = {}
+        for word in text.split():
+            try:
+                words[word[0]] = float(word[1:])
+            except (ValueError, IndexError):
+                raise ValueError(f"Línea {number}: palabra no válida '{word}'")
+
+        g = words.get('G')
+        m = words.get('M')
+        if 'F' in words:
+            if g == 0:
+                self.rapid_feed = words['F']
+            else:
+                self.feed = words['F']
+        if 'S' in words:
+            self.power = int(words['S'])
+
+        rapid = False
+        if g is not None:
+            if g == 90:
+                self.absolute = True
+            elif g == 91:
+                self.absolute = False
+            elif g in (0, 1):
+                rapid = g == 0
+                if 'X' in words:
+                    self.x = words['X'] if self.absolute else self.x + words['X']
+                if 'Y' in words:
+                    self.y = words['Y'] if self.absolute else self.y + words['Y']
+            else:
+                self._unsupported(f"G{g:g}")
+        if m is not None:
+            if m == 3:
+                self.laser = True
+            elif m == 5:
+                self.laser = False
+            else:
+                self._unsupported(f"M{m:g}")
+
+        feed = self.rapid_feed if rapid and self.rapid_feed else self.feed
+        return Command(number, offset,
+                       int(round(self.x * self.steps_x)), int(round(self.y * self.steps_y)),
+                       feed, self.power, self.laser, rapid)
+
+    def _unsupported(self, code):
+        if code not in self.unsupported:
+            self.unsupported.add(code)
+            logger.warning(f"Código no soportado, se ignora: {code}")
+
+class JobExecutor:
+    """Ejecución de un archivo .arla en la máquina con dos hilos
+
+    Un hilo lee y traduce el archivo y llena una cola acotada; otro hilo toma
+    los comandos y mueve la máquina con ArduinoManager. Así la velocidad la
+    marca la máquina: la lectura va siempre por delante sin cargar el archivo
+    entero. Los comandos viajan en lotes para no pagar la cola en cada línea.
+    Los movimientos pasan por MotionPlanner, que retiene unos cuantos para
+    enlazar los vértices sin parar y acelerar con rampas.
+    """
+    QUEUE_BATCHES = 64    # Lotes que caben en la cola
+    BATCH_LINES = 64      # Comandos por lote
+    REPORT_INTERVAL = 0.5  # Segundos entre avisos de progreso
+    RATE_WINDOW = 2.0     # Segundos con los que se calcula líneas/s
+
+    def __init__(self, arduino_manager=None, start=None):
+        self.arduino_manager = arduino_manager if arduino_manager else ArduinoManager()
+        config = ConfigManager().get_machine_config()
+        self.steps_x = float(config.get('steps_x') or 0)
+        self.steps_y = float(config.get('steps_y') or 0)
+        self.planner = MotionPlanner.from_config(config, (self.steps_x, self.steps_y))
+        self._step_rate = float(config.get('step_rate') or DEFAULT_STEP_RATE)
+
+        # Posición real de la máquina en pasos (la que ya se ha movido) y la
+        # del último movimiento planificado. Sin `start` (mm) se parte de la
+        # que conoce ArduinoManager desde el último home
+        if start is not None:
+            self.position_steps = [int(round(start[0] * self.steps_x)),
+                                   int(round(start[1] * self.steps_y))]
+        else:
+            homed = self.arduino_manager.position()
+            if homed is None:
+                logger.warning("Ejes sin home: se supone el cabezal en el origen")
+                homed = (0, 0)
+            self.position_steps = list(homed)
+        self._planned = list(self.position_steps)
+        self._power = 0  # Potencia aplicada al láser
+
+        self._queue = None
+        self._stop = threading.Event()
+        self._parser_thread = None
+        self._executor_thread = None
+        self._progress = None
+        self._rate = deque()  # (instante, líneas ejecutadas) de la ventana de medida
+
+        self.file_size = 0
+        self.lines_parsed = 0
+        self.lines_done = 0
+        self.offset_done = 0
+        self.started = None
+        self.finished = None
+        self.result = None  # True al terminar bien, False si se detuvo o falló
+        self.error = None
+
+    @property
+    def position(self):
+        """Posición real de la máquina en mm"""
+        return (self.position_steps[0] / self.steps_x, self.position_steps[1] / self.steps_y)
+
+    def start(self, path, progress=None):
+        """Empezar a ejecutar el archivo; `progress(estado)` se llama desde el hilo ejecutor"""
+        if self.is_running():
+            logger.error("Ya hay un trabajo en ejecución")
+            return False
+        if self.steps_x <= 0 or self.steps_y <= 0:
+            logger.error("Pasos/mm de la máquina no configurados")
+            return False
+        if not self.arduino_manager.is_connected():
+            logger.error("No hay conexión con Arduino")
+            return False
+
+        self.file_size = os.path.getsize(path)
+        self.lines_parsed = self.lines_done = self.offset_done = 0
+        self.result = self.error = None
+        self.finished = None
+        self.started = time.perf_counter()
+        self._rate.clear()
+        self.planner.clear()
+        self._planned = list(self.position_steps)
+        self._start = self.position  # El lector parte de donde está la máquina
+        self._progress = progress
+        self._stop.clear()
+        self._queue = queue.Queue(maxsize=self.QUEUE_BATCHES)
+
+        self._parser_thread = threading.Thread(target=self._parse_thread, args=(path,))
+        self._parser_thread.daemon = True
+        self._executor_thread = threading.Thread(target=self._execute_thread)
+        self._executor_thread.daemon = True
+        self._parser_thread.start()
+        self._executor_thread.start()
+        logger.info(f"Ejecutando {path}")
+        return True
+
+    def stop(self):
+        """Detener el trabajo (el láser se apaga al salir del hilo ejecutor)"""
+        self._stop.set()
+
+    def is_running(self):
+        return self._executor_thread is not None and self._executor_thread.is_alive()
+
+    def wait(self, timeout=None):
+        """Esperar a que termine el trabajo y devolver el resultado"""
+        if self._executor_thread is not None:
+            self._executor_thread.join(timeout)
+        return self.result
+
+    def status(self):
+        """Estado del trabajo: líneas, líneas/s, profundidad de la cola y posición"""
+        now = self.finished or time.perf_counter()
+        elapsed = now - self.started if self.started else 0.0
+        rate = 0.0
+        if len(self._rate) > 1:
+            (t0, n0), (t1, n1) = self._rate[0], self._rate[-1]
+            rate = (n1 - n0) / (t1 - t0) if t1 > t0 else 0.0
+        return {
+            'lines_done': self.lines_done,
+            'lines_parsed': self.lines_parsed,
+            'lines_per_sec': rate,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'queue_size': self.QUEUE_BATCHES,
+            'percent': 100.0 * self.offset_done / self.file_size if self.file_size else 0.0,
+            'position': self.position,
+            'elapsed': elapsed,
+            'running': self.is_running()
+        }
+
+    def _put(self, item):
+        """Meter un lote en la cola esperando hueco (False si se detuvo el trabajo)"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _parse_thread(self, path):
+        """Hilo lector: traduce el archivo a lotes de comandos"""
+        parser = GCodeParser(self.steps_x, self.steps_y, self._start)
+        batch = []
+        try:
+            for command in parser.commands(path):
+                batch.append(command)
+                if len(batch) >= self.BATCH_LINES:
+                    self.lines_parsed = command.line
+                    if not self._put(batch):
+                        return
+                    batch = []
+            if batch:
+                self.lines_parsed = batch[-1].line
+                self._put(batch)
+            self._put(None)  # Fin del archivo
+
+        except Exception as e:
+            logger.error(f"Error leyendo G-code: {e}")
+            self._put(e)
+
+    def _execute_thread(self):
+        """Hilo ejecutor: mueve la máquina con los comandos de la cola"""
+        last_report = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    batch = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if batch is None:
+                    # Fin del archivo: ejecutar lo que queda planificado
+                    while self.planner.blocks and not self._stop.is_set():
+                        self._run(*self.planner.pop())
+                    if not self.planner.blocks:
+                        self.result = True
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+
+                for command in batch:
+                    if self._stop.is_set():
+                        break
+                    self._execute(command)
+
+                now = time.perf_counter()
+                self._rate.append((now, self.lines_done))
+                while now - self._rate[0][0] > self.RATE_WINDOW:
+                    self._rate.popleft()
+                if self._progress is not None and now - last_report >= self.REPORT_INTERVAL:
+                    last_report = now
+                    self._progress(self.status())
+
+            if self.result is None:
+                logger.info("Trabajo detenido")
+                self.result = False
+
+        except Exception as e:
+            logger.error(f"Error ejecutando G-code: {e}")
+            self.error = str(e)
+            self.result = False
+        finally:
+            self._stop.set()
+            self.planner.clear()
+            # Apagar el láser siempre, aunque el último cambio haya fallado
+            self.arduino_manager.set_laser_power(0)
+            self._power = 0
+            self.finished = time.perf_counter()
+            logger.info(f"Trabajo terminado: {self.lines_done} líneas en "
+                        f"{self.finished - self.started:.1f} s")
+            if self._progress is not None:
+                self._progress(self.status())
+
+    def _execute(self, command):
+        """Planificar el movimiento de un comando y ejecutar los que ya no cambian"""
+        # Sin ninguna F el eje mayor va a la frecuencia de pasos por defecto;
+        # el planificador limita la velocidad a la máxima de cada eje
+        dx = command.x - self._planned[0]
+        dy = command.y - self._planned[1]
+        if dx or dy:
+            feed = command.feed
+            if feed <= 0:
+                feed = self._step_rate / max(self.steps_x, self.steps_y) * 60
+            self.planner.add(dx, dy, feed, command)
+            self._planned = [command.x, command.y]
+        elif not self.planner.blocks:
+            self._done(command)  # Sin movimientos pendientes la línea ya está hecha
+
+        # Con el buffer lleno el primer tramo ya tiene su perfil definitivo
+        while self.planner.full():
+            self._run(*self.planner.pop())
+
+    def _run(self, command, move):
+        """Mover la máquina por un tramo planificado con la potencia de su comando"""
+        # El láser solo graba en G1; en los rápidos se apaga
+        self._set_power(command.power if command.laser and not command.rapid else 0)
+
+        if not self.arduino_manager.run_move(move):
+            raise RuntimeError(f"Movimiento interrumpido en la línea {command.line}")
+        self.position_steps[0] += move.dx
+        self.position_steps[1] += move.dy
+        self._done(command)
+
+    def _done(self, command):
+        self.lines_done = command.line
+        self.offset_done = command.offset
+
+    def _set_power(self, power):
+        """Cambiar la potencia del láser solo si es distinta de la actual"""
+        if power != self._power:
+            if not self.arduino_manager.set_laser_power(power):
+                raise RuntimeError("No se pudo cambiar la potencia del láser")
+            self._power = power
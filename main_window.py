@@ -9,11 +9,15 @@ from svg_import_window import SVGImportWindow
 import logging
 import tkinter.messagebox as messagebox
 from tkinter import filedialog
-from PIL import Image, ImageTk
+from PIL import ImageTk
 from pcb_processor import PCBProcessor
+from image_pipeline import ImagePipeline
 import threading
+import queue
 import time
-from material_manager import MaterialManager
+from material_manager import DEFAULT_FILL_DIRECTION, MaterialManager
+from job_executor import JobExecutor
+import os
 
 # Configurar logging
 logging.basicConfig(level=logging.DEBUG)
@@ -26,9 +30,11 @@ class WorkArea(tk.Canvas):
         
         # Variables para PCB
         self.pcb_image = None
+        self.pcb_pipeline = None
         self.pcb_dims = None
         self.pcb_position = {'x': 0, 'y': 0}  # Posición en mm
         self.pcb_rotation = 0  # Rotación en grados
+        self.pcb_panel = None  # Copias del PCB ({'rows', 'cols', 'pitch'}) o None
         self.pcb_selected = False
         
         # Obtener dimensiones de la máquina
@@ -114,9 +120,10 @@ class WorkArea(tk.Canvas):
     def on_resize(self, event):
         self.draw_all()
     
-    def show_pcb(self, image, dimensions):
+    def show_pcb(self, image, dimensions, pipeline=None):
         """Mostrar PCB en el área de trabajo"""
         self.pcb_image = image
+        self.pcb_pipeline = pipeline if pipeline is not None else ImagePipeline(image)
         self.pcb_dims = dimensions
         
         # Centrar PCB inicialmente
@@ -127,23 +134,23 @@ class WorkArea(tk.Canvas):
         
         self.draw_all()
     
+    def set_panel(self, panel):
+        """Repetir el PCB en una rejilla de copias (None para una sola copia)"""
+        self.pcb_panel = panel
+        self.draw_all()
+    
     def draw_pcb(self):
         """Dibujar PCB con transformaciones"""
         if not self.pcb_image:
             return
             
         try:
-            # Crear copia de la imagen para transformar
-            img = self.pcb_image.copy()
-            
-            # Rotar imagen si es necesario
-            if self.pcb_rotation != 0:
-                img = img.rotate(self.pcb_rotation, expand=True)
+            from gcode_generator import engraved_size, panel_offsets
             
-            # Escalar imagen según zoom
+            # Imagen rotada y escalada según zoom (se reutiliza al arrastrar)
             new_width = int(self.pcb_dims['width'] * self.zoom)
             new_height = int(self.pcb_dims['height'] * self.zoom)
-            img = img.resize((new_width, new_height), Image.LANCZOS)
+            img = self.pcb_pipeline.scaled((new_width, new_height), self.pcb_rotation).image
             
             # Convertir a PhotoImage
             self.pcb_photo = ImageTk.PhotoImage(img)
@@ -152,6 +159,26 @@ class WorkArea(tk.Canvas):
             x = self.pcb_position['x'] * self.zoom
             y = self.pcb_position['y'] * self.zoom
             
+            # Copias del panel con la misma imagen y un borde tenue del tamaño
+            # que se graba cada copia, así se ve si se solapan
+            if self.pcb_panel:
+                engraved_width, engraved_height = (size * self.zoom for size in
+                                                   engraved_size(self.pcb_rotation))
+                for index, (dx, dy) in enumerate(panel_offsets(self.pcb_panel)):
+                    copy_x = x + dx * self.zoom
+                    copy_y = y + dy * self.zoom
+                    if index:
+                        self.create_image(copy_x, copy_y,
+                                        image=self.pcb_photo,
+                                        anchor='nw',
+                                        tags='pcb_copy')
+                    self.create_rectangle(copy_x, copy_y,
+                                       copy_x + engraved_width,
+                                       copy_y + engraved_height,
+                                       outline='#666666',
+                                       dash=(4, 2),
+                                       tags='pcb_copy')
+            
             # Dibujar imagen
             self.create_image(x, y, 
                             image=self.pcb_photo, 
@@ -218,15 +245,19 @@ class WorkArea(tk.Canvas):
         if self.pcb_selected:
             self.pcb_rotation = (self.pcb_rotation + 90) % 360
             
-            # Intercambiar dimensiones si es necesario
-            if self.pcb_rotation in [90, 270]:
-                self.pcb_dims['width'], self.pcb_dims['height'] = \
-                    self.pcb_dims['height'], self.pcb_dims['width']
+            # Cada giro de 90 grados intercambia ancho y alto
+            self.pcb_dims['width'], self.pcb_dims['height'] = \
+                self.pcb_dims['height'], self.pcb_dims['width']
             
             self.draw_all()
 
 class WorkDialog:
-    def __init__(self, parent, pcb_image, pcb_position):
+    PROGRESS_POLL_MS = 100  # Cada cuánto se leen los avisos del hilo de generación
+    STAGE_NAMES = {'outline': "Contorno", 'fill': "Relleno",
+                   'grayscale': "Escala de grises", 'finish': "Finalizando"}
+    
+    def __init__(self, parent, pcb_image, pcb_position, source_image=None, pcb_rotation=0,
+                 pipeline=None, panel=None):
         self.dialog = tk.Toplevel(parent)
         self.dialog.title("Trabajo en Progreso")
         
@@ -241,7 +272,7 @@ class WorkDialog:
         
         # Centrar la ventana
         window_width = 500
-        window_height = 500
+        window_height = 560
         screen_width = parent.winfo_screenwidth()
         screen_height = parent.winfo_screenheight()
         x = (screen_width - window_width) // 2
@@ -256,6 +287,12 @@ class WorkDialog:
         # Guardar referencia a la imagen y posición del PCB
         self.pcb_image = pcb_image
         self.pcb_position = pcb_position
+        self.pcb_rotation = pcb_rotation
+        self.pcb_panel = panel
+        # Preprocesado compartido con el área de trabajo
+        self.pipeline = pipeline if pipeline is not None else ImagePipeline(pcb_image)
+        # Imagen a resolución completa para el G-code (por franjas si es grande)
+        self.source_image = source_image if source_image is not None else self.pipeline
         self.config_manager = ConfigManager()
         
         # Añadir MaterialManager
@@ -314,6 +351,27 @@ class WorkDialog:
         )
         self.preview_canvas.pack()
         
+        # Progreso de la generación (se muestra al generar)
+        self.progress_frame = tk.Frame(self.dialog, bg='#2d2d2d')
+        self.progress_var = tk.DoubleVar(value=0)
+        self.progress_bar = ttk.Progressbar(self.progress_frame,
+                                          variable=self.progress_var,
+                                          maximum=100,
+                                          length=300,
+                                          mode='determinate')
+        self.progress_bar.pack()
+        self.progress_label = tk.Label(self.progress_frame,
+                                     text="",
+                                     font=('Arial', 10),
+                                     bg='#2d2d2d',
+                                     fg='white')
+        self.progress_label.pack(pady=5)
+        
+        # Hilo de generación, testigo de cancelación y avisos de progreso
+        self.generation_thread = None
+        self.cancel_event = None
+        self.progress_queue = queue.Queue()
+        
         # Frame para botones
         button_frame = tk.Frame(self.dialog, bg='#2d2d2d')
         button_frame.pack(side='bottom', pady=20)
@@ -360,19 +418,13 @@ class WorkDialog:
         if not material:
             return
         
-        # Crear copia de la imagen para procesar
-        from PIL import Image, ImageTk
-        preview_image = self.pcb_image.copy()
-        
-        # Asegurar que la imagen está en modo 'L' (escala de grises)
-        if preview_image.mode != 'L':
-            preview_image = preview_image.convert('L')
+        from PIL import ImageTk
         
         # Escalar imagen para el canvas manteniendo proporción
         canvas_width = 300  # Tamaño fijo para el preview
         canvas_height = 300
         
-        img_width, img_height = preview_image.size
+        img_width, img_height = self.pipeline.size
         scale = min(
             canvas_width / img_width,
             canvas_height / img_height
@@ -381,15 +433,15 @@ class WorkDialog:
         new_width = int(img_width * scale)
         new_height = int(img_height * scale)
         
-        # Redimensionar imagen
-        preview_image = preview_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        # Imagen reducida con su propio preprocesado, se reutiliza al cambiar de material
+        preview_image = self.pipeline.scaled((new_width, new_height))
         
         # Centrar en canvas
         x = (canvas_width - new_width) // 2
         y = (canvas_height - new_height) // 2
         
         # Convertir a PhotoImage
-        self.preview_photo = ImageTk.PhotoImage(preview_image)
+        self.preview_photo = ImageTk.PhotoImage(preview_image.image)
         
         # Mostrar imagen base
         self.preview_canvas.create_image(
@@ -398,60 +450,44 @@ class WorkDialog:
             anchor='nw'
         )
         
-        # Superponer visualización según tipo de grabado
-        if material['engrave_type'] == 'outline':
-            self.show_outline_overlay(x, y, new_width, new_height)
-        elif material['engrave_type'] == 'fill':
-            self.show_fill_overlay(x, y, new_width, new_height)
-        else:  # mixed
-            self.show_mixed_overlay(x, y, new_width, new_height)
-    
-    def show_outline_overlay(self, x, y, width, height):
-        """Mostrar overlay de contorno"""
-        # Dibujar línea de contorno
-        self.preview_canvas.create_rectangle(
-            x, y, x + width, y + height,
-            outline='#00ff00',
-            width=2
-        )
-        
-        self.preview_canvas.create_text(
-            x + width//2,
-            y + height + 20,
-            text="Vista previa: Contorno",
-            fill='white',
-            font=('Arial', 10)
-        )
-    
-    def show_fill_overlay(self, x, y, width, height):
-        """Mostrar overlay de relleno"""
-        # Dibujar patrón de líneas
-        spacing = 5
-        for i in range(0, width, spacing):
-            self.preview_canvas.create_line(
-                x + i, y,
-                x + i, y + height,
-                fill='#00ff00',
-                width=1
-            )
-        
-        self.preview_canvas.create_text(
-            x + width//2,
-            y + height + 20,
-            text="Vista previa: Relleno",
-            fill='white',
-            font=('Arial', 10)
-        )
+        # Superponer el recorrido que generaría el material seleccionado
+        self.show_toolpath_overlay(preview_image, material, x, y, new_width, new_height)
     
-    def show_mixed_overlay(self, x, y, width, height):
-        """Mostrar overlay mixto"""
-        self.show_fill_overlay(x, y, width, height)
-        self.show_outline_overlay(x, y, width, height)
-        
+    def show_toolpath_overlay(self, preview_image, material, x, y, width, height):
+        """Dibujar los toolpaths generados sobre la vista previa"""
+        from gcode_generator import GCodeGenerator, MOVE_CUT
+        
+        # Generar sobre la imagen reducida, el recorrido se escala igual que el real
+        # (sin caché: la geometría de la vista previa no sirve para el trabajo)
+        generator = GCodeGenerator(two_opt=False, use_cache=False)
+        toolpaths = generator.build_toolpaths({
+            'image': preview_image,
+            'position': {'x': 0, 'y': 0},
+            'material': material,
+            'machine_config': self.config_manager.get_machine_config()
+        })
+        
+        # Convertir mm del toolpath a píxeles del canvas
+        scale_x = width / generator.TARGET_WIDTH
+        scale_y = height / generator.TARGET_HEIGHT
+        
+        moves = 0
+        for toolpath in toolpaths:
+            for path in toolpath.paths():
+                if len(path) < 2 or path['kind'][-1] != MOVE_CUT:
+                    continue
+                coords = []
+                for px, py in zip(path['x'].tolist(), path['y'].tolist()):
+                    coords.extend((x + px * scale_x, y + py * scale_y))
+                self.preview_canvas.create_line(*coords, fill='#00ff00', width=1)
+            moves += len(toolpath)
+        
+        names = {'outline': "Contorno", 'fill': "Relleno", 'mixed': "Mixto",
+                 'grayscale': "Escala de grises"}
         self.preview_canvas.create_text(
             x + width//2,
             y + height + 20,
-            text="Vista previa: Mixto",
+            text=f"Vista previa: {names.get(material['engrave_type'], 'Mixto')} ({moves} movimientos)",
             fill='white',
             font=('Arial', 10)
         )
@@ -491,6 +527,14 @@ class WorkDialog:
     
     def cancel_work(self):
         """Cancelar el trabajo"""
+        # Durante la generación se cancela solo la generación
+        if self.generation_thread is not None and self.generation_thread.is_alive():
+            if messagebox.askyesno("Cancelar",
+                                 "¿Quieres cancelar la generación del G-code?"):
+                self.cancel_event.set()
+                self.progress_label.configure(text="Cancelando...")
+            return
+        
         if messagebox.askyesno("Cancelar", 
                              "¿Estás seguro de que quieres cancelar el trabajo?"):
             self.dialog.destroy()
@@ -520,33 +564,21 @@ class WorkDialog:
                     messagebox.showerror("Error", "No hay imagen PCB")
                     return
                 
-                logger.debug(f"Generando G-code para imagen: {self.pcb_image.size}")
-                logger.debug(f"Posición: {self.pcb_position}")
+                logger.debug(f"Generando G-code para imagen: {self.source_image.size}")
+                logger.debug(f"Posición: {self.pcb_position}, rotación: {self.pcb_rotation}")
                 
                 # Recopilar datos para el generador
                 gcode_data = {
-                    'image': self.pcb_image,
+                    'image': self.source_image,
                     'position': self.pcb_position,
+                    'rotation': self.pcb_rotation,
+                    'panel': self.pcb_panel,
                     'material': material,
                     'machine_config': self.config_manager.get_machine_config()
                 }
                 
-                # Generar G-code
-                from gcode_generator import GCodeGenerator
-                generator = GCodeGenerator()
-                success = generator.generate(gcode_data, file_path)
-                
-                if success:
-                    messagebox.showinfo(
-                        "Éxito",
-                        "G-code generado correctamente"
-                    )
-                    self.dialog.destroy()
-                else:
-                    messagebox.showerror(
-                        "Error",
-                        "Error generando G-code"
-                    )
+                # Generar G-code en segundo plano para no bloquear la interfaz
+                self.start_generation(gcode_data, file_path)
                     
         except Exception as e:
             logger.error(f"Error en generate_gcode: {e}")
@@ -554,6 +586,90 @@ class WorkDialog:
                 "Error",
                 f"Error generando G-code: {str(e)}"
             )
+    
+    def start_generation(self, gcode_data, file_path):
+        """Lanzar la generación en un hilo y seguir su progreso desde Tk"""
+        from gcode_generator import GCodeGenerator
+        generator = GCodeGenerator()
+        
+        self.cancel_event = threading.Event()
+        self.progress_queue = queue.Queue()
+        self.set_generating(True)
+        
+        self.generation_thread = threading.Thread(
+            target=self._generation_thread,
+            args=(generator, gcode_data, file_path)
+        )
+        self.generation_thread.daemon = True
+        self.generation_thread.start()
+        self.dialog.after(self.PROGRESS_POLL_MS, self.poll_generation)
+    
+    def _generation_thread(self, generator, gcode_data, file_path):
+        """Generación que corre en un thread separado (no toca widgets de Tk)"""
+        try:
+            success = generator.generate(
+                gcode_data, file_path,
+                progress=lambda *event: self.progress_queue.put(('progress', event)),
+                cancel=self.cancel_event
+            )
+        except Exception as e:
+            logger.error(f"Error en el hilo de generación: {e}")
+            success = False
+        self.progress_queue.put(('done', success))
+    
+    def poll_generation(self):
+        """Aplicar en el hilo de Tk los avisos de progreso de la generación"""
+        result = None
+        try:
+            while True:
+                kind, value = self.progress_queue.get_nowait()
+                if kind == 'progress':
+                    stage, percent, moves = value
+                    self.progress_var.set(percent)
+                    if not self.cancel_event.is_set():
+                        self.progress_label.configure(
+                            text=f"{self.STAGE_NAMES.get(stage, stage)}: {percent:.0f}% "
+                                 f"({moves} movimientos)"
+                        )
+                else:
+                    result = value
+        except queue.Empty:
+            pass
+        
+        if result is None:
+            self.dialog.after(self.PROGRESS_POLL_MS, self.poll_generation)
+            return
+        
+        self.generation_thread = None
+        self.set_generating(False)
+        if self.cancel_event.is_set():
+            self.progress_label.configure(text="Generación cancelada")
+            messagebox.showinfo("Cancelado", "Generación de G-code cancelada")
+        elif result:
+            messagebox.showinfo(
+                "Éxito",
+                "G-code generado correctamente"
+            )
+            self.dialog.destroy()
+        else:
+            self.progress_label.configure(text="Error generando G-code")
+            messagebox.showerror(
+                "Error",
+                "Error generando G-code"
+            )
+    
+    def set_generating(self, generating):
+        """Mostrar el progreso y bloquear los controles mientras se genera"""
+        state = 'disabled' if generating else 'normal'
+        self.gcode_button.configure(state=state)
+        self.edit_button.configure(state=state)
+        self.add_button.configure(state=state)
+        self.material_combo.configure(state='disabled' if generating else 'readonly')
+        
+        if generating:
+            self.progress_var.set(0)
+            self.progress_label.configure(text="Preparando...")
+            self.progress_frame.pack(pady=5)
 
 class MaterialDialog:
     def __init__(self, parent, material=None):
@@ -570,7 +686,7 @@ class MaterialDialog:
         
         # Tamaño fijo y centrado
         window_width = 400
-        window_height = 500
+        window_height = 750
         screen_width = parent.winfo_screenwidth()
         screen_height = parent.winfo_screenheight()
         x = (screen_width - window_width) // 2
@@ -589,7 +705,13 @@ class MaterialDialog:
         self.name_var = tk.StringVar(value=material['name'] if material else '')
         self.speed_var = tk.StringVar(value=str(material['speed']) if material else '800')
         self.power_var = tk.StringVar(value=str(material['power']) if material else '255')
+        self.min_power_var = tk.StringVar(value=str(material.get('min_power', 0)) if material else '0')
+        self.levels_var = tk.StringVar(value=str(material.get('power_levels', 16)) if material else '16')
+        self.spacing_var = tk.StringVar(value=str(material.get('line_spacing', 0.2)) if material else '0.2')
         self.type_var = tk.StringVar(value=material['engrave_type'] if material else 'outline')
+        self.direction_var = tk.StringVar(
+            value=material.get('fill_direction', DEFAULT_FILL_DIRECTION) if material else DEFAULT_FILL_DIRECTION
+        )
         self.desc_var = tk.StringVar(value=material['description'] if material else '')
         
         # Crear campos
@@ -615,6 +737,13 @@ class MaterialDialog:
         # Potencia
         self.create_field("Potencia (0-255):", self.power_var)
         
+        # Escala de grises: potencia mínima y número de niveles entre mínima y máxima
+        self.create_field("Potencia mínima (0-255):", self.min_power_var)
+        self.create_field("Niveles de potencia:", self.levels_var)
+        
+        # Relleno: distancia entre líneas grabadas
+        self.create_field("Espaciado de línea (mm):", self.spacing_var)
+        
         # Tipo de grabado
         type_frame = tk.Frame(self.dialog, bg='#2d2d2d')
         type_frame.pack(pady=10, padx=20, fill='x')
@@ -626,7 +755,8 @@ class MaterialDialog:
         
         types = [('Contorno', 'outline'), 
                 ('Relleno', 'fill'), 
-                ('Mixto', 'mixed')]
+                ('Mixto', 'mixed'),
+                ('Escala de grises', 'grayscale')]
         
         for text, value in types:
             tk.Radiobutton(type_frame,
@@ -638,6 +768,28 @@ class MaterialDialog:
                           selectcolor='#3d3d3d',
                           activebackground='#2d2d2d').pack(anchor='w')
         
+        # Sentido del barrido de relleno
+        direction_frame = tk.Frame(self.dialog, bg='#2d2d2d')
+        direction_frame.pack(pady=10, padx=20, fill='x')
+        
+        tk.Label(direction_frame,
+                text="Barrido de relleno:",
+                bg='#2d2d2d',
+                fg='white').pack(anchor='w')
+        
+        directions = [('Un sentido', 'unidirectional'),
+                     ('Ambos sentidos (serpentina)', 'bidirectional')]
+        
+        for text, value in directions:
+            tk.Radiobutton(direction_frame,
+                          text=text,
+                          value=value,
+                          variable=self.direction_var,
+                          bg='#2d2d2d',
+                          fg='white',
+                          selectcolor='#3d3d3d',
+                          activebackground='#2d2d2d').pack(anchor='w')
+        
         # Descripción
         desc_frame = tk.Frame(self.dialog, bg='#2d2d2d')
         desc_frame.pack(pady=10, padx=20, fill='x')
@@ -691,11 +843,20 @@ class MaterialDialog:
             name = self.name_var.get().strip()
             speed = int(self.speed_var.get())
             power = int(self.power_var.get())
+            min_power = int(self.min_power_var.get())
+            power_levels = int(self.levels_var.get())
+            line_spacing = float(self.spacing_var.get())
             
             if not name:
                 raise ValueError("El nombre es obligatorio")
             if not (0 <= power <= 255):
                 raise ValueError("La potencia debe estar entre 0 y 255")
+            if not (0 <= min_power <= power):
+                raise ValueError("La potencia mínima debe estar entre 0 y la potencia")
+            if not (1 <= power_levels <= 256):
+                raise ValueError("Los niveles de potencia deben estar entre 1 y 256")
+            if not (0.01 <= line_spacing <= 5):
+                raise ValueError("El espaciado de línea debe estar entre 0.01 y 5 mm")
             if speed <= 0:
                 raise ValueError("La velocidad debe ser mayor que 0")
             
@@ -704,7 +865,11 @@ class MaterialDialog:
                 'name': name,
                 'speed': speed,
                 'power': power,
+                'min_power': min_power,
+                'power_levels': power_levels,
+                'line_spacing': line_spacing,
                 'engrave_type': self.type_var.get(),
+                'fill_direction': self.direction_var.get(),
                 'description': self.desc_text.get('1.0', 'end-1c')
             }
             
@@ -717,6 +882,216 @@ class MaterialDialog:
         """Cancelar edición"""
         self.dialog.destroy()
 
+class JobDialog:
+    PROGRESS_POLL_MS = 200  # Cada cuánto se leen los avisos del hilo ejecutor
+    
+    def __init__(self, parent, file_path, arduino_manager):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Ejecutando G-code")
+        self.dialog.geometry("420x220")
+        self.dialog.configure(bg='#2d2d2d')
+        self.dialog.resizable(False, False)
+        
+        # Hacer la ventana modal
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+        
+        tk.Label(self.dialog,
+                text=os.path.basename(file_path),
+                font=('Arial', 12, 'bold'),
+                bg='#2d2d2d',
+                fg='white').pack(pady=10)
+        
+        # Progreso por la parte del archivo ya ejecutada
+        self.progress_var = tk.DoubleVar(value=0)
+        ttk.Progressbar(self.dialog,
+                       variable=self.progress_var,
+                       maximum=100,
+                       length=360,
+                       mode='determinate').pack(pady=5)
+        
+        self.status_label = tk.Label(self.dialog,
+                                   text="Iniciando...",
+                                   font=('Arial', 10),
+                                   bg='#2d2d2d',
+                                   fg='white',
+                                   justify='left')
+        self.status_label.pack(pady=5)
+        
+        self.stop_button = ttk.Button(self.dialog,
+                                    text="Detener",
+                                    command=self.stop,
+                                    width=20)
+        self.stop_button.pack(pady=10)
+        
+        # Avisos del hilo ejecutor, se aplican desde el hilo de Tk
+        self.status_queue = queue.Queue()
+        self.executor = JobExecutor(arduino_manager)
+        self.dialog.protocol("WM_DELETE_WINDOW", self.stop)
+        
+        if self.executor.start(file_path, progress=self.status_queue.put):
+            self.dialog.after(self.PROGRESS_POLL_MS, self.poll_status)
+        else:
+            messagebox.showerror("Error", "No se pudo iniciar el trabajo")
+            self.dialog.destroy()
+    
+    def poll_status(self):
+        """Mostrar el último estado del trabajo"""
+        status = None
+        try:
+            while True:
+                status = self.status_queue.get_nowait()
+        except queue.Empty:
+            pass
+        
+        if status is not None:
+            x, y = status['position']
+            self.progress_var.set(status['percent'])
+            self.status_label.configure(
+                text=f"Línea {status['lines_done']} ({status['lines_per_sec']:.0f} líneas/s)\n"
+                     f"Cola: {status['queue_depth']}/{status['queue_size']} lotes\n"
+                     f"Posición: X={x:.3f} Y={y:.3f} mm"
+            )
+        
+        if self.executor.is_running() or not self.status_queue.empty():
+            self.dialog.after(self.PROGRESS_POLL_MS, self.poll_status)
+            return
+        
+        self.stop_button.configure(text="Cerrar", command=self.dialog.destroy)
+        self.dialog.protocol("WM_DELETE_WINDOW", self.dialog.destroy)
+        if self.executor.result:
+            messagebox.showinfo("Éxito", "Trabajo terminado")
+        elif self.executor.error:
+            messagebox.showerror("Error", f"Error ejecutando G-code: {self.executor.error}")
+    
+    def stop(self):
+        """Detener el trabajo en curso"""
+        if self.executor.is_running():
+            if messagebox.askyesno("Detener", "¿Quieres detener el trabajo?"):
+                self.executor.stop()
+                self.status_label.configure(text="Deteniendo...")
+        else:
+            self.dialog.destroy()
+
+class PanelDialog:
+    def __init__(self, parent, dimensions, panel=None):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Panel")
+        
+        # Hacer la ventana modal y fija
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+        self.dialog.overrideredirect(True)  # Quitar marcos de la ventana
+        
+        # Configurar ventana
+        self.dialog.configure(bg='#2d2d2d')
+        
+        # Tamaño fijo y centrado
+        window_width = 400
+        window_height = 300
+        screen_width = parent.winfo_screenwidth()
+        screen_height = parent.winfo_screenheight()
+        x = (screen_width - window_width) // 2
+        y = (screen_height - window_height) // 2
+        self.dialog.geometry(f'{window_width}x{window_height}+{x}+{y}')
+        
+        # Asegurar que la ventana esté por encima
+        self.dialog.lift()
+        self.dialog.focus_force()
+        
+        # Borde para hacer la ventana más visible
+        self.dialog.configure(highlightbackground='#3d3d3d',
+                            highlightthickness=2)
+        
+        # Variables (por defecto las copias quedan separadas 5 mm); `dimensions`
+        # es el tamaño grabado de cada copia
+        self.dimensions = dimensions
+        pitch = panel['pitch'] if panel else (dimensions['width'] + 5, dimensions['height'] + 5)
+        self.rows_var = tk.StringVar(value=str(panel['rows']) if panel else '1')
+        self.cols_var = tk.StringVar(value=str(panel['cols']) if panel else '1')
+        self.pitch_x_var = tk.StringVar(value=f"{pitch[0]:.2f}")
+        self.pitch_y_var = tk.StringVar(value=f"{pitch[1]:.2f}")
+        
+        # Crear campos
+        self.create_fields()
+        
+        # Resultado (None = sin panel)
+        self.result = None
+        self.accepted = False
+        
+        # Evitar que se cierre con Alt+F4
+        self.dialog.protocol("WM_DELETE_WINDOW", lambda: None)
+        
+        # Esperar resultado
+        self.dialog.wait_window()
+    
+    def create_fields(self):
+        """Crear campos del formulario"""
+        self.create_field("Filas:", self.rows_var)
+        self.create_field("Columnas:", self.cols_var)
+        
+        # Distancia entre las esquinas de copias vecinas
+        self.create_field("Paso X (mm):", self.pitch_x_var)
+        self.create_field("Paso Y (mm):", self.pitch_y_var)
+        
+        # Botones
+        button_frame = tk.Frame(self.dialog, bg='#2d2d2d')
+        button_frame.pack(pady=20)
+        
+        ttk.Button(button_frame,
+                  text="Aceptar",
+                  command=self.save).pack(side='left', padx=5)
+        
+        ttk.Button(button_frame,
+                  text="Cancelar",
+                  command=self.cancel).pack(side='left', padx=5)
+    
+    def create_field(self, label_text, variable):
+        """Crear campo de entrada con etiqueta"""
+        frame = tk.Frame(self.dialog, bg='#2d2d2d')
+        frame.pack(pady=10, padx=20, fill='x')
+        
+        tk.Label(frame,
+                text=label_text,
+                bg='#2d2d2d',
+                fg='white').pack(side='left')
+        
+        tk.Entry(frame,
+                textvariable=variable,
+                bg='#3d3d3d',
+                fg='white',
+                width=20).pack(side='right')
+    
+    def save(self):
+        """Validar y guardar el panel"""
+        try:
+            rows = int(self.rows_var.get())
+            cols = int(self.cols_var.get())
+            pitch_x = float(self.pitch_x_var.get())
+            pitch_y = float(self.pitch_y_var.get())
+            
+            if rows < 1 or cols < 1:
+                raise ValueError("Filas y columnas deben ser al menos 1")
+            # Con un paso menor que la copia grabada las copias se solapan
+            width, height = self.dimensions['width'], self.dimensions['height']
+            if (cols > 1 and pitch_x < width) or (rows > 1 and pitch_y < height):
+                raise ValueError(f"El paso debe ser al menos el tamaño grabado "
+                                 f"de cada copia ({width:g} x {height:g} mm)")
+            
+            # Una sola copia equivale a no panelizar
+            if rows * cols > 1:
+                self.result = {'rows': rows, 'cols': cols, 'pitch': (pitch_x, pitch_y)}
+            self.accepted = True
+            
+            self.dialog.destroy()
+            
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+    
+    def cancel(self):
+        """Cancelar edición"""
+        self.dialog.destroy()
+
 class MainWindow:
     def __init__(self):
         self.root = tk.Tk()
@@ -771,12 +1146,26 @@ class MainWindow:
                                    style='Dark.TButton')
         self.pcb_button.pack(pady=5)
         
+        # Botón para repetir el PCB en una rejilla (panel)
+        self.panel_button = ttk.Button(self.control_panel,
+                                     text="Panel",
+                                     command=self.edit_panel,
+                                     state='disabled')
+        self.panel_button.pack(pady=5)
+        
         # Botón de trabajo (inicialmente deshabilitado)
         self.work_button = ttk.Button(self.control_panel,
                                     text="Iniciar Trabajo",
                                     command=self.start_work,
                                     state='disabled')
         self.work_button.pack(pady=10)
+        
+        # Botón para ejecutar un archivo .arla en la máquina
+        self.run_button = ttk.Button(self.control_panel,
+                                   text="Ejecutar G-code",
+                                   command=self.run_gcode,
+                                   state='disabled')
+        self.run_button.pack(pady=10)
     
     def show_connection_dialog(self):
         if not self.arduino_manager.is_connected():
@@ -789,6 +1178,7 @@ class MainWindow:
                 self.laser_control_button.configure(state='normal')
                 self.cnc_control_button.configure(state='normal')
                 self.calibration_button.configure(state='normal')
+                self.run_button.configure(state='normal')
                 # Verificar si podemos habilitar el botón de trabajo
                 self.check_work_button()
     
@@ -826,13 +1216,28 @@ class MainWindow:
                 preview = self.pcb_processor.get_preview_image()
                 if preview:
                     # Mostrar en el área de trabajo
-                    self.work_area.show_pcb(preview, dims)
+                    self.work_area.show_pcb(preview, dims, self.pcb_processor.get_pipeline())
+                    self.panel_button.configure(state='normal')
                     # Verificar si podemos habilitar el botón de trabajo
                     self.check_work_button()
             else:
                 messagebox.showerror("Error", 
                                    "Error cargando archivo de imagen")
     
+    def edit_panel(self):
+        """Configurar las copias del PCB en una rejilla"""
+        if not self.work_area.pcb_image:
+            return
+        
+        from gcode_generator import engraved_size
+        
+        # El paso se mide con el tamaño que se graba, no con el de la imagen
+        width, height = engraved_size(self.work_area.pcb_rotation)
+        dialog = PanelDialog(self.root, {'width': width, 'height': height},
+                             self.work_area.pcb_panel)
+        if dialog.accepted:
+            self.work_area.set_panel(dialog.result)
+    
     def check_work_button(self):
         """Verificar si podemos habilitar el botón de trabajo"""
         if (self.arduino_manager.is_connected() and 
@@ -857,8 +1262,25 @@ class MainWindow:
         work_dialog = WorkDialog(
             self.root,
             self.work_area.pcb_image,
-            self.work_area.pcb_position
+            self.work_area.pcb_position,
+            self.pcb_processor.get_generation_image(),
+            self.work_area.pcb_rotation,
+            self.work_area.pcb_pipeline,
+            self.work_area.pcb_panel
         )
     
+    def run_gcode(self):
+        """Ejecutar un archivo G-code ARLA en la máquina"""
+        if not self.arduino_manager.is_connected():
+            messagebox.showerror("Error", "Arduino no conectado")
+            return
+        
+        file_path = filedialog.askopenfilename(
+            filetypes=[("ARLA G-code", "*.arla")],
+            title="Ejecutar G-code ARLA"
+        )
+        if file_path:
+            JobDialog(self.root, file_path, self.arduino_manager)
+    
     def run(self):
         self.root.mainloop() 
\ No newline at end of file
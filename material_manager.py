@@ -4,6 +4,9 @@ import logging
 
 logger = logging.getLogger('MaterialManager')
 
+# Sentido del relleno para materiales que no lo indican
+DEFAULT_FILL_DIRECTION = 'unidirectional'
+
 class MaterialManager:
     def __init__(self):
         self.materials = []
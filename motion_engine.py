@@ -0,0 +1,102 @@
+import logging
+import math
+import numpy as np
+
+logger = logging.getLogger('MotionEngine')
+
+def dda_steps(major, minor):
+    """Tics en los que avanza el eje menor al dar `major` pasos en el mayor
+
+    DDA entera (Bresenham): en el tic k el eje menor lleva
+    round(k * minor / major) pasos, así que nunca se separa más de medio paso
+    de la recta. Devuelve un array bool de `major` elementos.
+    """
+    if major == 0:
+        return np.zeros(0, dtype=bool)
+    k = np.arange(1, major + 1, dtype=np.int64)
+    counts = (k * minor + major // 2) // major
+    return np.diff(counts, prepend=0).astype(bool)
+
+class LinearMove:
+    """Movimiento rectilíneo coordinado de (dx, dy) pasos
+
+    Cada tic da un paso en el eje mayor y, cuando toca, otro en el menor.
+    `x_steps`/`y_steps` indican qué ejes dan paso en cada tic y `times` el
+    instante (s desde el inicio) de cada tic.
+    """
+    def __init__(self, dx, dy, times):
+        self.dx = int(dx)
+        self.dy = int(dy)
+        self.direction_x = 1 if dx >= 0 else -1
+        self.direction_y = 1 if dy >= 0 else -1
+        self.times = times
+
+        adx, ady = abs(self.dx), abs(self.dy)
+        if adx >= ady:
+            self.x_steps = np.ones(adx, dtype=bool)
+            self.y_steps = dda_steps(adx, ady)
+        else:
+            self.x_steps = dda_steps(ady, adx)
+            self.y_steps = np.ones(ady, dtype=bool)
+
+    @property
+    def ticks(self):
+        return len(self.times)
+
+    @property
+    def duration(self):
+        return float(self.times[-1]) if len(self.times) else 0.0
+
+    @classmethod
+    def at_feed(cls, dx, dy, feed, steps_per_mm):
+        """Movimiento a velocidad constante: la velocidad del vector es `feed` mm/min"""
+        ticks = max(abs(int(dx)), abs(int(dy)))
+        distance = math.hypot(dx / steps_per_mm[0], dy / steps_per_mm[1])
+        period = distance / (feed / 60.0) / ticks if ticks and feed > 0 else 0.0
+        return cls(dx, dy, np.arange(1, ticks + 1) * period)
+
+    @classmethod
+    def at_rate(cls, dx, dy, rate):
+        """Movimiento a `rate` tics (pasos del eje mayor) por segundo"""
+        ticks = max(abs(int(dx)), abs(int(dy)))
+        return cls(dx, dy, np.arange(1, ticks + 1) / float(rate))
+
+    @classmethod
+    def trapezoid(cls, dx, dy, distance, entry, cruise, exit, acceleration):
+        """Movimiento con perfil trapezoidal (mm, mm/s y mm/s²)
+
+        Acelera desde `entry` hasta `cruise`, sigue a esa velocidad y frena
+        hasta `exit`. Si la distancia no da para llegar a `cruise` el perfil es
+        triangular. El instante de cada tic sale de la distancia recorrida, que
+        crece igual en todos los tics del eje mayor.
+        """
+        ticks = max(abs(int(dx)), abs(int(dy)))
+        if not ticks:
+            return cls(dx, dy, np.zeros(0))
+        a = float(acceleration)
+        accel_distance = max(0.0, (cruise * cruise - entry * entry) / (2 * a))
+        decel_distance = max(0.0, (cruise * cruise - exit * exit) / (2 * a))
+        if accel_distance + decel_distance > distance:
+            cruise = math.sqrt((2 * a * distance + entry * entry + exit * exit) / 2)
+            accel_distance = min(distance, max(0.0, (cruise * cruise - entry * entry) / (2 * a)))
+            decel_distance = distance - accel_distance
+        cruise_end = distance - decel_distance
+        accel_time = (cruise - entry) / a
+        cruise_time = max(0.0, cruise_end - accel_distance) / cruise
+
+        s = np.arange(1, ticks + 1) * (distance / ticks)
+        accelerating = (np.sqrt(entry * entry + 2 * a * np.minimum(s, accel_distance)) - entry) / a
+        cruising = accel_time + (s - accel_distance) / cruise
+        braking = accel_time + cruise_time + (
+            cruise - np.sqrt(np.maximum(cruise * cruise - 2 * a * (s - cruise_end), 0.0))) / a
+        times = np.where(s <= accel_distance, accelerating,
+                         np.where(s <= cruise_end, cruising, braking))
+        return cls(dx, dy, times)
+
+    def axis_move(self):
+        """(eje, pasos, sentido) si solo se mueve un eje, si no None"""
+        if self.dy == 0:
+            return 'x', abs(self.dx), self.direction_x
+        if self.dx == 0:
+            return 'y', abs(self.dy), self.direction_y
+        return None
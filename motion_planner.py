@@ -0,0 +1,139 @@
+from motion_engine import LinearMove
+from collections import deque
+import logging
+import math
+
+logger = logging.getLogger('MotionPlanner')
+
+# Límites si la máquina no los define
+DEFAULT_MAX_FEED = 3000.0          # mm/min por eje
+DEFAULT_MAX_ACCEL = 500.0          # mm/s² por eje
+DEFAULT_JUNCTION_DEVIATION = 0.05  # mm
+
+class Block:
+    """Tramo rectilíneo pendiente de ejecutar (velocidades en mm/s)"""
+    def __init__(self, dx, dy, length, unit, nominal_speed, acceleration, tag):
+        self.dx = dx
+        self.dy = dy
+        self.length = length              # mm
+        self.unit = unit                  # Dirección (vector unitario en mm)
+        self.nominal_speed = nominal_speed
+        self.acceleration = acceleration  # mm/s²
+        self.tag = tag                    # Lo que el llamador asocia al tramo
+        self.max_entry_speed = 0.0        # Límite por el ángulo con el tramo anterior
+        self.entry_speed = 0.0
+        self.exit_speed = 0.0
+
+    def move(self):
+        """LinearMove con el perfil trapezoidal planificado"""
+        return LinearMove.trapezoid(self.dx, self.dy, self.length, self.entry_speed,
+                                    self.nominal_speed, self.exit_speed, self.acceleration)
+
+class MotionPlanner:
+    """Planificador de velocidades con anticipación (look-ahead)
+
+    Guarda los próximos tramos y calcula la velocidad de paso por cada vértice
+    a partir del ángulo entre tramos, la aceleración y la desviación permitida
+    en las esquinas (el método de Grbl): las rectas casi alineadas se enlazan
+    sin parar y las esquinas cerradas se toman despacio. Una pasada hacia
+    atrás limita cada vértice a lo que se puede frenar antes del final del
+    buffer (que termina parado) y otra hacia delante a lo que se puede
+    acelerar, así cada tramo sale con un perfil trapezoidal alcanzable.
+    """
+    LOOKAHEAD = 32  # Tramos que se miran por delante
+
+    def __init__(self, steps_per_mm, max_feed=(DEFAULT_MAX_FEED, DEFAULT_MAX_FEED),
+                 max_accel=(DEFAULT_MAX_ACCEL, DEFAULT_MAX_ACCEL),
+                 junction_deviation=DEFAULT_JUNCTION_DEVIATION, lookahead=None):
+        self.steps_per_mm = steps_per_mm
+        self.max_speed = tuple(feed / 60.0 for feed in max_feed)  # mm/s por eje
+        self.max_accel = tuple(max_accel)
+        self.junction_deviation = junction_deviation
+        self.lookahead = lookahead or self.LOOKAHEAD
+
+        self.blocks = deque()
+        self._previous = None  # Último tramo añadido (None si la máquina va a estar parada)
+        self._speed = 0.0      # Velocidad al final del último tramo entregado
+
+    @classmethod
+    def from_config(cls, config, steps_per_mm):
+        """Planificador con los límites de la configuración de la máquina"""
+        def value(key, default):
+            return float(config.get(key) or default)
+
+        return cls(steps_per_mm,
+                   max_feed=(value('max_feed_x', DEFAULT_MAX_FEED),
+                             value('max_feed_y', DEFAULT_MAX_FEED)),
+                   max_accel=(value('max_accel_x', DEFAULT_MAX_ACCEL),
+                              value('max_accel_y', DEFAULT_MAX_ACCEL)),
+                   junction_deviation=value('junction_deviation', DEFAULT_JUNCTION_DEVIATION))
+
+    def full(self):
+        return len(self.blocks) >= self.lookahead
+
+    def clear(self):
+        """Descartar los tramos pendientes (la máquina queda parada)"""
+        self.blocks.clear()
+        self._previous = None
+        self._speed = 0.0
+
+    def add(self, dx, dy, feed=None, tag=None):
+        """Añadir un tramo de (dx, dy) pasos a `feed` mm/min (None: lo más rápido posible)"""
+        if not dx and not dy:
+            return
+        mm = (dx / self.steps_per_mm[0], dy / self.steps_per_mm[1])
+        length = math.hypot(*mm)
+        unit = (mm[0] / length, mm[1] / length)
+
+        # Velocidad y aceleración a lo largo del tramo: las limita el eje más exigido
+        nominal = min(limit / abs(u) for limit, u in zip(self.max_speed, unit) if u)
+        if feed and feed > 0:
+            nominal = min(nominal, feed / 60.0)
+        acceleration = min(limit / abs(u) for limit, u in zip(self.max_accel, unit) if u)
+
+        block = Block(dx, dy, length, unit, nominal, acceleration, tag)
+        if self._previous is not None:
+            block.max_entry_speed = min(self._junction_speed(self._previous.unit, unit, acceleration),
+                                        nominal, self._previous.nominal_speed)
+        self.blocks.append(block)
+        self._previous = block
+
+    def pop(self):
+        """Sacar el primer tramo con su perfil definitivo: (tag, LinearMove)"""
+        self._plan()
+        block = self.blocks.popleft()
+        self._speed = block.exit_speed
+        if not self.blocks:
+            self._previous = None  # El último tramo termina parado
+        return block.tag, block.move()
+
+    def _junction_speed(self, previous, unit, acceleration):
+        """Velocidad máxima en el vértice entre dos direcciones (desviación en esquinas)"""
+        cos_theta = -(previous[0] * unit[0] + previous[1] * unit[1])
+        if cos_theta > 0.999999:
+            return 0.0  # Vuelta atrás: hay que parar
+        if cos_theta < -0.999999:
+            return math.inf  # Misma dirección: solo la limitan las velocidades nominales
+        sin_half = math.sqrt(0.5 * (1.0 - cos_theta))
+        return math.sqrt(acceleration * self.junction_deviation * sin_half / (1.0 - sin_half))
+
+    def _plan(self):
+        """Velocidades de entrada y salida de los tramos del buffer"""
+        # Hacia atrás: el último tramo termina parado y cada uno entra como
+        # mucho a la velocidad desde la que aún puede frenar
+        next_entry = 0.0
+        for block in reversed(self.blocks):
+            block.entry_speed = min(block.max_entry_speed,
+                                    math.sqrt(next_entry * next_entry
+                                              + 2 * block.acceleration * block.length))
+            next_entry = block.entry_speed
+
+        # Hacia delante: el primero entra a la velocidad a la que terminó el
+        # anterior y cada uno sale como mucho a lo que le da tiempo a acelerar
+        entry = self._speed
+        for i, block in enumerate(self.blocks):
+            block.entry_speed = entry
+            reachable = math.sqrt(entry * entry + 2 * block.acceleration * block.length)
+            following = self.blocks[i + 1].entry_speed if i + 1 < len(self.blocks) else 0.0
+            block.exit_speed = min(following, reachable)
+            entry = block.exit_speed
@@ -1,6 +1,8 @@
 from PIL import Image
 import logging
 import numpy as np
+from tiled_image import TiledImage
+from image_pipeline import ImagePipeline
 
 logger = logging.getLogger('PCBProcessor')
 
@@ -10,11 +12,23 @@ class PCBProcessor:
         self.width_mm = None
         self.height_mm = None
         
+        # Imágenes grandes: se generan por franjas sin cargarlas enteras
+        self.TILED_MIN_PIXELS = 50_000_000
+        self.PREVIEW_MAX_SIZE = 4000  # Lado máximo de la vista previa en modo por franjas
+        self.tiled_image = None
+        
+        # Preprocesado compartido por vistas previas y generación
+        self.pipeline = None
+        
     def load_image(self, file_path):
         """Cargar y procesar archivo de PCB (BMP o PNG)"""
         try:
-            # Cargar imagen
+            # Cargar imagen (Image.open solo lee la cabecera)
             self.image = Image.open(file_path)
+            self.pipeline = None
+            if self.tiled_image is not None:
+                self.tiled_image.close()
+                self.tiled_image = None
             
             # Verificar formato soportado
             if self.image.format not in ['BMP', 'PNG']:
@@ -43,6 +57,12 @@ class PCBProcessor:
                     self.width_mm = (self.image.width / dpi) * 25.4
                     self.height_mm = (self.image.height / dpi) * 25.4
             
+            # Leer por franjas si la imagen completa ocuparía demasiada memoria
+            if self.image.width * self.image.height >= self.TILED_MIN_PIXELS:
+                self.tiled_image = TiledImage(file_path, invert=True)
+                logger.info(f"Imagen grande ({self.image.width}x{self.image.height}): "
+                            f"procesado por franjas")
+            
             logger.info(f"Imagen cargada: {self.width_mm:.2f}mm x {self.height_mm:.2f}mm")
             logger.debug(f"Formato: {self.image.format}, Modo: {self.image.mode}")
             return True
@@ -60,23 +80,37 @@ class PCBProcessor:
             }
         return None
     
+    def get_pipeline(self):
+        """Obtener el preprocesado compartido de la imagen de preview"""
+        if self.image is None:
+            return None
+        
+        if self.pipeline is None:
+            # En modo por franjas la vista previa es reducida (ya invertida)
+            if self.tiled_image is not None:
+                self.pipeline = ImagePipeline(self.tiled_image.thumbnail(self.PREVIEW_MAX_SIZE))
+            else:
+                # Escala de grises invertida (pistas en blanco)
+                self.pipeline = ImagePipeline(self.image, invert=True)
+        return self.pipeline
+    
     def get_preview_image(self):
         """Obtener imagen procesada para preview"""
         if self.image is None:
             return None
             
         try:
-            # Convertir a escala de grises si no lo está
-            if self.image.mode != 'L':
-                preview = self.image.convert('L')
-            else:
-                preview = self.image.copy()
-            
-            # Invertir imagen (pistas en blanco)
-            preview = Image.eval(preview, lambda x: 255 - x)
-            
-            return preview
+            # Imagen sobre el buffer de grises del pipeline, sin copias
+            return self.get_pipeline().image
             
         except Exception as e:
             logger.error(f"Error preparando preview: {e}")
-            return None 
\ No newline at end of file
+            return None 
+    
+    def get_generation_image(self):
+        """Imagen para generar G-code a resolución completa
+
+        Devuelve la imagen por franjas si la imagen es grande, o None si basta
+        con la vista previa (que ya está a resolución completa).
+        """
+        return self.tiled_image
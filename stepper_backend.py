@@ -0,0 +1,263 @@
+import logging
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger('StepperBackend')
+
+# Pasos/s si la máquina no define 'step_rate' (el periodo de 2 ms de siempre)
+DEFAULT_STEP_RATE = 500
+
+class AxisPins:
+    """Pines de un eje: STEP, DIR y final de carrera de home"""
+    def __init__(self, step, direction, home):
+        self.step = step
+        self.direction = direction
+        self.home = home
+
+    @classmethod
+    def from_config(cls, config, axis):
+        axis = axis.lower()
+        return cls(int(config[f'{axis}_step']), int(config[f'{axis}_dir']),
+                   int(config[f'{axis}_home']))
+
+class EndstopMonitor:
+    """Estado de los finales de carrera avisado por la placa
+
+    pymata4 llama a `callback` desde su hilo de lectura cada vez que cambia un
+    pin de entrada (y al activar su reporte). Cada eje tiene un
+    threading.Event que está activo mientras su final de carrera (activo en
+    bajo) está pulsado, así los bucles de pasos solo miran un flag y el home
+    puede esperar al evento.
+    """
+    def __init__(self, pins):
+        self.pins = pins
+        self.triggered = {axis: threading.Event() for axis in pins}
+        self._axis = {axis_pins.home: axis for axis, axis_pins in pins.items()}
+
+    def callback(self, data):
+        """Callback de pymata4: [tipo de pin, pin, valor, instante]"""
+        axis = self._axis.get(data[1])
+        if axis is None:
+            return
+        if data[2] == 0:
+            self.triggered[axis].set()
+        else:
+            self.triggered[axis].clear()
+
+class BitBangBackend:
+    """Pasos generados desde el PC: dos digital_write por paso
+
+    Funciona con cualquier firmware Firmata, pero cada paso cuesta dos mensajes
+    por USB y dos esperas, así que la velocidad máxima es baja. Al ir hacia
+    home comprueba el final de carrera antes de cada paso: con EndstopMonitor
+    mira el flag que actualizan los avisos de la placa y sin él lee el pin.
+    """
+    name = 'bitbang'
+
+    def __init__(self, board, pins, endstops=None):
+        self.board = board
+        self.pins = pins  # {'x': AxisPins, 'y': AxisPins}
+        self.endstops = endstops
+
+    def endstop_check(self, axis):
+        """Función sin argumentos que dice si el final de carrera del eje está pulsado"""
+        if self.endstops is not None:
+            return self.endstops.triggered[axis].is_set
+        home = self.pins[axis].home
+        return lambda: self.board.digital_read(home)[0] == 0  # Activo en bajo
+
+    def move(self, axis, steps, direction, rate=DEFAULT_STEP_RATE):
+        """Dar `steps` pasos en un sentido; False si salta el final de carrera"""
+        pins = self.pins[axis]
+        half_period = 0.5 / rate
+        # Solo se para hacia home: alejándose se puede salir del final de carrera
+        triggered = self.endstop_check(axis) if direction < 0 else (lambda: False)
+
+        # Establecer dirección
+        self.board.digital_write(pins.direction, 1 if direction > 0 else 0)
+        time.sleep(0.001)  # Pequeño delay para estabilizar la señal de dirección
+
+        for step in range(steps):
+            # Verificar endstop
+            if triggered():
+                logger.warning(f"Endstop {axis} activado")
+                return False
+
+            # Paso
+            self.board.digital_write(pins.step, 1)
+            time.sleep(half_period)
+            self.board.digital_write(pins.step, 0)
+            time.sleep(half_period)
+
+        return True
+
+    def move_linear(self, move):
+        """Movimiento coordinado (LinearMove): los pasos de X e Y de cada tic a su hora"""
+        x, y = self.pins['x'], self.pins['y']
+        # Los finales de carrera solo paran los ejes que van hacia home: con
+        # uno pulsado (recién hecho el home) hay que poder salir de él
+        toward_x, toward_y = move.direction_x < 0, move.direction_y < 0
+        triggered_x, triggered_y = self.endstop_check('x'), self.endstop_check('y')
+        self.board.digital_write(x.direction, 1 if move.direction_x > 0 else 0)
+        self.board.digital_write(y.direction, 1 if move.direction_y > 0 else 0)
+        time.sleep(0.001)  # Pequeño delay para estabilizar la señal de dirección
+
+        # Cada tic espera a su instante desde el inicio, así los retrasos no se acumulan
+        start = time.perf_counter()
+        for step_x, step_y, when in zip(move.x_steps.tolist(), move.y_steps.tolist(),
+                                        move.times.tolist()):
+            if step_x and toward_x and triggered_x():
+                logger.warning("Endstop x activado")
+                return False
+            if step_y and toward_y and triggered_y():
+                logger.warning("Endstop y activado")
+                return False
+
+            delay = start + when - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            # Flancos de subida juntos y luego de bajada
+            if step_x:
+                self.board.digital_write(x.step, 1)
+            if step_y:
+                self.board.digital_write(y.step, 1)
+            if step_x:
+                self.board.digital_write(x.step, 0)
+            if step_y:
+                self.board.digital_write(y.step, 0)
+
+        return True
+
+    def reset(self):
+        """Los pines se han movido desde fuera del backend (nada que hacer)"""
+
+class FirmataStepperBackend:
+    """Pasos generados por la placa con el soporte de motores de FirmataExpress
+
+    FirmataExpress mueve un único motor con la librería Stepper de Arduino; en
+    modo de dos hilos sus pines siguen la secuencia 01, 11, 10, 00. Con STEP en
+    el primer pin y DIR en el segundo, cada 4 pasos de la librería hay un
+    flanco de subida en STEP, con DIR a 1 si se avanza y a 0 si se retrocede,
+    así que un driver STEP/DIR recibe un paso en el sentido correcto. Cada
+    movimiento se parte en comandos de CHECK_INTERVAL segundos y los pasos
+    terminan siempre en la fase 01. La placa no vigila los finales de carrera
+    ni se puede parar a mitad de un comando: al ir hacia home el PC los mira
+    antes de enviar cada comando, así que el motor se pasa como mucho un
+    comando. El home
+    sigue usando BitBangBackend.
+    """
+    name = 'firmata'
+    PHASES = 4               # Pasos de la librería por paso del driver
+    MAX_LIBRARY_STEPS = 16380  # Múltiplo de 4 que cabe en 14 bits
+    STEPS_PER_REVOLUTION = 240  # Con 240, las rpm de la librería son pasos/s del driver
+    RATE_TOLERANCE = 0.1     # Cambio de velocidad (10 %) que abre un tramo nuevo
+    CHECK_INTERVAL = 0.05    # Segundos de movimiento por comando entre comprobaciones
+    LINK_LEAD = 0.002        # Antelación con la que se envía el comando siguiente
+
+    def __init__(self, board, pins, endstops=None):
+        self.board = board
+        self.pins = pins
+        self.axis = None  # Eje configurado ahora en la placa (solo admite uno)
+        self.fallback = BitBangBackend(board, pins, endstops)  # Para mover los dos ejes a la vez
+
+    def move(self, axis, steps, direction, rate=DEFAULT_STEP_RATE):
+        """Dar `steps` pasos en comandos cortos; False si salta el final de carrera"""
+        # Como en BitBangBackend, el final de carrera solo para los pasos hacia home
+        triggered = self.fallback.endstop_check(axis) if direction < 0 else (lambda: False)
+        if steps and axis != self.axis:
+            self._configure(axis)
+
+        rate = max(1, int(round(rate)))
+        chunk_steps = max(1, min(int(rate * self.CHECK_INTERVAL),
+                                 self.MAX_LIBRARY_STEPS // self.PHASES))
+        remaining = steps
+        while remaining > 0:
+            # Si ha saltado no se envía más: el motor se para al acabar el comando en curso
+            if triggered():
+                logger.warning(f"Endstop {axis} activado")
+                return False
+
+            chunk = min(remaining, chunk_steps)
+            library_steps = chunk * self.PHASES
+            self.board.stepper_write(rate, library_steps if direction > 0 else -library_steps)
+            remaining -= chunk
+
+            # La placa no avisa al terminar: el siguiente comando se envía
+            # justo antes de que acabe este para que no haya huecos
+            lead = self.LINK_LEAD if remaining else 0.0
+            time.sleep(max(0.0, chunk / rate - lead))
+        return True
+
+    def move_linear(self, move):
+        """Movimiento coordinado: en la placa si es de un solo eje, si no desde el PC
+
+        La placa solo mueve un motor cada vez, así que las diagonales se generan
+        desde el PC; las líneas horizontales del relleno siguen yendo por la placa.
+        La librería Stepper no acelera: las rampas se envían como tramos a
+        velocidad constante.
+        """
+        single = move.axis_move()
+        if single is not None:
+            axis, steps, direction = single
+            for piece_steps, rate in self._rate_pieces(move):
+                if not self.move(axis, piece_steps, direction, rate):
+                    return False
+            return True
+
+        self.reset()
+        return self.fallback.move_linear(move)
+
+    def _rate_pieces(self, move):
+        """(pasos, pasos/s) de los tramos a velocidad constante que siguen el perfil"""
+        if not move.ticks:
+            return []
+        times = np.concatenate(([0.0], move.times))
+        if times[-1] <= 0:
+            return [(move.ticks, DEFAULT_STEP_RATE)]
+
+        # Un tramo nuevo cada vez que la velocidad cambia de escalón
+        rates = 1.0 / np.maximum(np.diff(times), 1e-9)
+        levels = np.floor(np.log(rates) / np.log1p(self.RATE_TOLERANCE))
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(levels)) + 1, [move.ticks])).tolist()
+
+        pieces = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            rate = max(1, int(round((end - start) / (times[end] - times[start]))))
+            if pieces and pieces[-1][1] == rate:
+                pieces[-1] = (pieces[-1][0] + end - start, rate)
+            else:
+                pieces.append((end - start, rate))
+        return pieces
+
+    def reset(self):
+        """Los pines se han movido desde fuera: volver a configurar antes de mover"""
+        self.axis = None
+
+    def _configure(self, axis):
+        """Asignar el motor de la placa a un eje y dejar sus pines en la fase 01"""
+        pins = self.pins[axis]
+        self.board.set_pin_mode_stepper(self.STEPS_PER_REVOLUTION, [pins.step, pins.direction])
+        self.board.digital_write(pins.step, 0)
+        self.board.digital_write(pins.direction, 1)
+        self.axis = axis
+        logger.debug(f"Motor de la placa asignado al eje {axis.upper()}")
+
+def create_backend(board, config, endstops=None):
+    """Backend de pasos según 'stepper_backend' (auto, firmata o bitbang)"""
+    pins = {axis: AxisPins.from_config(config, axis) for axis in ('x', 'y')}
+    choice = str(config.get('stepper_backend') or 'auto').lower()
+
+    # En auto se usa la placa solo si lleva FirmataExpress
+    if choice == 'firmata' or (choice == 'auto' and getattr(board, 'using_firmata_express', False)):
+        try:
+            backend = FirmataStepperBackend(board, pins, endstops)
+            backend._configure('x')
+            logger.info("Pasos generados por la placa (FirmataExpress)")
+            return backend
+        except Exception as e:
+            logger.warning(f"Sin soporte de motores en el firmware, se usa el PC: {e}")
+
+    logger.info("Pasos generados desde el PC")
+    return BitBangBackend(board, pins, endstops)
@@ -0,0 +1,518 @@
+import hashlib
+import io
+import logging
+import os
+import struct
+import tempfile
+import zlib
+import numpy as np
+import cv2
+from PIL import Image
+from image_pipeline import resample_area
+
+logger = logging.getLogger('TiledImage')
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}  # Canales por tipo de color
+PNG_BYTE_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}     # Tipo de color de 8 bits con N bytes por píxel
+PNG_READ_SIZE = 1 << 16                       # Bytes comprimidos leídos de cada vez
+
+def _png_chunk(kind, *pieces):
+    """Bloque PNG como lista de trozos (sin juntar los datos)"""
+    crc = zlib.crc32(kind)
+    for piece in pieces:
+        crc = zlib.crc32(piece, crc)
+    return [struct.pack('>I', sum(len(piece) for piece in pieces)) + kind, *pieces,
+            struct.pack('>I', crc)]
+
+class TiledImage:
+    """Imagen en escala de grises leída por franjas horizontales
+
+    Los BMP sin comprimir se decodifican franja a franja directamente desde el
+    archivo (mapeado en memoria), sin cargar nunca la imagen completa. El resto
+    de formatos se vuelcan en escala de grises a un archivo temporal mapeado en
+    memoria, del que luego se leen las franjas: los PNG se decodifican por
+    franjas y los demás (y los PNG entrelazados o de 16 bits en color) de una
+    vez.
+    Se puede enviar a otro proceso: la copia vuelve a mapear el mismo archivo
+    (el BMP o el temporal, que sigue siendo del original) sin decodificar.
+    """
+    def __init__(self, file_path, strip_rows=512, invert=False):
+        self.file_path = file_path
+        self.strip_rows = strip_rows
+        self.invert = invert  # Invertir como en la vista previa (pistas en blanco)
+
+        self.image = Image.open(file_path)
+        self.size = self.image.size
+        self.mode = 'L'
+        self.format = self.image.format
+
+        self._raw = None
+        self._scratch = None
+        self._scratch_path = None
+        self._owns_scratch = True  # Solo el original borra el temporal
+        if not self._open_raw():
+            self._open_scratch()
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    def _open_raw(self):
+        """Mapear los píxeles de un BMP sin comprimir para leer filas sueltas"""
+        tile = self.image.tile
+        if self.format != 'BMP' or len(tile) != 1 or tile[0][0] != 'raw':
+            return False
+
+        _, extents, offset, args = tile[0]
+        rawmode, stride, direction = args
+        if extents != (0, 0) + self.size:
+            return False
+
+        rows = np.memmap(self.file_path, dtype=np.uint8, mode='r',
+                         offset=offset, shape=(self.height, stride))
+
+        # Los BMP suelen guardarse de abajo arriba
+        self._raw = rows[::-1] if direction < 0 else rows
+        self._rawmode = rawmode
+        self._stride = stride
+        self._palette = self.image.palette
+        logger.debug(f"Lectura por franjas directa: {self.size[0]}x{self.size[1]}, {rawmode}")
+        return True
+
+    def _open_scratch(self):
+        """Decodificar una vez y volcar la escala de grises a un archivo temporal"""
+        fd, self._scratch_path = tempfile.mkstemp(prefix='arla_', suffix='.gray')
+        os.close(fd)
+        self._scratch = np.memmap(self._scratch_path, dtype=np.uint8, mode='w+',
+                                  shape=(self.height, self.width))
+
+        if not self._decode_png():
+            logger.debug(f"Decodificando la imagen completa ({self.format}, {self.image.mode})")
+            self.image.load()
+            for start in range(0, self.height, self.strip_rows):
+                stop = min(start + self.strip_rows, self.height)
+                strip = self.image.crop((0, start, self.width, stop))
+                if strip.mode != 'L':
+                    strip = strip.convert('L')
+                self._scratch[start:stop] = np.asarray(strip)
+        self._scratch.flush()
+
+        # Liberar la imagen decodificada, a partir de aquí se lee del archivo temporal
+        self.image.close()
+        self.image = None
+        logger.debug(f"Imagen volcada a archivo temporal: {self._scratch_path}")
+
+    def _decode_png(self):
+        """Volcar un PNG al archivo temporal decodificándolo franja a franja
+
+        Cada fila de un PNG va filtrada respecto a la anterior, así que cada
+        franja se decodifica con PIL como un PNG pequeño que empieza por la
+        última fila de la franja anterior ya sin filtrar. En ese PNG el tipo de
+        color se cambia por uno de 8 bits con los mismos bytes por píxel (los
+        filtros solo dependen de eso) y se obtienen los bytes originales de las
+        filas, que luego se pasan a gris como los de un BMP. No sirve para PNG
+        entrelazados ni de 16 bits en color (6 u 8 bytes por píxel).
+        """
+        tile = self.image.tile
+        if self.format != 'PNG' or len(tile) != 1 or tile[0][0] != 'zip':
+            return False
+
+        with open(self.file_path, 'rb') as f:
+            if f.read(8) != PNG_SIGNATURE:
+                return False
+            length, kind = struct.unpack('>I4s', f.read(8))
+            if kind != b'IHDR':
+                return False
+            width, height, depth, color, _, _, interlace = struct.unpack('>IIBBBBB', f.read(13))
+            f.seek(length - 13 + 4, os.SEEK_CUR)
+
+            bits = PNG_CHANNELS.get(color, 0) * depth
+            pixel_bytes = max(1, bits // 8)
+            if interlace or (width, height) != self.size or pixel_bytes not in PNG_BYTE_TYPES:
+                return False
+            stride = (width * bits + 7) // 8
+            strip_width, strip_color = stride // pixel_bytes, PNG_BYTE_TYPES[pixel_bytes]
+
+            chunks = self._png_idat(f)
+            decompressor = zlib.decompressobj()
+            pending = bytearray()
+            previous = None
+            start = 0
+            while start < self.height:
+                # Descomprimir las filas filtradas de la franja (filtro + bytes)
+                rows = min(self.strip_rows, self.height - start)
+                needed = rows * (stride + 1)
+                while len(pending) < needed:
+                    if decompressor.unconsumed_tail:
+                        data = decompressor.unconsumed_tail
+                    else:
+                        data = next(chunks, None)
+                        if data is None:
+                            logger.error(f"PNG incompleto: {self.file_path}")
+                            return False
+                    pending += decompressor.decompress(data, needed - len(pending))
+                filtered = pending[:needed]
+                del pending[:needed]
+
+                # Quitar los filtros con PIL partiendo de la fila anterior (sin comprimir)
+                compressor = zlib.compressobj(0)
+                idat = [compressor.compress(b'\x00' + previous) if previous is not None else b'',
+                        compressor.compress(filtered), compressor.flush()]
+                strip_rows = rows + (previous is not None)
+                strip_png = b''.join([PNG_SIGNATURE,
+                                      *_png_chunk(b'IHDR', struct.pack('>IIBBBBB', strip_width, strip_rows,
+                                                                       8, strip_color, 0, 0, 0)),
+                                      *_png_chunk(b'IDAT', *idat),
+                                      *_png_chunk(b'IEND')])
+                with Image.open(io.BytesIO(strip_png)) as strip:
+                    raw = strip.tobytes()
+                skip = stride if previous is not None else 0
+                previous = raw[-stride:]
+
+                raw = np.frombuffer(raw, dtype=np.uint8, offset=skip).reshape(rows, stride)
+                self._scratch[start:start + rows] = self._raw_gray(raw, tile[0][3], stride,
+                                                                   self.image.palette)
+                start += rows
+
+        logger.debug(f"PNG decodificado por franjas: {self.width}x{self.height}, {tile[0][3]}")
+        return True
+
+    def _png_idat(self, f):
+        """Datos comprimidos de los bloques IDAT, en trozos de PNG_READ_SIZE"""
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return
+            length, kind = struct.unpack('>I4s', header)
+            if kind == b'IEND':
+                return
+            if kind != b'IDAT':
+                f.seek(length + 4, os.SEEK_CUR)
+                continue
+            while length:
+                data = f.read(min(length, PNG_READ_SIZE))
+                if not data:
+                    return
+                length -= len(data)
+                yield data
+            f.seek(4, os.SEEK_CUR)  # CRC
+
+    def _raw_gray(self, raw, rawmode, stride, palette):
+        """Filas con los bytes del archivo a escala de grises"""
+        raw = np.ascontiguousarray(raw)
+        strip = Image.frombuffer(self.image.mode, (self.width, len(raw)), raw,
+                                 'raw', rawmode, stride, 1)
+        if palette is not None and strip.mode == 'P':
+            strip.putpalette(palette.palette, palette.rawmode)
+        if strip.mode != 'L':
+            strip = strip.convert('L')
+        return np.array(strip)
+
+    def read_rows(self, start, stop, step=1):
+        """Leer filas [start, stop) cada `step` como array uint8 en escala de grises"""
+        if self._raw is not None:
+            gray = self._raw_gray(self._raw[start:stop:step], self._rawmode, self._stride,
+                                  self._palette)
+        else:
+            gray = np.array(self._scratch[start:stop:step])
+
+        if self.invert:
+            np.subtract(255, gray, out=gray)
+        return gray
+
+    def strips(self, step=1, margin=0):
+        """Recorrer la imagen por franjas
+
+        Devuelve tuplas (primera fila, última fila + 1, filas, filas de margen
+        superior). Con `step` solo se leen las filas múltiplo del paso; con
+        `margin` cada franja incluye filas extra arriba y abajo.
+        """
+        rows_per_strip = self.strip_rows * step
+        for start in range(0, self.height, rows_per_strip):
+            stop = min(start + rows_per_strip, self.height)
+            top = min(margin, start)
+            bottom = min(margin, self.height - stop)
+            yield start, stop, self.read_rows(start - top, stop + bottom, step), top
+
+    def content_hash(self):
+        """Huella del contenido leyendo los píxeles por franjas (sin decodificar)"""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{self.width}x{self.height}:{self.invert}".encode())
+        if self._raw is not None:
+            digest.update(self._rawmode.encode())
+            if self._palette is not None:
+                digest.update(bytes(self._palette.palette))
+            pixels = self._raw
+        else:
+            pixels = self._scratch
+
+        for start in range(0, self.height, self.strip_rows):
+            digest.update(np.ascontiguousarray(pixels[start:start + self.strip_rows]).data)
+        return digest.hexdigest()
+
+    def thumbnail(self, max_size):
+        """Imagen reducida para vista previa leyendo una fracción de las filas"""
+        step = max(1, -(-max(self.size) // max_size))
+        rows = [gray[:, ::step] for _, _, gray, _ in self.strips(step)]
+        return Image.fromarray(np.vstack(rows))
+
+    def resampled(self, size):
+        """Escala de grises reducida a `size` (ancho, alto) promediando áreas, por franjas"""
+        return resample_area(self.read_rows, self.height, size, self.strip_rows)
+
+    def __getstate__(self):
+        return {'file_path': self.file_path, 'strip_rows': self.strip_rows,
+                'invert': self.invert, 'scratch_path': self._scratch_path}
+
+    def __setstate__(self, state):
+        self.file_path = state['file_path']
+        self.strip_rows = state['strip_rows']
+        self.invert = state['invert']
+        self.image = Image.open(self.file_path)
+        self.size = self.image.size
+        self.mode = 'L'
+        self.format = self.image.format
+
+        self._raw = None
+        self._scratch = None
+        self._scratch_path = state['scratch_path']
+        self._owns_scratch = False
+        if self._scratch_path is not None:
+            self._scratch = np.memmap(self._scratch_path, dtype=np.uint8, mode='r',
+                                      shape=(self.height, self.width))
+            self.image.close()
+            self.image = None
+        elif not self._open_raw():
+            raise ValueError(f"No se puede volver a abrir {self.file_path}")
+
+    def close(self):
+        """Cerrar archivos y borrar el temporal"""
+        self._raw = None
+        if self._scratch is not None:
+            del self._scratch
+            self._scratch = None
+            if self._owns_scratch:
+                try:
+                    os.remove(self._scratch_path)
+                except OSError:
+                    pass
+        if self.image is not None:
+            self.image.close()
+            self.image = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+class ContourStitcher:
+    """Unir contornos encontrados por franjas en contornos de la imagen completa
+
+    Cada franja aporta sus contornos (cv2.CHAIN_APPROX_NONE) en coordenadas
+    locales. Los que no tocan un corte entre franjas están completos. Los que
+    lo tocan se parten en arcos separados por tramos sobre la fila de corte, y
+    cada tramo se empareja con el tramo de la franja vecina que se le solapa
+    (vecindad 8): el contorno entra a la otra franja por uno y vuelve por el
+    otro. Un tramo sin pareja es un contorno que toca el corte y se da la vuelta.
+    """
+    def __init__(self):
+        self.contours = []          # Contornos completos (Nx2, coordenadas globales)
+        self._arcs = []             # Puntos de cada arco
+        self._next = []             # Arco siguiente de cada arco
+        self._runs = {}             # Tramos en cada corte: (fila frontera, lado) -> lista
+
+    def add_strip(self, y0, height, contours, top_cut, bottom_cut):
+        """Añadir los contornos de la franja de filas [y0, y0 + height)"""
+        for contour in contours:
+            points = contour.reshape(-1, 2) + np.array([0, y0])
+            on_cut = np.zeros(len(points), dtype=bool)
+            if top_cut:
+                on_cut |= points[:, 1] == y0
+            if bottom_cut:
+                on_cut |= points[:, 1] == y0 + height - 1
+
+            if not on_cut.any():
+                self.contours.append(self._compress(points))
+                continue
+
+            # Contorno tendido sobre el corte: solo sirve de puente entre tramos
+            if on_cut.all():
+                self._add_run(points, y0, height, None, None)
+                continue
+
+            # Girar para empezar por el primer punto de un arco
+            first = int(np.flatnonzero(np.roll(on_cut, 1) & ~on_cut)[0])
+            points = np.roll(points, -first, axis=0)
+            on_cut = np.roll(on_cut, -first)
+
+            # Secuencia arco, tramo, arco, tramo... terminando en tramo
+            bounds = np.flatnonzero(np.diff(np.concatenate(([0], on_cut.astype(np.int8), [0]))))
+            run_starts, run_stops = bounds[0::2].tolist(), bounds[1::2].tolist()
+            arc_starts = [0] + run_stops[:-1]
+
+            base = len(self._arcs)
+            for arc_start, run_start in zip(arc_starts, run_starts):
+                self._arcs.append(self._compress(points[arc_start:run_start], closed=False))
+                self._next.append(None)
+
+            count = len(run_starts)
+            for i, (run_start, run_stop) in enumerate(zip(run_starts, run_stops)):
+                self._add_run(points[run_start:run_stop], y0, height,
+                              base + i, base + (i + 1) % count)
+
+    def _add_run(self, run, y0, height, arc_in, arc_out):
+        """Registrar un tramo sobre la fila de corte y los arcos que llegan y salen"""
+        y = int(run[0, 1])
+        side = 'above' if y == y0 + height - 1 else 'below'
+        boundary = y + 1 if side == 'above' else y
+        self._runs.setdefault((boundary, side), []).append({
+            'x0': int(run[:, 0].min()),
+            'x1': int(run[:, 0].max()),
+            'in': arc_in,
+            'out': arc_out,
+            'direction': int(np.sign(run[-1, 0] - run[0, 0])),  # 1 = hacia +x
+            'points': run
+        })
+
+    def _groups(self, above, below):
+        """Agrupar tramos de ambos lados del corte que se tocan (vecindad 8)"""
+        runs = above + below
+        parent = list(range(len(runs)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        # Barrido por x: cada tramo se une a los del otro lado que siguen abiertos
+        order = sorted(range(len(runs)), key=lambda i: runs[i]['x0'])
+        active = []
+        for i in order:
+            active = [j for j in active if runs[j]['x1'] + 1 >= runs[i]['x0']]
+            for j in active:
+                if (i < len(above)) != (j < len(above)):
+                    parent[find(i)] = find(j)
+            active.append(i)
+
+        groups = {}
+        for i in range(len(runs)):
+            groups.setdefault(find(i), ([], []))[0 if i < len(above) else 1].append(runs[i])
+        return list(groups.values())
+
+    def _chain(self, runs, direction):
+        """Enlazar los huecos entre tramos de un lado y devolver sus puertas extremas
+
+        Recorriendo los tramos en su sentido, el contorno que sale por un tramo
+        vuelve por el siguiente. Quedan libres la entrada del primero y la
+        salida del último.
+        """
+        runs = sorted(runs, key=lambda r: r['x0'], reverse=direction < 0)
+        for previous, current in zip(runs, runs[1:]):
+            self._next[current['in']] = previous['out']
+        return runs[0]['in'], runs[-1]['out']
+
+    def _link(self, above, below):
+        """Enlazar los arcos que llegan a un corte con los que salen de él"""
+        for group_above, group_below in self._groups(above, below):
+            ports_above = [r for r in group_above if r['in'] is not None]
+            ports_below = [r for r in group_below if r['in'] is not None]
+
+            # Un contorno tendido sobre el corte que no toca nada sigue siendo contorno
+            if not ports_above and not ports_below:
+                self.contours.extend(r['points'] for r in group_above + group_below)
+                continue
+
+            # Sentido de recorrido sobre el corte (opuesto en cada lado)
+            direction = sum(r['direction'] for r in ports_above) - \
+                sum(r['direction'] for r in ports_below)
+            direction = 1 if direction >= 0 else -1
+
+            if not ports_below:
+                first_in, last_out = self._chain(ports_above, direction)
+                self._next[first_in] = last_out
+            elif not ports_above:
+                first_in, last_out = self._chain(ports_below, -direction)
+                self._next[first_in] = last_out
+            else:
+                # El contorno baja por un extremo del grupo y vuelve por el otro
+                above_in, above_out = self._chain(ports_above, direction)
+                below_in, below_out = self._chain(ports_below, -direction)
+                self._next[above_in] = below_out
+                self._next[below_in] = above_out
+
+    def finish(self):
+        """Enlazar todos los arcos y devolver la lista de contornos completos"""
+        boundaries = sorted({key[0] for key in self._runs})
+        for boundary in boundaries:
+            self._link(self._runs.get((boundary, 'above'), []),
+                       self._runs.get((boundary, 'below'), []))
+
+        # Recorrer cadenas de arcos: abiertas primero, luego ciclos
+        has_previous = set(n for n in self._next if n is not None)
+        visited = set()
+        heads = [i for i in range(len(self._arcs)) if i not in has_previous]
+        heads += list(range(len(self._arcs)))
+        stitched = []
+        for head in heads:
+            if head in visited:
+                continue
+            chain = []
+            arc = head
+            while arc is not None and arc not in visited:
+                visited.add(arc)
+                chain.append(self._arcs[arc])
+                arc = self._next[arc]
+            stitched.append(self._compress(np.concatenate(chain)))
+
+        self.contours = self._external(self.contours + stitched, stitched)
+        self._arcs = []
+        self._next = []
+        self._runs = {}
+        return self.contours
+
+    def _external(self, contours, stitched):
+        """Quitar bordes de huecos y lo que encierran, como cv2.RETR_EXTERNAL
+
+        Dentro de una franja un contorno cerrado que la atraviesa queda
+        abierto, así que también se recorre su lado interior. Al unirlo, ese
+        lado interior sale como un contorno con el sentido de un hueco (área
+        orientada positiva, los externos de OpenCV la tienen negativa).
+        """
+        holes = [c for c in stitched
+                 if len(c) > 2 and cv2.contourArea(c.reshape(-1, 1, 2).astype(np.float32), True) > 0]
+        if not holes:
+            return contours
+
+        hole_ids = set(id(c) for c in holes)
+        boxes = np.array([[*c.min(axis=0), *c.max(axis=0)] for c in contours])
+        inside = np.array([id(c) in hole_ids for c in contours])
+        for hole in holes:
+            x0, y0 = hole.min(axis=0)
+            x1, y1 = hole.max(axis=0)
+            candidates = np.flatnonzero((boxes[:, 0] > x0) & (boxes[:, 2] < x1) &
+                                        (boxes[:, 1] > y0) & (boxes[:, 3] < y1) & ~inside)
+            polygon = hole.reshape(-1, 1, 2).astype(np.int32)
+            for i in candidates.tolist():
+                x, y = contours[i][0]
+                if cv2.pointPolygonTest(polygon, (float(x), float(y)), False) > 0:
+                    inside[i] = True
+
+        return [c for c, hidden in zip(contours, inside) if not hidden]
+
+    def _compress(self, contour, closed=True):
+        """Quitar puntos intermedios de tramos rectos (como cv2.CHAIN_APPROX_SIMPLE)"""
+        if len(contour) < 3:
+            return contour
+        step_in = contour - np.roll(contour, 1, axis=0)
+        step_out = np.roll(contour, -1, axis=0) - contour
+        keep = (step_in != step_out).any(axis=1)
+        if not closed:
+            keep[[0, -1]] = True
+        return contour[keep] if keep.any() else contour[:1]
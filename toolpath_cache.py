@@ -0,0 +1,293 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger('ToolpathCache')
+
+# Cambiar si cambia el formato de las entradas o la forma de generar la geometría
+CACHE_VERSION = 1
+
+def default_cache_dir():
+    """Directorio de la caché del usuario, el mismo sea cual sea el directorio de trabajo"""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'arlapwm', 'toolpath_cache')
+
+def image_digest(image):
+    """Huella del contenido de una imagen (PIL o TiledImage), leída por franjas"""
+    if hasattr(image, 'content_hash'):
+        return image.content_hash()
+
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}".encode())
+    width, height = image.size
+    for top in range(0, height, 1024):
+        digest.update(image.crop((0, top, width, min(top + 1024, height))).tobytes())
+    return digest.hexdigest()
+
+def make_key(digest, params):
+    """Clave de la caché: huella de la imagen más parámetros de generación"""
+    text = json.dumps({'version': CACHE_VERSION, 'image': digest, 'params': params},
+                      sort_keys=True)
+    return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+class CachedToolpaths:
+    """Toolpaths de una entrada en disco leídos de uno en uno
+
+    Mantiene abierto el .npz mientras se usa (también sirve para emitir las
+    copias de un panel), así que hay que cerrarlo al terminar.
+    """
+    def __init__(self, path):
+        self._data = np.load(path, allow_pickle=False)
+        meta = json.loads(self._data['meta'].tobytes().decode())
+        self.labels = meta['labels']
+        self.stats = meta['stats']
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        from gcode_generator import Toolpath
+
+        if not 0 <= index < len(self.labels):
+            raise IndexError(index)
+        return Toolpath(self._data[f'moves_{index}'], self._data[f'offsets_{index}'],
+                        self.labels[index])
+
+    def close(self):
+        self._data.close()
+
+class EntryWriter:
+    """Escritura de una entrada en disco a medida que llegan sus toolpaths
+
+    Cada toolpath se escribe en el .npz en cuanto se añade, así la entrada no
+    se acumula en memoria; solo se guardan los toolpaths mientras la entrada
+    cabe en el nivel en memoria. Si supera `limit` bytes se descarta.
+    """
+    def __init__(self, cache, key, limit):
+        self.cache = cache
+        self.key = key
+        self.limit = limit
+        self.size = 0
+        self._labels = []
+        self._chunks = []  # Mientras la entrada quepa en memoria (None si no)
+        self._temp_path = cache._path(key) + '.tmp'
+        self._file = None
+        try:
+            os.makedirs(cache._cache_dir, exist_ok=True)
+            self._file = zipfile.ZipFile(self._temp_path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+        except Exception as e:
+            logger.error(f"Error guardando caché de toolpaths: {e}")
+
+    @property
+    def active(self):
+        return self._file is not None
+
+    def add(self, toolpath):
+        """Escribir un toolpath; False si la entrada ya no se va a guardar"""
+        if self._file is None:
+            return False
+        self.size += toolpath.moves.nbytes + toolpath.offsets.nbytes
+        if self.limit is not None and self.size > self.limit:
+            logger.debug("Entrada demasiado grande para la caché")
+            self.discard()
+            return False
+        try:
+            index = len(self._labels)
+            self._write(f'moves_{index}', toolpath.moves)
+            self._write(f'offsets_{index}', toolpath.offsets)
+            self._labels.append(toolpath.label)
+        except Exception as e:
+            logger.error(f"Error guardando caché de toolpaths: {e}")
+            self.discard()
+            return False
+
+        if self._chunks is not None:
+            self._chunks.append(toolpath)
+            if self.size > self.cache.MAX_MEMORY_ENTRY_BYTES:
+                self._chunks = None
+        return True
+
+    def _write(self, name, array):
+        # Igual que np.savez: un .npy sin comprimir por array
+        with self._file.open(f'{name}.npy', 'w', force_zip64=True) as f:
+            np.lib.format.write_array(f, np.asanyarray(array), allow_pickle=False)
+
+    def commit(self, stats):
+        """Cerrar la entrada; devuelve sus toolpaths (lista o CachedToolpaths) o None"""
+        if self._file is None:
+            return None
+        try:
+            meta = {'labels': self._labels, 'stats': stats}
+            self._write('meta', np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8))
+            self._file.close()
+            self._file = None
+
+            # Renombrar al final para no dejar entradas a medias
+            path = self.cache._path(self.key)
+            os.replace(self._temp_path, path)
+            if self._chunks is not None:
+                self.cache._remember(self.key, {'toolpaths': self._chunks, 'stats': stats})
+                toolpaths = self._chunks
+            else:
+                toolpaths = CachedToolpaths(path)  # Abierto antes de recortar el directorio
+            self.cache._trim_disk()
+            return toolpaths
+        except Exception as e:
+            logger.error(f"Error guardando caché de toolpaths: {e}")
+            self.discard()
+            return None
+
+    def discard(self):
+        """Abandonar la entrada y borrar lo escrito"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._chunks = None
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+
+class ToolpathCache:
+    """Caché de geometría de toolpaths con nivel en memoria (LRU) y en disco
+
+    Cada entrada es un diccionario con 'toolpaths' (Toolpath sin posición ni
+    velocidades) y 'stats' (estadísticas que dependen solo de la geometría).
+    En disco cada entrada es un .npz que se escribe mientras se genera
+    (EntryWriter); al superar el tamaño máximo se borran las usadas hace más
+    tiempo. En memoria solo se guardan las entradas pequeñas: las grandes se
+    leen del disco toolpath a toolpath (CachedToolpaths), así la caché no
+    sube el pico de memoria de una generación por franjas.
+    """
+    _instance = None
+    _cache_dir = default_cache_dir()
+
+    MAX_MEMORY_BYTES = 32 * 1024 * 1024
+    MAX_MEMORY_ENTRY_BYTES = 4 * 1024 * 1024  # Entradas más grandes solo en disco
+    MAX_DISK_BYTES = 1024 * 1024 * 1024
+    MAX_ENTRY_BYTES = 128 * 1024 * 1024  # Entradas más grandes no se guardan
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ToolpathCache, cls).__new__(cls)
+            cls._instance._memory = OrderedDict()
+            cls._instance._memory_bytes = 0
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    def get(self, key):
+        """Buscar una entrada, primero en memoria y después en disco
+
+        Las entradas grandes leídas del disco traen un CachedToolpaths que
+        hay que cerrar.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                logger.debug(f"Caché en memoria: {key}")
+                return entry
+
+        entry = self._load(key)
+        if entry is not None:
+            logger.debug(f"Caché en disco: {key}")
+        return entry
+
+    def writer(self, key, limit=MAX_ENTRY_BYTES):
+        """EntryWriter para guardar una entrada a medida que se genera (limit None: sin límite)"""
+        return EntryWriter(self, key, limit)
+
+    def put(self, key, entry):
+        """Guardar una entrada completa en ambos niveles"""
+        writer = self.writer(key)
+        for toolpath in entry['toolpaths']:
+            if not writer.add(toolpath):
+                return
+        toolpaths = writer.commit(entry['stats'])
+        if isinstance(toolpaths, CachedToolpaths):
+            toolpaths.close()
+
+    def clear(self):
+        """Vaciar la caché en memoria y en disco"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if os.path.isdir(self._cache_dir):
+            for name in os.listdir(self._cache_dir):
+                if name.endswith('.npz'):
+                    os.remove(os.path.join(self._cache_dir, name))
+
+    def _entry_bytes(self, entry):
+        return sum(t.moves.nbytes + t.offsets.nbytes for t in entry['toolpaths'])
+
+    def _remember(self, key, entry):
+        """Añadir al nivel en memoria expulsando las entradas menos usadas"""
+        size = self._entry_bytes(entry)
+        if size > self.MAX_MEMORY_ENTRY_BYTES:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= self._entry_bytes(self._memory.pop(key))
+            self._memory[key] = entry
+            self._memory_bytes += size
+            while self._memory_bytes > self.MAX_MEMORY_BYTES and len(self._memory) > 1:
+                _, old = self._memory.popitem(last=False)
+                self._memory_bytes -= self._entry_bytes(old)
+
+    def _path(self, key):
+        return os.path.join(self._cache_dir, f"{key}.npz")
+
+    def _load(self, key):
+        """Leer una entrada de disco, o None si no existe o está dañada"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            toolpaths = CachedToolpaths(path)
+            stats = toolpaths.stats
+
+            # Las entradas pequeñas se leen enteras y pasan al nivel en memoria
+            if os.path.getsize(path) <= self.MAX_MEMORY_ENTRY_BYTES:
+                cached = toolpaths
+                toolpaths = [cached[i] for i in range(len(cached))]
+                cached.close()
+                self._remember(key, {'toolpaths': toolpaths, 'stats': stats})
+
+            # Marcar como usada para la expulsión por antigüedad
+            os.utime(path)
+            return {'toolpaths': toolpaths, 'stats': stats}
+        except Exception as e:
+            logger.warning(f"Entrada de caché ilegible, se descarta: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _trim_disk(self):
+        """Borrar las entradas usadas hace más tiempo hasta caber en MAX_DISK_BYTES"""
+        entries = []
+        for name in os.listdir(self._cache_dir):
+            if name.endswith('.npz'):
+                path = os.path.join(self._cache_dir, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.MAX_DISK_BYTES:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # En uso (Windows no borra archivos abiertos)
+            total -= size
+            logger.debug(f"Caché en disco recortada: {os.path.basename(path)}")
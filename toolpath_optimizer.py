@@ -0,0 +1,222 @@
+import logging
+import math
+import time
+import numpy as np
+
+logger = logging.getLogger('ToolpathOptimizer')
+
+class ToolpathOptimizer:
+    def __init__(self, two_opt=True, time_budget=2.0):
+        self.two_opt = two_opt              # Activar pasada de mejora 2-opt
+        self.time_budget = time_budget      # Segundos máximos para 2-opt
+
+    def order_contours(self, contours, origin=(0.0, 0.0)):
+        """Ordenar contornos cerrados para minimizar los movimientos rápidos
+
+        Recibe una lista de arrays Nx2 en mm y devuelve un diccionario con el
+        orden de los contornos, el vértice de entrada de cada uno y la distancia
+        rápida antes y después de optimizar.
+        """
+        t0 = time.monotonic()
+        origin = np.asarray(origin, dtype=np.float64)
+
+        result = {
+            'order': list(range(len(contours))),
+            'entries': [0] * len(contours),
+            'rapid_before': 0.0,
+            'rapid_after': 0.0
+        }
+        if not contours:
+            return result
+
+        # Distancia en el orden original, entrando por el primer vértice
+        firsts = np.array([c[0] for c in contours], dtype=np.float64)
+        result['rapid_before'] = self._path_length(origin, firsts)
+
+        order, entries = self._nearest_neighbour(contours, origin)
+
+        if self.two_opt and len(order) > 2:
+            points = np.array([contours[i][e] for i, e in zip(order, entries)], dtype=np.float64)
+            permutation = self._two_opt(origin, points, t0 + self.time_budget)
+            order = [order[k] for k in permutation]
+            entries = [entries[k] for k in permutation]
+
+        entry_points = np.array([contours[i][e] for i, e in zip(order, entries)], dtype=np.float64)
+        result['order'] = order
+        result['entries'] = entries
+        result['rapid_after'] = self._path_length(origin, entry_points)
+
+        logger.debug(f"Orden de contornos: {result['rapid_before']:.1f} mm -> "
+                     f"{result['rapid_after']:.1f} mm en {time.monotonic() - t0:.2f} s")
+        return result
+
+    def simplify_contours(self, contours, tolerance):
+        """Simplificar contornos con Douglas-Peucker, procesando todos a la vez
+
+        Cada nivel de la recursión se resuelve con una sola pasada vectorizada
+        sobre todos los tramos pendientes de todos los contornos. Se conservan
+        siempre el primer y el último vértice de cada contorno.
+        """
+        if not contours or tolerance <= 0:
+            return contours
+
+        lengths = np.array([len(c) for c in contours])
+        points = np.concatenate([np.asarray(c, dtype=np.float64) for c in contours])
+        firsts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        lasts = firsts + lengths - 1
+
+        keep = np.zeros(len(points), dtype=bool)
+        keep[firsts] = True
+        keep[lasts] = True
+
+        # Tramos (inicio, fin) con vértices intermedios por evaluar
+        starts, ends = firsts, lasts
+        while True:
+            pending = ends - starts > 1
+            starts, ends = starts[pending], ends[pending]
+            if len(starts) == 0:
+                break
+
+            # Índices de todos los vértices intermedios de todos los tramos
+            counts = ends - starts - 1
+            group_offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            segment = np.repeat(np.arange(len(starts)), counts)
+            inner = starts[segment] + 1 + np.arange(counts.sum()) - group_offsets[segment]
+
+            # Distancia de cada vértice al segmento que une los extremos del tramo
+            a = points[starts[segment]]
+            ab = points[ends[segment]] - a
+            ap = points[inner] - a
+            denom = np.einsum('ij,ij->i', ab, ab)
+            t = np.clip(np.einsum('ij,ij->i', ap, ab) / np.where(denom > 0, denom, 1.0), 0.0, 1.0)
+            dist = np.hypot(*(ap - ab * t[:, None]).T)
+
+            # Vértice más alejado de cada tramo
+            max_dist = np.maximum.reduceat(dist, group_offsets)
+            is_max = dist == max_dist[segment]
+            farthest = np.minimum.reduceat(np.where(is_max, inner, len(points)), group_offsets)
+
+            split = max_dist > tolerance
+            keep[farthest[split]] = True
+            starts, ends = (np.concatenate((starts[split], farthest[split])),
+                            np.concatenate((farthest[split], ends[split])))
+
+        simplified = [points[first:last + 1][keep[first:last + 1]]
+                      for first, last in zip(firsts.tolist(), lasts.tolist())]
+
+        logger.debug(f"Simplificación (tolerancia {tolerance:.4f} mm): "
+                     f"{len(points)} -> {int(keep.sum())} vértices")
+        return simplified
+
+    def _path_length(self, origin, points):
+        """Longitud del recorrido rápido desde el origen pasando por los puntos"""
+        path = np.vstack((origin, points))
+        return float(np.hypot(*np.diff(path, axis=0).T).sum())
+
+    def _nearest_neighbour(self, contours, origin):
+        """Vecino más cercano sobre una rejilla espacial de todos los vértices"""
+        lengths = np.array([len(c) for c in contours])
+        vertices = np.concatenate([np.asarray(c, dtype=np.float64) for c in contours])
+        owners = np.repeat(np.arange(len(contours)), lengths)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+        # Rejilla uniforme con aproximadamente un vértice por celda
+        low = vertices.min(axis=0)
+        extent = max(float((vertices.max(axis=0) - low).max()), 1e-9)
+        cells_per_side = max(1, int(math.sqrt(len(vertices))))
+        cell_size = extent / cells_per_side
+
+        cells = np.minimum(((vertices - low) / cell_size).astype(np.int64), cells_per_side - 1)
+        keys = cells[:, 1] * cells_per_side + cells[:, 0]
+        sorted_idx = np.argsort(keys, kind='stable')
+        cell_bounds = np.searchsorted(keys[sorted_idx], np.arange(cells_per_side ** 2 + 1))
+
+        alive = np.ones(len(contours), dtype=bool)
+        remaining = len(contours)
+        position = origin
+        order = []
+        entries = []
+
+        while remaining:
+            candidate = self._grid_nearest(position, vertices, owners, alive, low,
+                                           cell_size, cells_per_side, sorted_idx, cell_bounds)
+            contour = int(owners[candidate])
+            order.append(contour)
+            entries.append(int(candidate - offsets[contour]))
+            alive[contour] = False
+            remaining -= 1
+            position = vertices[candidate]
+
+        return order, entries
+
+    def _grid_nearest(self, point, vertices, owners, alive, low, cell_size,
+                      cells_per_side, sorted_idx, cell_bounds):
+        """Buscar el vértice vivo más cercano recorriendo anillos de celdas"""
+        cx, cy = np.clip(((point - low) / cell_size).astype(np.int64), 0, cells_per_side - 1)
+        best_index = -1
+        best_dist = math.inf
+
+        for ring in range(cells_per_side + 1):
+            # Si el anillo es grande sale más barato recorrer todos los vértices
+            if ring * 8 > 256:
+                candidates = np.flatnonzero(alive[owners])
+                dists = np.hypot(*(vertices[candidates] - point).T)
+                return int(candidates[np.argmin(dists)])
+
+            x0, x1 = max(cx - ring, 0), min(cx + ring, cells_per_side - 1)
+            y0, y1 = max(cy - ring, 0), min(cy + ring, cells_per_side - 1)
+            ring_cells = []
+            for y in range(y0, y1 + 1):
+                if y in (cy - ring, cy + ring):
+                    ring_cells.extend(range(y * cells_per_side + x0, y * cells_per_side + x1 + 1))
+                else:
+                    for x in (cx - ring, cx + ring):
+                        if x0 <= x <= x1:
+                            ring_cells.append(y * cells_per_side + x)
+
+            if ring_cells:
+                candidates = np.concatenate([sorted_idx[cell_bounds[c]:cell_bounds[c + 1]]
+                                             for c in ring_cells])
+                candidates = candidates[alive[owners[candidates]]]
+                if len(candidates):
+                    dists = np.hypot(*(vertices[candidates] - point).T)
+                    k = int(np.argmin(dists))
+                    if dists[k] < best_dist:
+                        best_dist = float(dists[k])
+                        best_index = int(candidates[k])
+
+            # Ningún vértice fuera de este anillo puede estar más cerca
+            if best_index >= 0 and best_dist <= ring * cell_size:
+                break
+
+        return best_index
+
+    def _two_opt(self, origin, points, deadline):
+        """Mejora 2-opt del recorrido abierto con inicio fijo, limitada en tiempo"""
+        path = np.vstack((origin, points))
+        permutation = np.arange(len(points))
+        n = len(path)
+        improved = True
+
+        while improved and time.monotonic() < deadline:
+            improved = False
+            for i in range(1, n - 1):
+                if time.monotonic() >= deadline:
+                    break
+
+                # Invertir path[i:j+1] para todos los j > i a la vez
+                j = np.arange(i + 1, n)
+                before = np.hypot(*(path[i] - path[i - 1]))
+                removed = before + np.append(np.hypot(*(path[j[:-1] + 1] - path[j[:-1]]).T), 0.0)
+                added = np.hypot(*(path[j] - path[i - 1]).T) + \
+                    np.append(np.hypot(*(path[j[:-1] + 1] - path[i]).T), 0.0)
+                delta = added - removed
+
+                k = int(np.argmin(delta))
+                if delta[k] < -1e-9:
+                    end = j[k]
+                    path[i:end + 1] = path[i:end + 1][::-1]
+                    permutation[i - 1:end] = permutation[i - 1:end][::-1]
+                    improved = True
+
+        return permutation.tolist()